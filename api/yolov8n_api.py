@@ -1,16 +1,139 @@
 # yolov8_api.py
-from fastapi import FastAPI, File, UploadFile
-from ultralytics import YOLO
-from PIL import Image
-import io
+from fastapi import Body, FastAPI, Header, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
+import asyncio
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
 
-model = YOLO("yolov8n.pt")  # or path to your trained model
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from model.admission import API_WORKERS, AdmissionController
+from model.bulk import BULK_MAX_BYTES, BulkRequestError, ndjson_lines, read_files
+from model.engine import ClassificationEngine, ClassifyError, class_ids
+from model.events import DEVICE_HEADER
+from model.ingest import check_content_length, is_raw_image, read_body_chunks, read_chunks, read_stream
+from model.metrics import CONTENT_TYPE, count_request, metrics, render
+from model.registry import admin_allowed, registry, resolve_weights
+
+# Class ids only; the Flask servers answer components and instructions from the same engine
+engine = ClassificationEngine('api', "yolov8n.pt", cache_namespace='api-classes:')  # or path to your trained model
+# Decode and inference run here, never on the event loop
+executor = ThreadPoolExecutor(max_workers=API_WORKERS, thread_name_prefix='classify')
+admission = AdmissionController()
 app = FastAPI()
+metrics.gauge('sortyx_inflight_requests', 'Requests admitted and not yet answered', lambda: admission.stats()['inflight'])
+
+def overloaded():
+    return JSONResponse(content={"error": "Server busy, retry later"}, status_code=503,
+                        headers={"Retry-After": str(admission.retry_after)})
 
 @app.post("/classify/")
-async def predict(file: UploadFile = File(...)):
-    contents = await file.read()
-    image = Image.open(io.BytesIO(contents))
-    results = model(image)
-    output = results[0].boxes.cls.cpu().numpy().tolist()
-    return {"classes": output}
\ No newline at end of file
+async def predict(request: Request):
+    # A multipart "file" field, or the image itself as the body; size limits apply while reading
+    if not admission.try_acquire():
+        count_request('api', 'classify', outcome='overloaded')
+        return overloaded()
+    try:
+        length = request.headers.get('content-length')
+        length = int(length) if length and length.isdigit() else None
+        if is_raw_image(request.headers.get('content-type')):
+            contents = await read_chunks(request.stream(), length)
+            read = lambda: contents
+        else:
+            check_content_length(length, multipart=True)
+            file = (await request.form()).get('file')
+            if file is None or isinstance(file, str):
+                return JSONResponse(content={"error": "No file uploaded"}, status_code=400)
+            # The spooled upload is read on the executor too
+            read = lambda: read_stream(file.file)
+        device = request.headers.get(DEVICE_HEADER)
+        return await asyncio.get_running_loop().run_in_executor(
+            executor, lambda: engine.classify(read(), class_ids, device=device))
+    except ClassifyError as e:
+        return JSONResponse(content={"error": str(e)}, status_code=e.status)
+    finally:
+        admission.release()
+
+@app.post("/classify/bulk")
+async def predict_bulk(request: Request):
+    # Many images per request: multipart "images" files (zip archives allowed), a zip body or NDJSON of base64
+    if not admission.try_acquire():
+        count_request('api', 'classify_bulk', outcome='overloaded')
+        return overloaded()
+    content_type = request.headers.get('content-type', '')
+    length = request.headers.get('content-length')
+    length = int(length) if length and length.isdigit() else None
+    uploads, body = None, b''
+    device = request.headers.get(DEVICE_HEADER)
+    try:
+        # Bodies are read within SORTYX_BULK_MAX_BYTES, each image within the single-upload limit
+        if content_type.startswith('multipart/'):
+            check_content_length(length, BULK_MAX_BYTES, multipart=True)
+            form = await request.form()
+            uploads = [(f.filename, f.file) for f in form.getlist('images') if not isinstance(f, str)]
+        else:
+            body = await read_body_chunks(request.stream(), length, BULK_MAX_BYTES)
+        # Spooled uploads are read and zip archives opened on the executor, not the event loop
+        records = await asyncio.get_running_loop().run_in_executor(
+            executor, lambda: engine.classify_bulk(read_files(uploads) if uploads else [], content_type, body, device))
+    except (BulkRequestError, ClassifyError) as e:
+        admission.release()
+        return JSONResponse(content={'error': str(e)}, status_code=e.status)
+    except BaseException:
+        admission.release()
+        raise
+
+    # The admission slot is held until the response is over: sent, failed or the client gone.
+    # Sync generator: Starlette iterates it on its threadpool, off the event loop
+    return StreamingResponse(ndjson_lines(records), media_type='application/x-ndjson',
+                             background=BackgroundTask(admission.release))
+
+@app.get("/health/live")
+async def health_live():
+    return {"status": "ok"}
+
+@app.get("/health/ready")
+async def health_ready():
+    ready = registry.ready()
+    return JSONResponse(content={"ready": ready, "models": registry.status()}, status_code=200 if ready else 503)
+
+@app.post("/admin/models/{name}")
+async def swap_model(name: str, path: str = Body(..., embed=True), x_admin_token: str = Header(None)):
+    # path names a file in SORTYX_WEIGHTS_DIR; the old weights keep serving until the new ones are loaded and warm
+    if not admin_allowed(x_admin_token):
+        return JSONResponse(content={"error": "Forbidden"}, status_code=403)
+    try:
+        handle = registry.swap(name, resolve_weights(path))
+    except ValueError as e:
+        return JSONResponse(content={"error": str(e)}, status_code=400)
+    except KeyError:
+        return JSONResponse(content={"error": f"Unknown model {name}"}, status_code=404)
+    except RuntimeError as e:
+        return JSONResponse(content={"error": str(e)}, status_code=409)
+    return JSONResponse(content=handle.to_dict(), status_code=202)
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    return Response(content=render(), media_type=CONTENT_TYPE)
+
+@app.get("/stats/results")
+async def result_cache_stats():
+    return engine.result_cache.stats()
+
+@app.get("/stats/admission")
+async def admission_stats():
+    return admission.stats()
+
+@app.get("/stats/batching")
+async def batching_stats():
+    return engine.scheduler.stats()
+
+@app.get("/stats/llm")
+async def llm_stats():
+    return engine.llm.stats()
+
+@app.get("/stats/events")
+async def event_stats(hours: float = 24, device: str = None):
+    # Per-hour category counts and stage latency percentiles from the event log
+    return await asyncio.get_running_loop().run_in_executor(executor, engine.events.summary, hours, device)
\ No newline at end of file
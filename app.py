@@ -1,37 +1,35 @@
-from flask import Flask, request, jsonify,render_template
-from ultralytics import YOLO
-import ollama
+from flask import Flask, request, jsonify
 from flask_cors import CORS
-from PIL import Image
-import io
+from model.engine import ClassificationEngine, ClassifyError, label_instruction
+from model.events import DEVICE_HEADER
+from model.ingest import read_upload
+from model.routes import register_routes
 
 app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": "*"}})  # Apply CORS to the entire app
 
-model = YOLO('yolov8n.pt')  # smallest default model
- 
-@app.route('/')
-def home():
-    return render_template('index.html')
+PROMPT_TEMPLATE = "Give a waste disposal instruction for '{label}'"
+# Answers one label and its instruction per image, unlike the component servers
+engine = ClassificationEngine('app', 'yolov8n.pt', llm_model='llama3.2', template=PROMPT_TEMPLATE,  # smallest default model
+                              cache_namespace='app-classify:')
+register_routes(app, engine)
+
+@app.cli.command('warm-instructions')
+def warm_instructions():
+    """Generate and cache the disposal instruction for every model label."""
+    labels = engine.warm_instructions(extra_labels=())
+    print(f"Warmed {len(labels)} labels: {engine.instructions.stats()}")
 
 @app.route('/classify', methods=['POST'])
 def classify_image():
-    if 'image' not in request.files:
-        return jsonify({'error': 'No image uploaded'}), 400
-
-    image = Image.open(request.files['image'].stream)
-    results = model(image)
-
-    label = results[0].names[int(results[0].boxes.cls[0])] if results[0].boxes else "Unknown"
-    
-  
-    prompt = f"Give a waste disposal instruction for '{label}'"
-    response = ollama.chat(model='llama3.2', messages=[{'role': 'user', 'content': prompt}])
-
-    return jsonify({
-        'label': label,
-        'instruction': response['message']['content']
-    })
+    # A multipart "image" file, or the image itself as the body; size limits apply while reading
+    try:
+        data = read_upload(request, 'image')
+        if data is None:
+            return jsonify({'error': 'No image uploaded'}), 400
+        return jsonify(engine.classify(data, label_instruction, device=request.headers.get(DEVICE_HEADER)))
+    except ClassifyError as e:
+        return jsonify({'error': str(e)}), e.status
 
 if __name__ == '__main__':
     app.run(debug=True, port=5001, host='0.0.0.0')
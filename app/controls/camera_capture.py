@@ -1,10 +1,150 @@
+import argparse
+import os
+import sys
 import cv2
-import requests
 import time
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from model.capture import CapturePipeline, EVERY_NTH, LATEST_ONLY
+from model.categories import category_index
+from model.events import open_store
+from model.gating import ChangeGate
+from model.metrics import collect_stages, count_request, serve_metrics
+from model.preprocess import INPUT_SIZE, Preprocessor, fit
+from model.timing import StageTimer
+from model.upload_client import UploadClient
+
 # URL of the Flask app's prediction endpoint
 FLASK_URL = "http://127.0.0.1:5000/classify"
 
+parser = argparse.ArgumentParser(description='Capture camera frames and classify them.')
+parser.add_argument('--local', action='store_true',
+                    help='run YOLO in this process on raw frames instead of posting JPEGs to the Flask app')
+parser.add_argument('--weights', default='yolov8n.pt', help='YOLO weights for --local mode')
+parser.add_argument('--interval', type=float, default=None,
+                    help='seconds to wait between frames (default: 2 for the Flask app, 0 for --local)')
+parser.add_argument('--save', action='store_true', help='in --local mode, also write the annotated frame to disk')
+parser.add_argument('--threaded', action='store_true',
+                    help='capture and classify on separate threads, dropping frames the classifier cannot keep up with')
+parser.add_argument('--drop-policy', choices=[LATEST_ONLY, EVERY_NTH], default=LATEST_ONLY,
+                    help='which frames reach the classifier in --threaded mode')
+parser.add_argument('--every-n', type=int, default=5, help='forward every Nth frame with --drop-policy every_nth')
+parser.add_argument('--gate', choices=['off', 'diff', 'hash', 'both'], default='off',
+                    help='in --local or --threaded mode, only classify when the scene changed and reuse the last result otherwise')
+parser.add_argument('--inflight', type=int, default=2,
+                    help='uploads kept in flight at once in --threaded mode without --local')
+parser.add_argument('--report-every', type=int, default=30, help='print fps and stage latency every N frames')
+args = parser.parse_args()
+interval = args.interval if args.interval is not None else (0 if args.local else 2)
+
+# Stage timings also go to /metrics on SORTYX_METRICS_PORT when it is set
+timer = StageTimer(service='controls')
+serve_metrics()
+# Keep-alive connection with timeouts, retries and a circuit breaker, so a hung server never freezes the loop
+client = UploadClient(FLASK_URL, max_inflight=args.inflight)
+gate = ChangeGate(method=args.gate) if args.gate != 'off' else None
+if args.local:
+    from ultralytics import YOLO
+    model = YOLO(args.weights)
+    preprocessor = Preprocessor(max_batch=1)
+    # Uploads are logged by the server; local classifications go to this device's own event log
+    events = open_store()
+
+
+def gated(detect_fn):
+    # Only classify frames that differ from the last classified one; reuse that result otherwise
+    if gate is None:
+        return detect_fn
+    return lambda frame: gate.classify(frame, detect_fn)
+
+
+def logged(detect_fn):
+    # Appends every classification (not the reused gated ones) to the event log with its stage times
+    def detect(frame):
+        with collect_stages() as stages:
+            label, confidence, box = detect_fn(frame)
+        category = category_index.lookup(label) if label else None
+        events.record('controls', 'frame', label, category['id'] if category else '', confidence,
+                      stages=stages)
+        return label, confidence, box
+    return detect
+
+
+def detect_local(frame):
+    # The raw BGR frame is letterboxed, flipped to RGB and scaled in one pass into a reused
+    # tensor; boxes come back in frame coordinates. No disk or JPEG round-trip.
+    result = preprocessor.predict(model, [frame])[0]
+    for stage in ('preprocess', 'inference', 'postprocess'):
+        timer.record(stage, result.speed[stage])
+    if not result.boxes:
+        return None, 0, None
+    label = result.names[int(result.boxes.cls[0])]
+    confidence = int(float(result.boxes.conf[0]) * 100)
+    box = tuple(int(v) for v in result.boxes.xyxy[0].tolist())
+    return label, confidence, box
+
+
+def detect_http(frame):
+    # Same request the sequential loop below makes, returning the label the server picked.
+    # Scaled to the server's input size with the aspect ratio kept, so the server does not resize.
+    frame = fit(frame, INPUT_SIZE)
+    with timer.stage('encode'):
+        _, buffer = cv2.imencode('.jpg', frame)
+    with timer.stage('request'):
+        data = client.post_image(buffer.tobytes())
+    return data.get('objectName'), data.get('confidence', 0), None
+
+
+def draw_detection(frame, detected_object, confidence, box):
+    with timer.stage('draw'):
+        if box:
+            cv2.rectangle(frame, box[:2], box[2:], (0, 255, 0), 2)
+        origin = (box[0], max(box[1] - 10, 20)) if box else (50, 40)
+        cv2.putText(frame, f"{detected_object} {confidence}%", origin, cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2)
+
+
+def run_threaded():
+    # The capture thread keeps only the newest frame; the classifier thread never blocks
+    # the camera, and this (main) thread only draws whatever result came back last.
+    latest = {}
+
+    def read_frame():
+        ret, frame = camera.read()
+        return frame if ret else None
+
+    def on_result(result, frame, info):
+        count_request('controls', 'frame', result[0] or 'none')
+        latest['item'] = (result, frame, info)
+
+    def on_error(error):
+        print("Error classifying frame:", error)
+
+    detect_fn = gated(logged(detect_local) if args.local else detect_http)
+    pipeline = CapturePipeline(read_frame, detect_fn, on_result, on_error,
+                               policy=args.drop_policy, every_n=args.every_n,
+                               capture_interval=args.interval or 0,
+                               workers=1 if args.local else args.inflight, name='controls').start()
+    frame_count = 0
+    while True:
+        item = latest.pop('item', None)
+        if item:
+            (detected_object, confidence, box), frame, info = item
+            if detected_object:
+                draw_detection(frame, detected_object, confidence, box)
+            cv2.imshow("Detected Object", frame)
+            timer.tick()
+            frame_count += 1
+            if frame_count % args.report_every == 0:
+                stats = pipeline.stats()
+                print(f"Detected: {detected_object} ({confidence}%) | {timer.report()} | "
+                      f"dropped {stats['dropped']}/{stats['captured']} | "
+                      f"end-to-end p50 {stats['latency_ms']['p50']:.0f}ms p99 {stats['latency_ms']['p99']:.0f}ms"
+                      + (f" | gate {gate.stats()}" if gate else ""))
+        if cv2.waitKey(1) & 0xFF == ord('q'):
+            break
+    pipeline.stop()
+
+
 # Try multiple camera indices if the default one fails
 for index in range(3):
     camera = cv2.VideoCapture(index)
@@ -17,12 +157,42 @@ else:
 
 print("Press 'q' to quit.")
 
+if args.threaded:
+    run_threaded()
+    client.close()
+    camera.release()
+    cv2.destroyAllWindows()
+    exit()
+
+detect_frame = gated(logged(detect_local))
+frame_count = 0
 while True:
-    ret, frame = camera.read()
+    with timer.stage('capture'):
+        ret, frame = camera.read()
     if not ret:
         print("Error: Failed to capture image.")
         break
 
+    if args.local:
+        detected_object, confidence, box = detect_frame(frame)
+        count_request('controls', 'frame', detected_object or 'none')
+        if detected_object:
+            draw_detection(frame, detected_object, confidence, box)
+        cv2.imshow("Detected Object", frame)
+        if args.save:
+            with timer.stage('save'):
+                cv2.imwrite("./runs/detect/predict/detected_frame.jpg", frame)
+        timer.tick()
+        frame_count += 1
+        if frame_count % args.report_every == 0:
+            print(f"Detected: {detected_object} ({confidence}%) | {timer.report()}"
+                  + (f" | gate {gate.stats()}" if gate else ""))
+        if interval:
+            time.sleep(interval)
+        if cv2.waitKey(1) & 0xFF == ord('q'):
+            break
+        continue
+
     # Display the captured frame
     cv2.imshow("Camera", frame)
 
@@ -56,32 +226,31 @@ while True:
     # Save the frame to a file (optional)
     cv2.imwrite("./runs/detect/predict/detected_frame.jpg", frame)
     # Convert the frame to a format suitable for sending to the Flask app
-    # Resize the frame to a smaller size for faster processing
-    frame = cv2.resize(frame, (640, 480))  # Resize to 640x480 for example
-    # Encode the frame as JPEG
-    frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)  # Convert to RGB if needed
+    # Scale it to the server's input size (aspect ratio kept) so the server does not resize;
+    # imencode takes BGR frames as they are
+    frame = fit(frame, INPUT_SIZE)
 
     # Convert the frame to a binary stream
-    _, buffer = cv2.imencode('.jpg', frame)
-    files = {'image': ('image.jpg', buffer.tobytes(), 'image/jpeg')}
+    with timer.stage('encode'):
+        _, buffer = cv2.imencode('.jpg', frame)
 
     # Send the image to the Flask app for prediction
     try:
-        response = requests.post(FLASK_URL, files=files)
-        if response.status_code == 200:
-            print("Prediction:", response.json())
-        else:
-            print("Error from server:", response.json())
+        with timer.stage('request'):
+            print("Prediction:", client.post_image(buffer.tobytes()))
     except Exception as e:
         print("Error sending image to server:", e)
+    timer.tick()
+    print(timer.report())
 
     # Wait for a short period before capturing the next frame
-    time.sleep(2)
+    time.sleep(interval)
 
     # Exit on pressing 'q'
     if cv2.waitKey(1) & 0xFF == ord('q'):
         break
 
 # Release the camera and close all OpenCV windows
+client.close()
 camera.release()
-cv2.destroyAllWindows()
\ No newline at end of file
+cv2.destroyAllWindows()
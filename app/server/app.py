@@ -64,97 +64,31 @@
 #     app.run(debug=True, host='0.0.0.0', port=5000) 
 
 
-from flask import Flask, request, jsonify,render_template
-from ultralytics import YOLO
-import ollama
+from flask import Flask
 from flask_cors import CORS
-from PIL import Image
-import io
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from model.detector import MODEL_PATH
+from model.engine import ClassificationEngine, validate_known_label
+from model.instructions import COMPONENTS_TEMPLATE
+from model.routes import register_component_routes, register_routes
 
 app = Flask(__name__)
 CORS(app)
 
-model = YOLO('./model/yolov8n.pt')  # smallest default model
- 
-@app.route('/')
-def home():
-    return render_template('index.html')
-
-@app.route('/classify', methods=['POST'])
-def classify_image():
-    if 'image' not in request.files:
-        return jsonify({'error': 'No image uploaded'}), 400
-
-    image = Image.open(request.files['image'].stream)
-    # Convert the image to RGB if it's not already
-    if image.mode != 'RGB':
-        image = image.convert('RGB')
-    # Resize the image to the model's expected input size
-    image = image.resize((640, 640))
-    # Convert the image to a format suitable for the model
-    image = image.convert('RGB')
-    results = model(image)
-
-    label = results[0].names[int(results[0].boxes.cls[0])] if results[0].boxes else "Unknown"
-    confidence = results[0].boxes.conf[0] if results[0].boxes else 0.0
-    confidence = int(confidence * 100)
-    confidence = min(max(confidence, 0), 100)
-    print(f"Detected: {label} with confidence: {confidence}%")
-    # Check if the label is empty or None
-    if not label:
-        return jsonify({'error': 'No label detected'}), 400
-    # Check if the confidence is within a valid range
-    if confidence < 0 or confidence > 100:
-        return jsonify({'error': 'Invalid confidence level'}), 400
-    # Check if the label is a string
-    if not isinstance(label, str):
-        return jsonify({'error': 'Invalid label type'}), 400
-    # Check if the label is too long
-    if len(label) > 50:
-        return jsonify({'error': 'Label too long'}), 400
-    # Check if the label contains invalid characters
-    if not all(c.isalnum() or c.isspace() for c in label):
-        return jsonify({'error': 'Label contains invalid characters'}), 400
-    # Check if the label is a known category
-    known_categories = ['plastic', 'paper', 'metal', 'glass', 'organic','horse','person']
-    if label.lower() not in known_categories:
-        return jsonify({'error': 'Unknown category'}), 400
-    
-
-    # Use the label to get a waste disposal instruction
-    prompt = f"Give a waste disposal instruction and category for '{label}'. Also say confidence level (0-100%)"
-    response = ollama.chat(model='llama3.2:latest', messages=[{'role': 'user', 'content': prompt}])
-    content = response['message']['content']
-
-    # Try to extract fake components to mimic your original structure
-    import re
-    confidence_match = re.search(r'confidence.*?(\d+)', content, re.IGNORECASE)
-    confidence = int(confidence_match.group(1)) if confidence_match else 80
-
-    fake_component = {
-        "name": label,
-        "classification": {
-            "id": label.lower().replace(" ", "_"),
-            "name": label,
-            "description": "AI generated category",
-            "icon": "🔍",
-            "color": "bg-gray-500",
-            "gradient": "from-gray-400 to-gray-600"
-        },
-        "reason": content
-    }
-
-    return jsonify({
-        'success': True,
-        'objectName': label,
-        'classification': fake_component['classification'],
-        'components': [fake_component],
-        'confidence': confidence
-    })
-    #return jsonify({
-     #   'label': label,
-#        'instruction': response['message']['content']
- #   })*/
+# ./model/yolov8n.pt unless SORTYX_MODEL is set; only labels in KNOWN_CATEGORIES are answered.
+engine = ClassificationEngine('server', MODEL_PATH, llm_model='llama3.2:latest',
+                              cache_namespace='server-classify:', validate=validate_known_label)
+register_routes(app, engine)
+register_component_routes(app, engine)
+
+@app.cli.command('warm-instructions')
+def warm_instructions():
+    """Generate and cache the disposal instruction for every known label."""
+    labels = engine.warm_instructions(template=COMPONENTS_TEMPLATE)
+    print(f"Warmed {len(labels)} labels: {engine.instructions.stats()}")
 
 if __name__ == '__main__':
     app.run(debug=True)
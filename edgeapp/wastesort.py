@@ -1,14 +1,27 @@
+import os
 import sys
 from PyQt5.QtWidgets import QApplication, QMainWindow, QLabel, QVBoxLayout, QWidget
 from PyQt5.QtGui import QImage, QPixmap, QFont
-from PyQt5.QtCore import QTimer, Qt
+from PyQt5.QtCore import Qt, pyqtSignal
 import cv2
-from ultralytics import YOLO
-import numpy as np
 from picamera2 import Picamera2
 import picamera2.array
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from model.capture import CapturePipeline
+from model.categories import category_index
+from model.metrics import count_request, serve_metrics, stage
+from model.preprocess import CROP, Preprocessor
+from model.registry import registry
+from model.sensors import ARRIVAL, SensorMonitor, open_source
+
 class MainWindow(QMainWindow):
+    # Emitted from the inference thread; Qt delivers it on the GUI thread
+    classification_ready = pyqtSignal(str, object, dict)
+    classification_failed = pyqtSignal(str)
+    # Latest sensor readings, emitted from the sensor thread
+    sensor_updated = pyqtSignal(dict)
+
     def __init__(self):
         super().__init__()
         self.setWindowTitle("SORTYX Waste Classifier")
@@ -20,8 +33,10 @@ class MainWindow(QMainWindow):
         self.camera.resolution = (640, 480)
         self.stream = picamera2.array.PiRGBArray(self.camera)
 
-        # Load YOLOv8n classification model
-        self.model = YOLO('yolov8n-cls.pt')  # Replace with actual model path
+        # Load YOLOv8n classification model in the background so the window opens right away
+        registry.register('classifier', 'yolov8n-cls.pt', imgsz=224)
+        # Camera frame -> 224x224 classifier tensor: centre crop and one resize, no BGR->RGB copy
+        self.preprocessor = Preprocessor(224, CROP, max_batch=1)
 
         # Set up UI
         self.central_widget = QWidget()
@@ -57,78 +72,82 @@ class MainWindow(QMainWindow):
         self.sensor_label.setAlignment(Qt.AlignCenter)
         self.layout.addWidget(self.sensor_label)
 
-        # Timer for updating sensor data
-        self.sensor_timer = QTimer()
-        self.sensor_timer.timeout.connect(self.update_sensor_data)
-        self.sensor_timer.start(500)  # Update every 500 ms
-
-        # Timer for checking object proximity
-        self.proximity_timer = QTimer()
-        self.proximity_timer.timeout.connect(self.check_proximity_and_capture)
-        self.proximity_timer.start(1000)  # Check every 1000 ms
-
-    def update_sensor_data(self):
-        # Simulate receiving multiple sensor data (replace with actual sensor logic)
-        sensor_values = {
-            "Temperature": np.random.randint(20, 30),
-            "Humidity": np.random.randint(40, 60),
-            "Proximity": np.random.randint(0, 100)
-        }
-
-        # Update sensor data in the UI
-        sensor_text = "\n".join([f"{key}: {value}" for key, value in sensor_values.items()])
+        # Capture and inference run on their own threads so a slow frame never freezes the UI.
+        self.classification_ready.connect(self.show_classification)
+        self.classification_failed.connect(lambda message: self.result_label.setText(f"Error: {message}"))
+        self.pipeline = CapturePipeline(self.read_frame, self.run_model, self.classification_ready.emit,
+                                        lambda e: self.classification_failed.emit(str(e)), triggered=True, name='edge')
+        self.pipeline.start()
+        # One capture per item arrival (see SensorMonitor)
+        self.sensor_updated.connect(self.update_sensor_data)
+        self.sensors = SensorMonitor(open_source(), self.on_sensor_event, self.sensor_updated.emit).start()
+        # Prometheus /metrics on SORTYX_METRICS_PORT when it is set
+        serve_metrics()
+
+    def update_sensor_data(self, values):
+        # Runs on the GUI thread, at most twice a second
+        sensor_text = "\n".join([f"{key.capitalize()}: {value}" for key, value in values.items()])
         self.sensor_label.setText(f"Sensor Data:\n{sensor_text}")
 
-    def check_proximity_and_capture(self):
-        # Simulate proximity sensor logic (replace with actual proximity sensor logic)
-        proximity_value = np.random.randint(0, 100)
-        if proximity_value < 20:  # Trigger capture if object is close
+    def on_sensor_event(self, event, values):
+        # Runs on the sensor thread
+        if event == ARRIVAL:
             self.capture_and_classify()
 
     def capture_and_classify(self):
-        try:
-            # Capture frame
-            self.stream.seek(0)
-            self.stream.truncate()
-            self.camera.capture(self.stream, format='bgr', use_video_port=True)
-            frame = self.stream.array
-
-            # Convert to RGB and resize for inference
-            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            small_frame = cv2.resize(rgb_frame, (224, 224))
-
-            # Run YOLOv8 classification
-            results = self.model(small_frame)
-            pred = results[0].probs.top1
-            class_name = results[0].names[pred]
-
-            # Update classification result
+        self.pipeline.trigger()
+
+    def read_frame(self):
+        # Runs on the capture thread
+        self.stream.seek(0)
+        self.stream.truncate()
+        self.camera.capture(self.stream, format='bgr', use_video_port=True)
+        return self.stream.array
+
+    def run_model(self, frame):
+        # Runs on the inference thread
+        with stage('edge', 'inference'):
+            results = self.preprocessor.predict(registry.get('classifier'), [frame])
+        pred = results[0].probs.top1
+        return results[0].names[pred]
+
+    def show_classification(self, class_name, frame, info):
+        count_request('edge', 'classify', class_name)
+        # Update classification result; the bin comes from the shared category index
+        category = category_index.lookup(class_name)
+        if category is not None and category['id'] != 'unknown':
+            self.result_label.setText(f"Classification: {class_name} ({category['name']})")
+        else:
             self.result_label.setText(f"Classification: {class_name}")
-            if class_name.lower() == "recyclable":
-                self.result_label.setStyleSheet("""
-                    color: #ffffff;
-                    background-color: #4CAF50;
-                    padding: 10px;
-                    border-radius: 5px;
-                """)
-            else:
-                self.result_label.setStyleSheet("""
-                    color: #ffffff;
-                    background-color: #F44336;
-                    padding: 10px;
-                    border-radius: 5px;
-                """)
-
-            # Display frame
-            h, w, ch = rgb_frame.shape
-            bytes_per_line = ch * w
-            qimg = QImage(rgb_frame.data, w, h, bytes_per_line, QImage.Format_RGB888)
-            self.image_label.setPixmap(QPixmap.fromImage(qimg).scaled(640, 480, Qt.KeepAspectRatio))
-
-        except Exception as e:
-            self.result_label.setText(f"Error: {str(e)}")
+        if category is not None and category['id'] == 'recyclable':
+            self.result_label.setStyleSheet("""
+                color: #ffffff;
+                background-color: #4CAF50;
+                padding: 10px;
+                border-radius: 5px;
+            """)
+        else:
+            self.result_label.setStyleSheet("""
+                color: #ffffff;
+                background-color: #F44336;
+                padding: 10px;
+                border-radius: 5px;
+            """)
+
+        # Display frame
+        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        h, w, ch = rgb_frame.shape
+        bytes_per_line = ch * w
+        qimg = QImage(rgb_frame.data, w, h, bytes_per_line, QImage.Format_RGB888)
+        self.image_label.setPixmap(QPixmap.fromImage(qimg).scaled(640, 480, Qt.KeepAspectRatio))
+
+        stats = self.pipeline.stats()
+        print(f"Classified {class_name} in {info['latency_ms']:.0f}ms "
+              f"(dropped {stats['dropped']}, p99 {stats['latency_ms']['p99']:.0f}ms)")
 
     def closeEvent(self, event):
+        self.sensors.stop()
+        self.pipeline.stop()
         self.camera.close()
         event.accept()
 
@@ -1,20 +1,61 @@
+import os
 import sys
+import threading
+import time
 from PyQt5.QtWidgets import QApplication, QMainWindow, QLabel, QVBoxLayout, QWidget
 from PyQt5.QtGui import QImage, QPixmap, QFont
-from PyQt5.QtCore import QTimer, Qt
+from PyQt5.QtCore import Qt, pyqtSignal
 import cv2
-import numpy as np
 from picamera2 import Picamera2
 import picamera2.array
-import requests
+import httpx
 from fastapi import FastAPI, File, UploadFile
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import JSONResponse
 from io import BytesIO
-from PIL import Image
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from model.capture import CapturePipeline
+from model.categories import category_index
+from model.ingest import ClassifyError, decode_image, read_stream
+from model.metrics import count_request, serve_metrics, stage
+from model.preprocess import CROP, INPUT_SIZE, Preprocessor, fit
+from model.registry import registry
+from model.sensors import ARRIVAL, SensorMonitor, open_source
+from model.spool import Spool, SpoolFlusher
+from model.upload_client import UploadClient, UploadError
+
+# Cloud model endpoint the FastAPI proxy forwards to
+CLOUD_MODEL_URL = os.environ.get('SORTYX_CLOUD_URL', "http://localhost:3001/api/classify")
+# 'hybrid' classifies on-device and asks the cloud only about low-confidence items; 'cloud' sends every item
+EDGE_MODE = os.environ.get('SORTYX_EDGE_MODE', 'hybrid')
+# Local top-1 confidence (0-1) below which an item is escalated to the cloud model
+ESCALATE_CONF = float(os.environ.get('SORTYX_ESCALATE_CONF', 0.6))
+SPOOL_FLUSH_INTERVAL = float(os.environ.get('SORTYX_SPOOL_FLUSH_INTERVAL', 15))
 
 app = FastAPI()
+# One pooled keep-alive client for all proxied requests, instead of a new connection each time
+http_client = None
+
+@app.on_event("startup")
+async def open_http_client():
+    global http_client
+    http_client = httpx.AsyncClient(timeout=httpx.Timeout(10.0, connect=3.0),
+                                    limits=httpx.Limits(max_connections=20, max_keepalive_connections=10))
+
+@app.on_event("shutdown")
+async def close_http_client():
+    await http_client.aclose()
 
 class MainWindow(QMainWindow):
+    # Emitted from the inference thread; Qt delivers it on the GUI thread
+    classification_ready = pyqtSignal(str, object, dict)
+    classification_failed = pyqtSignal(str)
+    # Latest sensor readings, emitted from the sensor thread
+    sensor_updated = pyqtSignal(dict)
+    # Cloud answer for an item that was already sorted with the local label
+    classification_refined = pyqtSignal(str, str)
+
     def __init__(self):
         super().__init__()
         self.setWindowTitle("SORTYX Waste Classifier")
@@ -28,6 +69,17 @@ class MainWindow(QMainWindow):
 
         # Cloud model endpoint
         self.api_url = "http://localhost:3001/api/classify"  # Replace with actual Gemini API endpoint
+        # Pooled keep-alive uploads with timeouts, retries and a circuit breaker
+        self.client = UploadClient(self.api_url)
+        if EDGE_MODE == 'hybrid':
+            registry.register('classifier', 'yolov8n-cls.pt', imgsz=224)
+            # Camera frame -> 224x224 classifier tensor: centre crop and one resize, no BGR->RGB copy
+            self.preprocessor = Preprocessor(224, CROP, max_batch=1)
+        # Escalations that could not reach the cloud wait here and are sent in batches once it is back
+        self.spool = Spool()
+        self.flusher = SpoolFlusher(self.spool, self.send_spooled, interval=SPOOL_FLUSH_INTERVAL).start()
+        self._escalations = 0
+        self._escalation_lock = threading.Lock()
 
         # Set up UI
         self.central_widget = QWidget()
@@ -63,106 +115,185 @@ class MainWindow(QMainWindow):
         self.sensor_label.setAlignment(Qt.AlignCenter)
         self.layout.addWidget(self.sensor_label)
 
-        # Timer for updating sensor data
-        self.sensor_timer = QTimer()
-        self.sensor_timer.timeout.connect(self.update_sensor_data)
-        self.sensor_timer.start(500)  # Update every 500 ms
-
-        # Timer for checking object proximity
-        self.proximity_timer = QTimer()
-        self.proximity_timer.timeout.connect(self.check_proximity_and_capture)
-        self.proximity_timer.start(1000)  # Check every 1000 ms
-
-    def update_sensor_data(self):
-        # Simulate receiving multiple sensor data (replace with actual sensor logic)
-        sensor_values = {
-            "Temperature": np.random.randint(20, 30),
-            "Humidity": np.random.randint(40, 60),
-            "Proximity": np.random.randint(0, 100)
-        }
-
-        # Update sensor data in the UI
-        sensor_text = "\n".join([f"{key}: {value}" for key, value in sensor_values.items()])
+        # Capture and the cloud request run on their own threads so a slow server never freezes the UI.
+        self.classification_ready.connect(self.show_classification)
+        self.classification_failed.connect(lambda message: self.result_label.setText(f"Error: {message}"))
+        self.classification_refined.connect(self.show_refined)
+        self.pipeline = CapturePipeline(self.read_frame, self.request_classification,
+                                        self.classification_ready.emit,
+                                        lambda e: self.classification_failed.emit(str(e)), triggered=True, name='edge')
+        self.pipeline.start()
+        # One capture per item arrival (see SensorMonitor)
+        self.sensor_updated.connect(self.update_sensor_data)
+        self.sensors = SensorMonitor(open_source(), self.on_sensor_event, self.sensor_updated.emit).start()
+        # Prometheus /metrics on SORTYX_METRICS_PORT when it is set
+        serve_metrics()
+
+    def update_sensor_data(self, values):
+        # Runs on the GUI thread, at most twice a second
+        sensor_text = "\n".join([f"{key.capitalize()}: {value}" for key, value in values.items()])
         self.sensor_label.setText(f"Sensor Data:\n{sensor_text}")
 
-    def check_proximity_and_capture(self):
-        # Simulate proximity sensor logic (replace with actual proximity sensor logic)
-        proximity_value = np.random.randint(0, 100)
-        if proximity_value < 20:  # Trigger capture if object is close
+    def on_sensor_event(self, event, values):
+        # Runs on the sensor thread
+        if event == ARRIVAL:
             self.capture_and_classify()
 
     def capture_and_classify(self):
-        try:
-            # Capture frame
-            self.stream.seek(0)
-            self.stream.truncate()
-            self.camera.capture(self.stream, format='bgr', use_video_port=True)
-            frame = self.stream.array
+        self.pipeline.trigger()
 
-            # Convert to RGB and resize for API
-            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            _, buffer = cv2.imencode('.jpg', rgb_frame)
-            image_data = buffer.tobytes()
+    def read_frame(self):
+        # Runs on the capture thread
+        self.stream.seek(0)
+        self.stream.truncate()
+        self.camera.capture(self.stream, format='bgr', use_video_port=True)
+        return self.stream.array
 
+    def request_classification(self, frame):
+        # Runs on the inference thread
+        if EDGE_MODE != 'hybrid':
             # Send image to Gemini API
-            response = requests.post(self.api_url, files={"image": ("image.jpg", image_data, "image/jpeg")})
-            if response.status_code == 200:
-                data = response.json()
-                class_name = data.get("classification", "Unknown")
-
-                # Update classification result
-                self.result_label.setText(f"Classification: {class_name}")
-                if class_name.lower() == "recyclable":
-                    self.result_label.setStyleSheet("""
-                        color: #ffffff;
-                        background-color: #4CAF50;
-                        padding: 10px;
-                        border-radius: 5px;
-                    """)
-                else:
-                    self.result_label.setStyleSheet("""
-                        color: #ffffff;
-                        background-color: #F44336;
-                        padding: 10px;
-                        border-radius: 5px;
-                    """)
-
-                # Display frame
-                h, w, ch = rgb_frame.shape
-                bytes_per_line = ch * w
-                qimg = QImage(rgb_frame.data, w, h, bytes_per_line, QImage.Format_RGB888)
-                self.image_label.setPixmap(QPixmap.fromImage(qimg).scaled(640, 480, Qt.KeepAspectRatio))
-            else:
-                self.result_label.setText(f"Error: {response.status_code} {response.text}")
-
-        except Exception as e:
-            self.result_label.setText(f"Error: {str(e)}")
+            with stage('edge', 'cloud'):
+                data = self.client.post_image(self.encode_frame(frame))
+            return data.get("classification", "Unknown")
+
+        # The bin is driven by the local answer; the cloud is only consulted in the background
+        class_name, confidence = self.run_local_model(frame)
+        if confidence < ESCALATE_CONF:
+            self.escalate(frame, class_name, confidence)
+        return class_name
+
+    def encode_frame(self, frame):
+        # imencode takes the BGR frame as is; scaled to the detector's input so the cloud
+        # does not resize it again
+        _, buffer = cv2.imencode('.jpg', fit(frame, INPUT_SIZE))
+        return buffer.tobytes()
+
+    def run_local_model(self, frame):
+        with stage('edge', 'inference'):
+            result = self.preprocessor.predict(registry.get('classifier'), [frame])[0]
+        return result.names[result.probs.top1], float(result.probs.top1conf)
+
+    def escalate(self, frame, class_name, confidence):
+        image_data = self.encode_frame(frame)
+        meta = {'localLabel': class_name, 'localConfidence': confidence, 'capturedAt': time.time()}
+        with self._escalation_lock:
+            # Never queue behind a slow network: past the upload limit, go straight to the spool
+            busy = self._escalations >= self.client.max_inflight
+            if not busy:
+                self._escalations += 1
+        if busy:
+            count_request('edge', 'escalate', class_name, 'spooled')
+            self.spool.put(image_data, meta)
+            return
+        future = self.client.submit(image_data)
+        future.add_done_callback(lambda f: self.escalation_done(f, image_data, meta))
+
+    def escalation_done(self, future, image_data, meta):
+        # Runs on an upload thread
+        with self._escalation_lock:
+            self._escalations -= 1
+        try:
+            data = future.result()
+        except UploadError as e:
+            print(f"Cloud unavailable ({e}), spooled capture for later")
+            count_request('edge', 'escalate', meta['localLabel'], 'spooled')
+            self.spool.put(image_data, meta)
+            return
+        count_request('edge', 'escalate', meta['localLabel'], 'ok')
+        self.classification_refined.emit(meta['localLabel'], data.get("classification", "Unknown"))
+
+    def send_spooled(self, items):
+        # Runs on the flusher thread; one result per item, in order
+        futures = [self.client.submit(image_data) for image_data, _ in items]
+        delivered = []
+        for future, (_, meta) in zip(futures, items):
+            try:
+                data = future.result()
+            except UploadError:
+                delivered.append(False)
+                continue
+            delivered.append(True)
+            print(f"Spooled capture from {time.ctime(meta.get('capturedAt', 0))}: "
+                  f"local {meta.get('localLabel')}, cloud {data.get('classification', 'Unknown')}")
+        return delivered
+
+    def show_refined(self, local_name, cloud_name):
+        if cloud_name != local_name:
+            self.result_label.setText(f"Classification: {local_name} (cloud: {cloud_name})")
+            print(f"Cloud reclassified {local_name} as {cloud_name}")
+
+    def show_classification(self, class_name, frame, info):
+        count_request('edge', 'classify', class_name)
+        # Update classification result; the bin comes from the shared category index
+        category = category_index.lookup(class_name)
+        if category is not None and category['id'] != 'unknown':
+            self.result_label.setText(f"Classification: {class_name} ({category['name']})")
+        else:
+            self.result_label.setText(f"Classification: {class_name}")
+        if category is not None and category['id'] == 'recyclable':
+            self.result_label.setStyleSheet("""
+                color: #ffffff;
+                background-color: #4CAF50;
+                padding: 10px;
+                border-radius: 5px;
+            """)
+        else:
+            self.result_label.setStyleSheet("""
+                color: #ffffff;
+                background-color: #F44336;
+                padding: 10px;
+                border-radius: 5px;
+            """)
+
+        # Display frame
+        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        h, w, ch = rgb_frame.shape
+        bytes_per_line = ch * w
+        qimg = QImage(rgb_frame.data, w, h, bytes_per_line, QImage.Format_RGB888)
+        self.image_label.setPixmap(QPixmap.fromImage(qimg).scaled(640, 480, Qt.KeepAspectRatio))
+
+        stats = self.pipeline.stats()
+        print(f"Classified {class_name} in {info['latency_ms']:.0f}ms "
+              f"(dropped {stats['dropped']}, p99 {stats['latency_ms']['p99']:.0f}ms, "
+              f"spooled {self.spool.stats()['pending']})")
 
     def closeEvent(self, event):
+        self.sensors.stop()
+        self.pipeline.stop()
+        self.flusher.stop()
+        self.client.close()
         self.camera.close()
         event.accept()
 
+def prepare_image(image_data):
+    # Size limits and format checks first, then a reduced-scale decode to RGB with the
+    # longer side at the detector's input size; the aspect ratio is kept for its letterbox
+    image = decode_image(image_data, INPUT_SIZE)
+
+    # Encode as JPEG
+    buffer = BytesIO()
+    image.save(buffer, format='JPEG', quality=90)
+    return buffer.getvalue()
+
 @app.post("/classify")
 async def classify_image(file: UploadFile = File(...)):
     try:
-        # Read the uploaded image file
-        image_data = await file.read()
-        image = Image.open(BytesIO(image_data))
-        
-        # Convert image to RGB and resize for the model
-        image = image.convert("RGB")
-        image = image.resize((224, 224))
-        
-        # Convert to numpy array and encode as JPEG
-        np_image = np.array(image)
-        _, buffer = cv2.imencode('.jpg', np_image)
-        
+        # Read the uploaded image file, stopping once it passes the upload limit
+        image_data = await run_in_threadpool(read_stream, file.file)
+        # Decoding and re-encoding are CPU work, keep them off the event loop
+        jpeg = await run_in_threadpool(prepare_image, image_data)
+
         # Send image to cloud model endpoint
-        response = requests.post(CLOUD_MODEL_URL, files={"image": ("image.jpg", buffer.tobytes(), "image/jpeg")})
+        response = await http_client.post(CLOUD_MODEL_URL, files={"image": ("image.jpg", jpeg, "image/jpeg")})
         if response.status_code == 200:
             return JSONResponse(content=response.json())
         else:
             return JSONResponse(content={"error": response.text}, status_code=response.status_code)
+    except ClassifyError as e:
+        return JSONResponse(content={"error": str(e)}, status_code=e.status)
+    except httpx.TimeoutException:
+        return JSONResponse(content={"error": "Cloud model timed out"}, status_code=504)
     except Exception as e:
         return JSONResponse(content={"error": str(e)}, status_code=500)
 
@@ -0,0 +1 @@
+# Shared prediction code used by the servers, controls and edge apps.
@@ -0,0 +1,38 @@
+import os
+import threading
+
+API_WORKERS = int(os.environ.get('SORTYX_API_WORKERS', 4))
+# Requests allowed to wait for a worker before new ones are turned away
+API_MAX_QUEUE = int(os.environ.get('SORTYX_API_MAX_QUEUE', 16))
+RETRY_AFTER = int(os.environ.get('SORTYX_RETRY_AFTER', 1))
+
+
+class AdmissionController:
+    """Caps the requests in flight so overload is answered with 503 + Retry-After right away
+    instead of piling up until clients time out."""
+
+    def __init__(self, max_inflight=API_WORKERS + API_MAX_QUEUE, retry_after=RETRY_AFTER):
+        self.max_inflight = max_inflight
+        self.retry_after = retry_after
+        self.inflight = 0
+        self.admitted = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def try_acquire(self):
+        with self._lock:
+            if self.inflight >= self.max_inflight:
+                self.rejected += 1
+                return False
+            self.inflight += 1
+            self.admitted += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.inflight -= 1
+
+    def stats(self):
+        with self._lock:
+            return {'inflight': self.inflight, 'max_inflight': self.max_inflight,
+                    'admitted': self.admitted, 'rejected': self.rejected}
@@ -0,0 +1,185 @@
+import argparse
+import glob
+import hashlib
+import json
+import os
+import shutil
+import time
+
+from .batching import percentile
+
+# 'pytorch' (default), 'onnx' or 'openvino'; the exported artifact is served through the same YOLO interface
+BACKEND = os.environ.get('SORTYX_BACKEND', 'pytorch')
+INT8 = os.environ.get('SORTYX_INT8', '0') == '1'
+EXPORT_DIR = os.environ.get('SORTYX_EXPORT_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'exports'))
+
+
+def _file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()[:12]
+
+
+def export_path(weights, backend, int8, imgsz):
+    stem = os.path.splitext(os.path.basename(weights))[0]
+    suffix = '-int8' if int8 else ''
+    name = f"{stem}-{_file_digest(weights)}-{imgsz}{suffix}"
+    return os.path.join(EXPORT_DIR, name + ('.onnx' if backend == 'onnx' else '_openvino_model'))
+
+
+def export_model(weights, backend=BACKEND, int8=INT8, imgsz=640, data=None):
+    """Export weights for CPU serving once and return the cached artifact path.
+
+    The cache key covers the weights' content hash, backend, input size and quantization,
+    so changed weights are re-exported automatically.
+    """
+    from ultralytics import YOLO
+    if backend not in ('onnx', 'openvino'):
+        raise ValueError(f"Unknown export backend '{backend}'")
+    target = export_path(weights, backend, int8, imgsz)
+    meta_path = target + '.json'
+    if os.path.exists(target) and os.path.exists(meta_path):
+        return target
+
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    model = YOLO(weights)
+    start = time.perf_counter()
+    if backend == 'onnx':
+        exported = model.export(format='onnx', imgsz=imgsz, simplify=True, dynamic=True)
+        if int8:
+            # Dynamic INT8 quantization of the weights; activations stay float
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+            quantize_dynamic(exported, target, weight_type=QuantType.QUInt8)
+            os.remove(exported)
+        else:
+            shutil.move(exported, target)
+    else:
+        # OpenVINO INT8 uses post-training quantization on a calibration dataset
+        kwargs = {'int8': True, 'data': data or 'coco8.yaml'} if int8 else {}
+        exported = model.export(format='openvino', imgsz=imgsz, dynamic=True, **kwargs)
+        if os.path.exists(target):
+            shutil.rmtree(target)
+        shutil.move(exported, target)
+    with open(meta_path, 'w') as f:
+        json.dump({'source': os.path.abspath(weights), 'task': model.task, 'backend': backend, 'int8': int8,
+                   'imgsz': imgsz, 'export_s': time.perf_counter() - start}, f)
+    print(f"Exported {weights} to {target} in {time.perf_counter() - start:.1f}s")
+    return target
+
+
+def load_backend(weights, backend=BACKEND, int8=INT8, imgsz=640):
+    """YOLO model for the requested backend; exported ones keep the same predict/Results interface."""
+    from ultralytics import YOLO
+    if backend == 'pytorch' or not weights.endswith('.pt'):
+        return YOLO(weights)
+    target = export_model(weights, backend, int8, imgsz)
+    with open(target + '.json') as f:
+        task = json.load(f)['task']
+    return YOLO(target, task=task)
+
+
+def _summary(result):
+    # Comparable output of one result: top-1 class for classifiers, label/box list for detectors
+    if result.probs is not None:
+        return {'top1': int(result.probs.top1), 'conf': float(result.probs.top1conf)}
+    return {'boxes': [(int(c), float(p), [float(v) for v in xyxy]) for c, p, xyxy in
+                      zip(result.boxes.cls.tolist(), result.boxes.conf.tolist(), result.boxes.xyxy.tolist())]}
+
+
+def _iou(a, b):
+    ix = max(0.0, min(a[2], b[2]) - max(a[0], b[0]))
+    iy = max(0.0, min(a[3], b[3]) - max(a[1], b[1]))
+    inter = ix * iy
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def parity_check(reference, candidate, images, imgsz=640):
+    """Compare an exported model's output to the PyTorch model on the same images."""
+    agree = 0
+    conf_diffs, ious = [], []
+    for path in images:
+        ref = _summary(reference(path, imgsz=imgsz, verbose=False)[0])
+        got = _summary(candidate(path, imgsz=imgsz, verbose=False)[0])
+        if 'top1' in ref:
+            agree += ref['top1'] == got['top1']
+            conf_diffs.append(abs(ref['conf'] - got['conf']))
+            continue
+        ref_top = ref['boxes'][0] if ref['boxes'] else None
+        got_top = got['boxes'][0] if got['boxes'] else None
+        if ref_top is None or got_top is None:
+            agree += ref_top is None and got_top is None
+            continue
+        agree += ref_top[0] == got_top[0]
+        conf_diffs.append(abs(ref_top[1] - got_top[1]))
+        ious.append(_iou(ref_top[2], got_top[2]))
+    return {
+        'images': len(images),
+        'top_label_agreement': agree / len(images) if images else 0.0,
+        'max_confidence_diff': max(conf_diffs, default=0.0),
+        'mean_top_box_iou': sum(ious) / len(ious) if ious else None,
+    }
+
+
+def benchmark(model, images, imgsz=640, runs=20, batch=1):
+    """CPU latency (per call) and throughput (images/s) after one warm-up call."""
+    model(images[0], imgsz=imgsz, verbose=False)
+    latencies = []
+    count = 0
+    start = time.perf_counter()
+    for i in range(runs):
+        chunk = [images[(i * batch + j) % len(images)] for j in range(batch)]
+        call_start = time.perf_counter()
+        model(chunk, imgsz=imgsz, verbose=False)
+        latencies.append((time.perf_counter() - call_start) * 1000)
+        count += len(chunk)
+    elapsed = time.perf_counter() - start
+    return {'p50_ms': percentile(latencies, 50), 'p99_ms': percentile(latencies, 99),
+            'images_per_second': count / elapsed if elapsed > 0 else 0.0}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export weights for CPU serving and compare them to PyTorch.')
+    parser.add_argument('--weights', default='yolov8n.pt')
+    parser.add_argument('--backend', nargs='+', default=['onnx'], choices=['onnx', 'openvino'])
+    parser.add_argument('--int8', action='store_true', help='also export and compare INT8 variants')
+    parser.add_argument('--imgsz', type=int, default=640)
+    parser.add_argument('--images', default='app/test', help='directory of sample images')
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--batch', type=int, default=1)
+    parser.add_argument('--report', help='write the comparison as JSON to this file')
+    args = parser.parse_args()
+
+    from ultralytics import YOLO
+    images = sorted(p for p in glob.glob(os.path.join(args.images, '*')) if p.lower().endswith(('.jpg', '.jpeg', '.png')))
+    if not images:
+        parser.error(f'No images in {args.images}')
+    reference = YOLO(args.weights)
+    report = {'weights': args.weights, 'imgsz': args.imgsz, 'batch': args.batch,
+              'results': {'pytorch': {'benchmark': benchmark(reference, images, args.imgsz, args.runs, args.batch)}}}
+    for backend in args.backend:
+        for int8 in ([False, True] if args.int8 else [False]):
+            name = backend + ('-int8' if int8 else '')
+            candidate = load_backend(args.weights, backend, int8, args.imgsz)
+            report['results'][name] = {
+                'artifact': export_path(args.weights, backend, int8, args.imgsz),
+                'parity': parity_check(reference, candidate, images, args.imgsz),
+                'benchmark': benchmark(candidate, images, args.imgsz, args.runs, args.batch),
+            }
+
+    base = report['results']['pytorch']['benchmark']['images_per_second']
+    print(f"{'backend':<14}{'p50 ms':>9}{'p99 ms':>9}{'img/s':>9}{'speedup':>9}{'agree':>8}")
+    for name, entry in report['results'].items():
+        bench = entry['benchmark']
+        agree = entry.get('parity', {}).get('top_label_agreement', 1.0)
+        print(f"{name:<14}{bench['p50_ms']:>9.1f}{bench['p99_ms']:>9.1f}{bench['images_per_second']:>9.1f}"
+              f"{bench['images_per_second'] / base if base else 0:>8.2f}x{agree:>8.0%}")
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+import math
+import os
+import queue
+import threading
+import time
+import weakref
+from collections import deque
+from concurrent.futures import Future
+
+from .metrics import record_stage
+
+# Defaults can be tuned per deployment without touching code
+MAX_BATCH_SIZE = int(os.environ.get('SORTYX_MAX_BATCH', 8))
+MAX_WAIT_MS = float(os.environ.get('SORTYX_MAX_WAIT_MS', 10))
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, math.ceil(pct / 100.0 * len(ordered)) - 1))
+    return ordered[index]
+
+
+class BatchScheduler:
+    """Gathers concurrent predict calls into one batched forward pass."""
+
+    def __init__(self, predict_fn, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS,
+                 metrics_window=1000, name='yolo'):
+        # predict_fn takes a list of inputs and returns a list of results in the same order
+        self.predict_fn = predict_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.name = name
+        self._queue = queue.Queue()
+        self._batches = deque(maxlen=metrics_window)
+        self._lock = threading.Lock()
+        self._total_batches = 0
+        self._total_items = 0
+        self._closed = False
+        self._start()
+        # Fresh locks and threads in forked workers (see model/serving.py)
+        if hasattr(os, 'register_at_fork'):
+            ref = weakref.ref(self)
+            os.register_at_fork(after_in_child=lambda: ref() is not None and ref()._after_fork())
+
+    def _start(self):
+        self._thread = threading.Thread(target=self._run, name=f'{self.name}-batcher', daemon=True)
+        self._thread.start()
+
+    def _after_fork(self):
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        if not self._closed:
+            self._start()
+
+    def submit(self, item):
+        if self._closed:
+            raise RuntimeError('Batch scheduler is closed')
+        future = Future()
+        self._queue.put((item, future, time.perf_counter()))
+        return future
+
+    def predict(self, item, timeout=None):
+        return self.submit(item).result(timeout=timeout)
+
+    def close(self):
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join(timeout=5)
+
+    def _collect(self):
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = first[2] + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                entry = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if entry is None:
+                # Finish the current batch, then stop
+                self._queue.put(None)
+                break
+            batch.append(entry)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            items = [entry[0] for entry in batch]
+            start = time.perf_counter()
+            try:
+                results = list(self.predict_fn(items))
+                if len(results) != len(items):
+                    raise RuntimeError(f'Expected {len(items)} results, got {len(results)}')
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                results = None
+            end = time.perf_counter()
+
+            if results is not None:
+                for (_, future, _), result in zip(batch, results):
+                    future.set_result(result)
+
+            waits = [(start - enqueued) * 1000 for _, _, enqueued in batch]
+            for wait in waits:
+                record_stage(self.name, 'queue_wait', wait / 1000)
+            record_stage(self.name, 'batch_inference', end - start)
+            with self._lock:
+                self._total_batches += 1
+                self._total_items += len(batch)
+                self._batches.append({
+                    'size': len(batch),
+                    'queue_wait_ms': max(waits),
+                    'inference_ms': (end - start) * 1000,
+                    'waits': waits,
+                })
+
+    def stats(self):
+        """Summary of the recent batches, used to tune batch size against latency."""
+        with self._lock:
+            batches = list(self._batches)
+            total_batches = self._total_batches
+            total_items = self._total_items
+        sizes = [b['size'] for b in batches]
+        waits = [w for b in batches for w in b['waits']]
+        inference = [b['inference_ms'] for b in batches]
+        return {
+            'name': self.name,
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait * 1000,
+            'queue_depth': self._queue.qsize(),
+            'total_batches': total_batches,
+            'total_items': total_items,
+            'window_batches': len(batches),
+            'avg_batch_size': sum(sizes) / len(sizes) if sizes else 0.0,
+            'last_batch': {k: v for k, v in batches[-1].items() if k != 'waits'} if batches else None,
+            'queue_wait_ms': {'p50': percentile(waits, 50), 'p99': percentile(waits, 99)},
+            'inference_ms': {'p50': percentile(inference, 50), 'p99': percentile(inference, 99)},
+        }
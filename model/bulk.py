@@ -0,0 +1,194 @@
+import base64
+import binascii
+import io
+import json
+import os
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+from .ingest import MAX_UPLOAD_BYTES, check_content_length, read_body, reject
+
+BULK_MAX_ITEMS = int(os.environ.get('SORTYX_BULK_MAX_ITEMS', 1000))
+# Largest bulk request body, and the most its zip archives may expand to, in bytes
+BULK_MAX_BYTES = int(os.environ.get('SORTYX_BULK_MAX_BYTES', 100 * 1024 * 1024))
+BULK_MAX_UNZIPPED_BYTES = int(os.environ.get('SORTYX_BULK_MAX_UNZIPPED_BYTES', 512 * 1024 * 1024))
+DECODE_WORKERS = int(os.environ.get('SORTYX_DECODE_WORKERS', 4))
+# Images decoded and queued for inference at once; bounds memory for large uploads
+BULK_WINDOW = int(os.environ.get('SORTYX_BULK_WINDOW', 64))
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+
+
+class BulkRequestError(ValueError):
+    """Bulk request that cannot be processed at all; adapters answer with .status and the message."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def too_large(size):
+    return reject('too_large', f'Image too large: {size} > {MAX_UPLOAD_BYTES} bytes', 413)
+
+
+def items_from_zip(data, max_total=BULK_MAX_UNZIPPED_BYTES):
+    """(name, bytes) for each image in a zip archive.
+
+    Sizes come from the archive's directory before anything is decompressed: members larger
+    than MAX_UPLOAD_BYTES become per-item errors, and an archive whose images add up to more
+    than max_total is refused. Reads stop at the declared size, so a lying header cannot
+    inflate past it.
+    """
+    try:
+        archive = zipfile.ZipFile(io.BytesIO(data))
+    except zipfile.BadZipFile as e:
+        raise BulkRequestError(f'Invalid zip archive: {e}')
+    members = [m for m in archive.infolist()
+               if not m.is_dir() and m.filename.lower().endswith(IMAGE_EXTENSIONS)
+               and not m.filename.startswith('__MACOSX/')]
+    if len(members) > BULK_MAX_ITEMS:
+        raise BulkRequestError(f'Too many images: {len(members)} > {BULK_MAX_ITEMS}')
+    total = sum(m.file_size for m in members if m.file_size <= MAX_UPLOAD_BYTES)
+    if total > max_total:
+        raise BulkRequestError(f'Zip archive too large: {total} > {max_total} bytes uncompressed', 413)
+    items = []
+    for member in members:
+        if member.file_size > MAX_UPLOAD_BYTES:
+            items.append((member.filename, too_large(member.file_size)))
+            continue
+        try:
+            items.append((member.filename, archive.read(member)))
+        except (zipfile.BadZipFile, NotImplementedError, RuntimeError, EOFError, OSError) as e:
+            items.append((member.filename, BulkRequestError(f'Unreadable zip member: {e}')))
+    return items
+
+
+def items_from_ndjson(lines):
+    """One JSON object per line: {"id": "...", "image": "<base64, optionally a data URL>"}.
+    Lines that cannot be parsed become per-item errors instead of failing the request."""
+    items = []
+    for number, line in enumerate(lines):
+        line = line.strip()
+        if not line:
+            continue
+        if len(items) >= BULK_MAX_ITEMS:
+            raise BulkRequestError(f'Too many images: more than {BULK_MAX_ITEMS}')
+        try:
+            record = json.loads(line)
+            image = record['image']
+            if ',' in image and image.startswith('data:'):
+                image = image.split(',', 1)[1]
+            data = base64.b64decode(image, validate=True)
+            if len(data) > MAX_UPLOAD_BYTES:
+                data = too_large(len(data))
+            items.append((str(record.get('id', number)), data))
+        except (ValueError, KeyError, TypeError, binascii.Error) as e:
+            items.append((str(number), BulkRequestError(f'Line {number + 1}: {e}')))
+    return items
+
+
+def items_from_request(files, content_type, body):
+    """Collect (id, bytes) pairs from a multipart list, a zip archive or NDJSON of base64 images."""
+    content_type = (content_type or '').split(';')[0].strip()
+    if files:
+        items = []
+        unzipped = BULK_MAX_UNZIPPED_BYTES
+        for name, data in files:
+            if name.lower().endswith('.zip'):
+                members = items_from_zip(data, unzipped)
+                unzipped -= sum(len(d) for _, d in members if isinstance(d, bytes))
+                items.extend(members)
+            else:
+                items.append((name, data))
+    elif content_type in ('application/zip', 'application/x-zip-compressed'):
+        items = items_from_zip(body)
+    elif content_type in ('application/x-ndjson', 'application/jsonl', 'application/json'):
+        items = items_from_ndjson(body.decode('utf-8').splitlines())
+    else:
+        raise BulkRequestError('Send images as multipart "images" files, a zip archive or NDJSON')
+    if not items:
+        raise BulkRequestError('No images found in request')
+    if len(items) > BULK_MAX_ITEMS:
+        raise BulkRequestError(f'Too many images: {len(items)} > {BULK_MAX_ITEMS}')
+    return items
+
+
+def read_files(uploads, max_total=BULK_MAX_BYTES):
+    """[(name, bytes)] from (filename, file object) pairs. Each image is read up to
+    MAX_UPLOAD_BYTES and a zip archive up to what is left of max_total for the request."""
+    files, remaining = [], max_total
+    for i, (name, stream) in enumerate(uploads):
+        name = name or f'image{i}'
+        limit = remaining if name.lower().endswith('.zip') else min(MAX_UPLOAD_BYTES, remaining)
+        data = read_body(stream, max_bytes=limit)
+        remaining -= len(data)
+        files.append((name, data))
+    return files
+
+
+def read_bulk_upload(request, field='images'):
+    """(files, body) of a Flask bulk request, read within BULK_MAX_BYTES: the multipart
+    field's files, or the whole body for a zip or NDJSON upload."""
+    if request.mimetype.startswith('multipart/'):
+        check_content_length(request.content_length, BULK_MAX_BYTES, multipart=True)
+        return read_files((f.filename, f.stream) for f in request.files.getlist(field)), b''
+    return [], read_body(request.stream, request.content_length, BULK_MAX_BYTES)
+
+
+def classify_bulk(items, decode_fn, submit_fn, summarize_fn, workers=DECODE_WORKERS, window=BULK_WINDOW):
+    """Yield one result dict per item, in order, followed by a summary dict.
+
+    Images are decoded on a thread pool and handed to submit_fn (a BatchScheduler.submit),
+    so the scheduler batches them into few forward passes. Failures are reported per item.
+    """
+    start = time.perf_counter()
+    ok = failed = 0
+
+    def decode(item):
+        name, data = item
+        if isinstance(data, Exception):
+            return name, data
+        try:
+            return name, decode_fn(data)
+        except Exception as e:
+            return name, e
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='decode') as executor:
+        for offset in range(0, len(items), window):
+            pending = []
+            for name, image in executor.map(decode, items[offset:offset + window]):
+                pending.append((name, image if isinstance(image, Exception) else submit_fn(image)))
+            for index, (name, future) in enumerate(pending, start=offset):
+                try:
+                    if isinstance(future, Exception):
+                        raise future
+                    result = summarize_fn(future.result())
+                except Exception as e:
+                    failed += 1
+                    yield {'index': index, 'id': name, 'success': False, 'error': str(e)}
+                    continue
+                ok += 1
+                yield {'index': index, 'id': name, 'success': True, **result}
+
+    elapsed = time.perf_counter() - start
+    yield {'summary': {'total': ok + failed, 'succeeded': ok, 'failed': failed, 'elapsed_ms': elapsed * 1000,
+                       'images_per_second': (ok + failed) / elapsed if elapsed > 0 else 0.0}}
+
+
+def ndjson_lines(records):
+    for record in records:
+        yield json.dumps(record) + '\n'
+
+
+def summarize_detections(result):
+    """Top label plus every detection of one ultralytics result."""
+    detections = [
+        {'label': result.names[int(cls)], 'confidence': int(float(conf) * 100)}
+        for cls, conf in zip(result.boxes.cls.tolist(), result.boxes.conf.tolist())
+    ] if result.boxes else []
+    return {
+        'objectName': detections[0]['label'] if detections else 'Unknown',
+        'confidence': detections[0]['confidence'] if detections else 0,
+        'detections': detections,
+    }
@@ -0,0 +1,179 @@
+import threading
+import time
+from collections import deque
+
+from .batching import percentile
+from .metrics import metrics, record_stage
+
+# Drop policies for frames the inference worker has no time for
+LATEST_ONLY = 'latest'
+EVERY_NTH = 'every_nth'
+
+FRAMES = metrics.counter('sortyx_frames_total', 'Captured frames by what happened to them', ['service', 'outcome'])
+
+
+class FrameBuffer:
+    """Bounded buffer that keeps the newest frames and counts the ones pushed out."""
+
+    def __init__(self, size=1):
+        self._frames = deque(maxlen=max(1, size))
+        self._cond = threading.Condition()
+        self.dropped = 0
+
+    def put(self, item):
+        with self._cond:
+            if len(self._frames) == self._frames.maxlen:
+                self.dropped += 1
+            self._frames.append(item)
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._frames, timeout):
+                return None
+            return self._frames.popleft()
+
+
+class CapturePipeline:
+    """Capture thread -> bounded frame buffer -> inference worker thread -> result callback.
+
+    read_fn() returns a frame (or None when the camera has nothing), infer_fn(frame) returns
+    a result, and on_result(result, frame, info) is called from the worker thread. Qt apps
+    should pass a signal's emit so the UI is updated on the GUI thread.
+    With triggered=True the camera is only read after trigger() is called, one frame per call,
+    so an idle pipeline costs no capture work and a trigger waits for one fresh frame at most.
+    workers > 1 keeps several frames in flight (e.g. remote uploads); results may then arrive out of order.
+    name labels the pipeline's series in the /metrics output.
+    """
+
+    def __init__(self, read_fn, infer_fn, on_result=None, on_error=None, policy=LATEST_ONLY, every_n=1,
+                 buffer_size=1, triggered=False, capture_interval=0.0, metrics_window=500, workers=1,
+                 name='capture'):
+        if policy not in (LATEST_ONLY, EVERY_NTH):
+            raise ValueError(f"Unknown drop policy '{policy}'")
+        self.read_fn = read_fn
+        self.infer_fn = infer_fn
+        self.on_result = on_result
+        self.on_error = on_error
+        self.policy = policy
+        self.every_n = max(1, int(every_n))
+        self.triggered = triggered
+        self.capture_interval = capture_interval
+        self.workers = max(1, int(workers))
+        self.name = name
+        self.buffer = FrameBuffer(buffer_size)
+        self._latencies = deque(maxlen=metrics_window)
+        self._pending_triggers = 0
+        self._lock = threading.Lock()
+        self._triggered = threading.Condition(self._lock)
+        self._running = threading.Event()
+        self._threads = []
+        self.captured = 0
+        self.skipped = 0
+        self.processed = 0
+        self.errors = 0
+
+    def start(self):
+        self._running.set()
+        self._threads = [threading.Thread(target=self._capture_loop, name='capture', daemon=True)]
+        self._threads += [threading.Thread(target=self._inference_loop, name=f'inference-{i}', daemon=True)
+                          for i in range(self.workers)]
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def stop(self, timeout=2):
+        self._running.clear()
+        with self._lock:
+            self._triggered.notify_all()
+        for thread in self._threads:
+            thread.join(timeout=timeout)
+
+    def trigger(self):
+        """Capture one frame and pass it to inference (triggered mode)."""
+        with self._lock:
+            self._pending_triggers += 1
+            self._triggered.notify()
+
+    def _wait_for_trigger(self):
+        with self._lock:
+            self._triggered.wait_for(lambda: self._pending_triggers or not self._running.is_set(), timeout=0.5)
+            return self._pending_triggers > 0
+
+    def _should_forward(self):
+        with self._lock:
+            if self.triggered:
+                if self._pending_triggers == 0:
+                    return False
+                self._pending_triggers -= 1
+                return True
+        return self.policy != EVERY_NTH or self.captured % self.every_n == 0
+
+    def _capture_loop(self):
+        while self._running.is_set():
+            if self.triggered and not self._wait_for_trigger():
+                continue
+            frame = self.read_fn()
+            if frame is None:
+                time.sleep(0.01)
+                continue
+            self.captured += 1
+            if self._should_forward():
+                dropped = self.buffer.dropped
+                self.buffer.put((frame, time.perf_counter()))
+                if self.buffer.dropped > dropped:
+                    FRAMES.inc(service=self.name, outcome='dropped')
+            elif not self.triggered:
+                self.skipped += 1
+                FRAMES.inc(service=self.name, outcome='dropped')
+            if self.capture_interval:
+                time.sleep(self.capture_interval)
+
+    def _inference_loop(self):
+        while self._running.is_set():
+            item = self.buffer.get(timeout=0.1)
+            if item is None:
+                continue
+            frame, captured_at = item
+            try:
+                result = self.infer_fn(frame)
+            except Exception as e:
+                with self._lock:
+                    self.errors += 1
+                FRAMES.inc(service=self.name, outcome='error')
+                self._report(e)
+                continue
+            latency_ms = (time.perf_counter() - captured_at) * 1000
+            with self._lock:
+                self.processed += 1
+                self._latencies.append(latency_ms)
+            FRAMES.inc(service=self.name, outcome='processed')
+            record_stage(self.name, 'end_to_end', latency_ms / 1000)
+            if self.on_result:
+                # A failing UI callback must not end the worker, or capture only drops frames from then on
+                try:
+                    self.on_result(result, frame, {'latency_ms': latency_ms})
+                except Exception as e:
+                    with self._lock:
+                        self.errors += 1
+                    self._report(e)
+
+    def _report(self, error):
+        if not self.on_error:
+            print(f"{self.name}: {error}")
+            return
+        try:
+            self.on_error(error)
+        except Exception as e:
+            print(f"{self.name}: error callback failed: {e}")
+
+    def stats(self):
+        latencies = list(self._latencies)
+        return {
+            'captured': self.captured,
+            'processed': self.processed,
+            # Frames pushed out of the buffer plus frames the drop policy never forwarded
+            'dropped': self.buffer.dropped + self.skipped,
+            'errors': self.errors,
+            'latency_ms': {'p50': percentile(latencies, 50), 'p99': percentile(latencies, 99)},
+        }
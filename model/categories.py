@@ -0,0 +1,115 @@
+import argparse
+import json
+import os
+
+# Label -> waste category index shared by the servers and the edge apps.
+# waste_categories.json holds the web app's categories (wasteCategories in
+# webapp/server/index.js) and a category id for every label the models can output.
+INDEX_PATH = os.environ.get('SORTYX_CATEGORY_INDEX',
+                            os.path.join(os.path.dirname(os.path.abspath(__file__)), 'waste_categories.json'))
+# Layout of the file; "version" inside it counts revisions of the mapping itself
+INDEX_FORMAT = 1
+
+UNKNOWN_CATEGORY = {'id': 'unknown', 'name': 'Unclassified Waste'}
+
+
+class CategoryIndex:
+    """O(1) label -> waste category lookup loaded from a versioned JSON file.
+
+    A label mapped to null is known not to be waste (people, vehicles, furniture); a label
+    missing from the file is unmapped and left to the LLM.
+    """
+
+    def __init__(self, categories, labels, version=0):
+        self.categories = [{k: v for k, v in c.items() if k != 'examples'} for c in categories]
+        self.by_id = {c['id']: c for c in self.categories}
+        self.labels = {}
+        for label, category_id in labels.items():
+            if category_id is not None and category_id not in self.by_id:
+                raise ValueError(f'Label {label!r} maps to unknown category {category_id!r}')
+            self.labels[label.strip().lower()] = category_id
+        self.version = version
+
+    @classmethod
+    def load(cls, path=INDEX_PATH):
+        with open(path, encoding='utf-8') as f:
+            doc = json.load(f)
+        if doc.get('format') != INDEX_FORMAT:
+            raise ValueError(f'{path}: unsupported category index format {doc.get("format")!r}')
+        return cls(doc['categories'], doc['labels'], doc.get('version', 0))
+
+    def __contains__(self, label):
+        return label.strip().lower() in self.labels
+
+    def lookup(self, label):
+        """Category dict for a mapped label, UNKNOWN_CATEGORY for non-waste labels, None if unmapped."""
+        key = label.strip().lower()
+        if key not in self.labels:
+            return None
+        category_id = self.labels[key]
+        return self.by_id[category_id] if category_id else UNKNOWN_CATEGORY
+
+    def unmapped(self, labels):
+        return [label for label in labels if label not in self]
+
+    def match(self, text):
+        """The category an LLM answer names, matched by id or name like index.js does."""
+        text = (text or '').strip().lower()
+        for category in self.categories:
+            if category['id'] in text or category['name'].lower() in text:
+                return category
+        return UNKNOWN_CATEGORY
+
+
+category_index = CategoryIndex.load()
+WASTE_CATEGORIES = category_index.categories
+
+
+def match_category(text):
+    return category_index.match(text)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check a model\'s labels against the category index, '
+                                                 'optionally asking the LLM for the missing ones.')
+    parser.add_argument('--weights', nargs='+', required=True, help='YOLO weights whose class names must be mapped')
+    parser.add_argument('--index', default=INDEX_PATH)
+    parser.add_argument('--fill', action='store_true', help='map unmapped labels with the LLM and bump the version')
+    parser.add_argument('--llm', help='Ollama model name for --fill')
+    args = parser.parse_args()
+
+    from ultralytics import YOLO
+    index = CategoryIndex.load(args.index)
+    labels = sorted({name for weights in args.weights for name in YOLO(weights).names.values()})
+    missing = index.unmapped(labels)
+    print(f'{args.index} v{index.version}: {len(labels) - len(missing)}/{len(labels)} labels mapped')
+    if not missing or not args.fill:
+        for label in missing:
+            print(f'  unmapped: {label}')
+        return 1 if missing else 0
+
+    from .instructions import COMPONENTS_TEMPLATE, LLM_MODEL, InstructionCache
+    cache = InstructionCache(model_name=args.llm or LLM_MODEL, path=None)
+    answers = {}
+    for i in range(0, len(missing), 16):
+        answers.update(cache.get_many(missing[i:i + 16], COMPONENTS_TEMPLATE))
+
+    with open(args.index, encoding='utf-8') as f:
+        doc = json.load(f)
+    added = 0
+    for label, answer in answers.items():
+        category = index.match(answer['category'])
+        # Answers that name no category stay unmapped rather than being recorded as non-waste
+        if category is not UNKNOWN_CATEGORY:
+            doc['labels'][label.lower()] = category['id']
+            added += 1
+    doc['version'] = doc.get('version', 0) + 1
+    with open(args.index, 'w', encoding='utf-8') as f:
+        json.dump(doc, f, indent=2, ensure_ascii=False)
+        f.write('\n')
+    print(f'Added {added}/{len(missing)} labels, now v{doc["version"]}; review them before committing')
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
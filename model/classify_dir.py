@@ -0,0 +1,164 @@
+import argparse
+import csv
+import glob
+import json
+import os
+import time
+from multiprocessing import Pool
+
+from .bulk import IMAGE_EXTENSIONS, summarize_detections
+from .detector import MODEL_PATH, is_known_category, load_model, top_label
+from .preprocess import Preprocessor
+
+FIELDS = ['path', 'label', 'confidence', 'known_category', 'detections', 'error']
+
+
+def iter_paths(inputs):
+    """Yield image paths from directories (recursively) and glob patterns, lazily."""
+    for pattern in inputs:
+        if os.path.isdir(pattern):
+            for root, dirs, files in os.walk(pattern):
+                dirs.sort()
+                for name in sorted(files):
+                    if name.lower().endswith(IMAGE_EXTENSIONS):
+                        yield os.path.join(root, name)
+        else:
+            for path in sorted(glob.iglob(pattern, recursive=True)):
+                if path.lower().endswith(IMAGE_EXTENSIONS):
+                    yield path
+
+
+def load_image(task):
+    # Runs in a worker process: decode, resize and colour-convert off the main (inference) process
+    path, imgsz = task
+    start = time.perf_counter()
+    try:
+        import numpy as np
+        from PIL import Image
+        image = Image.open(path)
+        # JPEGs are decoded at a reduced scale when they are much larger than the model input
+        image.draft('RGB', (imgsz, imgsz))
+        # The one resize happens here, so the main process only pads the image into the batch
+        image.thumbnail((imgsz, imgsz))
+        # NumPy input is BGR, like OpenCV frames
+        array = np.ascontiguousarray(np.asarray(image.convert('RGB'))[:, :, ::-1])
+        return path, array, None, (time.perf_counter() - start) * 1000
+    except Exception as e:
+        return path, None, str(e), (time.perf_counter() - start) * 1000
+
+
+def read_checkpoint(path):
+    done = set()
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                try:
+                    done.add(json.loads(line)['path'])
+                except (ValueError, KeyError):
+                    continue  # a line cut short by an interrupted run
+    return done
+
+
+def write_output(checkpoint_path, output_path):
+    """Convert the JSONL checkpoint into the format implied by the output extension."""
+    with open(checkpoint_path) as f:
+        rows = []
+        for line in f:
+            try:
+                rows.append(json.loads(line))
+            except ValueError:
+                continue
+    extension = os.path.splitext(output_path)[1].lower()
+    if extension == '.csv':
+        with open(output_path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=FIELDS)
+            writer.writeheader()
+            for row in rows:
+                writer.writerow({**row, 'detections': json.dumps(row['detections'])})
+    elif extension == '.parquet':
+        import pandas as pd
+        frame = pd.DataFrame(rows, columns=FIELDS)
+        frame['detections'] = frame['detections'].map(json.dumps)
+        frame.to_parquet(output_path, index=False)
+    else:
+        with open(output_path, 'w') as f:
+            for row in rows:
+                f.write(json.dumps(row) + '\n')
+    return len(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Classify every image in directories or globs with the server model.')
+    parser.add_argument('inputs', nargs='+', help='image directories or glob patterns, e.g. app/test "app/runs/**/*.jpg"')
+    parser.add_argument('-o', '--output', default='results.jsonl', help='.jsonl, .csv or .parquet')
+    parser.add_argument('--weights', default=MODEL_PATH, help='YOLO weights')
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 2) - 1),
+                        help='decode/preprocess processes')
+    parser.add_argument('--batch-size', type=int, default=16, help='images per forward pass')
+    parser.add_argument('--imgsz', type=int, default=640, help='model input size')
+    parser.add_argument('--checkpoint', help='progress file used to resume (default: <output>.partial.jsonl)')
+    parser.add_argument('--restart', action='store_true', help='ignore an existing checkpoint and start over')
+    args = parser.parse_args()
+
+    checkpoint_path = args.checkpoint or f"{args.output}.partial.jsonl"
+    if args.restart and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    done = read_checkpoint(checkpoint_path)
+    if done:
+        print(f"Resuming: {len(done)} images already in {checkpoint_path}")
+
+    model = load_model(args.weights)
+    preprocessor = Preprocessor(args.imgsz, max_batch=args.batch_size)
+    stats = {'images': 0, 'failed': 0, 'decode_ms': 0.0, 'inference_ms': 0.0}
+    start = time.perf_counter()
+
+    with open(checkpoint_path, 'a') as checkpoint:
+        def write_rows(rows):
+            for row in rows:
+                checkpoint.write(json.dumps(row) + '\n')
+            checkpoint.flush()
+
+        def run_batch(batch):
+            if not batch:
+                return
+            batch_start = time.perf_counter()
+            results = preprocessor.predict(model, [image for _, image in batch])
+            stats['inference_ms'] += (time.perf_counter() - batch_start) * 1000
+            rows = []
+            for (path, _), result in zip(batch, results):
+                label, confidence = top_label(result)
+                rows.append({'path': path, 'label': label, 'confidence': confidence,
+                             'known_category': is_known_category(label),
+                             'detections': summarize_detections(result)['detections'], 'error': None})
+            stats['images'] += len(rows)
+            write_rows(rows)
+            batch.clear()
+
+        tasks = ((path, args.imgsz) for path in iter_paths(args.inputs) if path not in done)
+        batch = []
+        with Pool(args.workers) as pool:
+            for path, image, error, decode_ms in pool.imap(load_image, tasks, chunksize=4):
+                stats['decode_ms'] += decode_ms
+                if error:
+                    stats['failed'] += 1
+                    write_rows([{'path': path, 'label': None, 'confidence': None, 'known_category': None,
+                                 'detections': [], 'error': error}])
+                    continue
+                batch.append((path, image))
+                if len(batch) >= args.batch_size:
+                    run_batch(batch)
+            run_batch(batch)
+
+    elapsed = time.perf_counter() - start
+    total = write_output(checkpoint_path, args.output)
+    processed = stats['images'] + stats['failed']
+    print(f"Wrote {total} rows to {args.output}")
+    print(f"This run: {stats['images']} classified, {stats['failed']} failed, {len(done)} skipped from checkpoint "
+          f"in {elapsed:.1f}s ({processed / elapsed if elapsed > 0 else 0:.1f} images/s)")
+    if processed:
+        print(f"Decode {stats['decode_ms'] / processed:.1f} ms/image (across {args.workers} workers), "
+              f"inference {stats['inference_ms'] / max(stats['images'], 1):.1f} ms/image")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+import os
+
+# Weights used by the classify servers; run them from the repository root
+MODEL_PATH = os.environ.get('SORTYX_MODEL', './model/yolov8n.pt')
+
+# Labels the server accepts as waste categories
+KNOWN_CATEGORIES = ['plastic', 'paper', 'metal', 'glass', 'organic', 'horse', 'person']
+
+# Detections below this confidence (0-100) are left out of per-component responses
+DETECTION_THRESHOLD = int(os.environ.get('SORTYX_DETECTION_THRESHOLD', 25))
+
+
+def load_model(path=MODEL_PATH, imgsz=640):
+    # Served from an exported ONNX/OpenVINO artifact when SORTYX_BACKEND asks for one
+    from .backends import load_backend
+    return load_backend(path, imgsz=imgsz)
+
+
+def top_label(result):
+    """(label, confidence 0-100) of the first detection, or ("Unknown", 0)."""
+    if not result.boxes:
+        return "Unknown", 0
+    label = result.names[int(result.boxes.cls[0])]
+    confidence = int(float(result.boxes.conf[0]) * 100)
+    return label, min(max(confidence, 0), 100)
+
+
+def all_detections(result, threshold=DETECTION_THRESHOLD):
+    """Every detection at or above threshold, most confident first: label, confidence 0-100, xyxy box."""
+    if not result.boxes:
+        return []
+    boxes = result.boxes
+    found = [
+        {'label': result.names[int(cls)], 'confidence': min(max(int(float(conf) * 100), 0), 100),
+         'box': [round(float(v), 1) for v in xyxy]}
+        for cls, conf, xyxy in zip(boxes.cls.tolist(), boxes.conf.tolist(), boxes.xyxy.tolist())
+    ]
+    return sorted((d for d in found if d['confidence'] >= threshold), key=lambda d: -d['confidence'])
+
+
+_KNOWN = frozenset(KNOWN_CATEGORIES)
+
+
+def is_known_category(label):
+    return label.lower() in _KNOWN
@@ -0,0 +1,292 @@
+import re
+from collections import namedtuple
+
+from .batching import BatchScheduler
+from .bulk import BulkRequestError, classify_bulk, items_from_request, summarize_detections
+from .categories import UNKNOWN_CATEGORY, category_index, match_category
+from .detector import DETECTION_THRESHOLD, KNOWN_CATEGORIES, MODEL_PATH, all_detections, is_known_category, top_label
+from .events import open_store
+from .ingest import ClassifyError, decode_image
+from .instructions import COMPONENTS_TEMPLATE, LLM_MODEL, PROMPT_TEMPLATE, InstructionCache
+from .jobs import InstructionJobs
+from .llm import LLMUnavailable, llm
+from .metrics import collect_stages, count_request, metrics, stage
+from .preprocess import INPUT_SIZE, Preprocessor
+from .registry import registry
+from .result_cache import ResultCache
+
+# What a post-processor gets: the raw ultralytics result and its top detection
+Detection = namedtuple('Detection', ['result', 'label', 'confidence'])
+
+
+def validate_known_label(detection):
+    """The checks app/server applies before answering; rejects labels outside KNOWN_CATEGORIES."""
+    label, confidence = detection.label, detection.confidence
+    if not label:
+        raise ClassifyError('No label detected')
+    if confidence < 0 or confidence > 100:
+        raise ClassifyError('Invalid confidence level')
+    if not isinstance(label, str):
+        raise ClassifyError('Invalid label type')
+    if len(label) > 50:
+        raise ClassifyError('Label too long')
+    if not all(c.isalnum() or c.isspace() for c in label):
+        raise ClassifyError('Label contains invalid characters')
+    if not is_known_category(label):
+        raise ClassifyError('Unknown category')
+
+
+def category_for(label):
+    """The label's waste category from the index; unmapped labels get a placeholder named after them."""
+    category = category_index.lookup(label)
+    if category is not None:
+        return category
+    return {
+        "id": label.lower().replace(" ", "_"),
+        "name": label,
+        "description": "AI generated category",
+        "icon": "🔍",
+        "color": "bg-gray-500",
+        "gradient": "from-gray-400 to-gray-600"
+    }
+
+
+# Post-processors turn a Detection into the response body of one entry point.
+# When the LLM is saturated or past its deadline they still answer, with the category
+# and no explanation, and mark the body 'degraded' so it is not cached.
+
+def instruction_response(engine, detection):
+    """Web app response: category, LLM disposal instruction and the LLM's confidence."""
+    label = detection.label
+    classification = category_for(label)
+    try:
+        content = engine.instruction(label)
+    except LLMUnavailable:
+        return {
+            'success': True,
+            'objectName': label,
+            'classification': classification,
+            'components': [{"name": label, "classification": classification, "reason": None}],
+            'confidence': round(detection.confidence),
+            'degraded': True
+        }
+    with stage(engine.service, 'parse'):
+        confidence_match = re.search(r'confidence.*?(\d+)', content, re.IGNORECASE)
+        confidence = int(confidence_match.group(1)) if confidence_match else 80
+    return {
+        'success': True,
+        'objectName': label,
+        'classification': classification,
+        'components': [{"name": label, "classification": classification, "reason": content}],
+        'confidence': confidence
+    }
+
+
+def components_response(engine, detection, explain=False):
+    """Every object above the detection threshold, each with its box and category.
+
+    Categories come from the category index. Only unmapped labels, or every label when
+    explain is set, go to the LLM, all in one prompt, so a photo of mixed waste costs at
+    most one round trip. The most confident object is the main one.
+    """
+    found = all_detections(detection.result, engine.threshold)
+    labels = [d['label'] for d in found]
+    asked = labels if explain else category_index.unmapped(labels)
+    degraded = False
+    try:
+        answers = engine.components(asked) if asked else {}
+    except LLMUnavailable:
+        answers, degraded = {}, True
+    components = []
+    for d in found:
+        answer = answers.get(d['label'])
+        classification = category_index.lookup(d['label'])
+        if classification is None:
+            classification = match_category(answer['category']) if answer else category_for(d['label'])
+        components.append({'name': d['label'], 'classification': classification,
+                           'reason': answer['reason'] if answer else None, 'confidence': d['confidence'],
+                           'box': d['box']})
+    response = {
+        'success': True,
+        'objectName': found[0]['label'] if found else 'Unknown',
+        'classification': components[0]['classification'] if components else UNKNOWN_CATEGORY,
+        'components': components,
+        'confidence': found[0]['confidence'] if found else 0
+    }
+    if degraded:
+        response['degraded'] = True
+    return response
+
+
+def explained_components_response(engine, detection):
+    """components_response with the LLM's disposal reason for every object."""
+    return components_response(engine, detection, explain=True)
+
+
+def split_response(engine, detection):
+    """Detection right away; the instruction follows by job id or SSE."""
+    label = detection.label
+    classification = category_for(label)
+    job = engine.jobs.submit(label, engine.template)
+    return {
+        'success': True,
+        'objectName': label,
+        'classification': classification,
+        'components': [{"name": label, "classification": classification, "reason": None}],
+        'confidence': detection.confidence,
+        'instructionJob': job.id,
+        'instructionUrl': f'/instruction/{job.id}',
+        'instructionStreamUrl': f'/instruction/{job.id}/stream'
+    }
+
+
+def label_instruction(engine, detection):
+    try:
+        return {'label': detection.label, 'instruction': engine.instruction(detection.label)}
+    except LLMUnavailable:
+        return {'label': detection.label, 'instruction': None, 'degraded': True}
+
+
+def class_ids(engine, detection):
+    return {"classes": detection.result.boxes.cls.cpu().numpy().tolist()}
+
+
+class ClassificationEngine:
+    """YOLO + LLM classification shared by every server; build one per process.
+
+    Uploads go through one preprocessing path, concurrent requests share batched forward
+    passes of one registry model, responses are cached by upload hash and instructions by
+    label, and every stage is timed into /metrics under the service name. Entry points
+    pick a post-processor for their response shape and stay thin adapters.
+    """
+
+    def __init__(self, service, weights=MODEL_PATH, model='detector', imgsz=INPUT_SIZE, llm_model=LLM_MODEL,
+                 template=PROMPT_TEMPLATE, cache_namespace=None, validate=None, threshold=DETECTION_THRESHOLD):
+        self.service = service
+        self.model = model
+        self.imgsz = imgsz
+        self.template = template
+        self.validate = validate
+        self.threshold = threshold
+        # Weights load and warm up in the background; registry.ready() reports when they can serve
+        registry.register(model, weights, imgsz=imgsz)
+        # Concurrent requests share one batched forward pass, fed the exact model tensor built
+        # in one letterbox pass into a reused buffer (decode already scaled the images to imgsz)
+        self.preprocessor = Preprocessor(imgsz)
+        self.scheduler = BatchScheduler(lambda images: self.preprocessor.predict(registry.get(model), images),
+                                        name='yolo')
+        # LLM instructions only depend on the label, so they are generated once per label
+        self.instructions = InstructionCache(model_name=llm_model)
+        # Background instruction generation for split responses
+        self.jobs = InstructionJobs(self.instructions)
+        # Responses for repeated uploads, keyed by a hash of the image bytes
+        self.result_cache = ResultCache(namespace=cache_namespace or f'{service}-classify:')
+        metrics.gauge('sortyx_batch_queue_depth', 'Images waiting for the batched forward pass',
+                      lambda: self.scheduler.stats()['queue_depth'])
+        self.llm = llm
+        # With SORTYX_EVENT_STORE set, every classification is appended to the event log for /stats/events
+        self.events = open_store()
+
+    def preprocess(self, data):
+        with stage(self.service, 'decode'):
+            return decode_image(data, self.imgsz)
+
+    def detect(self, image):
+        # Includes the wait for a batch slot; the batch itself is timed as yolo/batch_inference
+        with stage(self.service, 'inference'):
+            result = self.scheduler.predict(image)
+        label, confidence = top_label(result)
+        return Detection(result, label, confidence)
+
+    def instruction(self, label):
+        with stage(self.service, 'llm'):
+            return self.instructions.get(label, self.template)
+
+    def components(self, labels):
+        """{label: {'category', 'reason'}}, from one batched LLM call for the labels not cached yet."""
+        with stage(self.service, 'llm'):
+            return self.instructions.get_many(labels, COMPONENTS_TEMPLATE)
+
+    def classify(self, data, postprocess=instruction_response, store=True, endpoint='classify', variant='',
+                 device=None):
+        """Response body for one upload. Raises ClassifyError for uploads that cannot be classified.
+
+        store=False bypasses the result cache both ways, for bodies that point at per-request
+        state: such a body is never cached, and a cached body of another shape must not stand in
+        for it. Responses of different shapes for the same upload are cached under different variants.
+        device names the bin or camera that sent the upload in the event log.
+        """
+        label, confidence, outcome, response = '', None, 'ok', None
+        try:
+            with collect_stages() as stages, stage(self.service, 'total'):
+                # Identical uploads (retries, replayed test images) skip decode, YOLO and the LLM
+                cached = None
+                if store:
+                    with stage(self.service, 'cache_lookup'):
+                        cached = self.result_cache.get(data, variant)
+                if cached is None:
+                    image = self.preprocess(data)
+                    if store:
+                        with stage(self.service, 'cache_lookup'):
+                            cached = self.result_cache.get_similar(image, variant)
+                if cached is not None:
+                    label, outcome = cached.get('objectName') or cached.get('label', ''), 'cache_hit'
+                    response, confidence = cached, cached.get('confidence')
+                    return cached
+
+                detection = self.detect(image)
+                label, confidence = detection.label, detection.confidence
+                if self.validate:
+                    self.validate(detection)
+                response = postprocess(self, detection)
+                if response.get('degraded'):
+                    # Answered without the LLM; the next upload of this image gets the full answer
+                    outcome = 'degraded'
+                elif store:
+                    self.result_cache.set(data, response, image, variant)
+                return response
+        except ClassifyError:
+            outcome = 'rejected'
+            raise
+        except Exception:
+            outcome = 'error'
+            raise
+        finally:
+            count_request(self.service, endpoint, label, outcome)
+            # Responses without a classification (label-only APIs) are logged with the index category
+            classification = (response or {}).get('classification') or (
+                category_index.lookup(label) if label else None)
+            self.events.record(self.service, endpoint, label, classification['id'] if classification else '',
+                               confidence, outcome, stages, device)
+
+    def classify_bulk(self, files, content_type, body, device=None):
+        """Per-image records for a bulk upload (see model.bulk); raises BulkRequestError on a bad request."""
+        try:
+            items = items_from_request(files, content_type, body)
+        except BulkRequestError:
+            count_request(self.service, 'classify_bulk', outcome='rejected')
+            raise
+        count_request(self.service, 'classify_bulk')
+        records = classify_bulk(items, lambda data: decode_image(data, self.imgsz), self.scheduler.submit,
+                                summarize_detections)
+        return self._log_bulk(records, device)
+
+    def _log_bulk(self, records, device):
+        # One event per image; bulk stages are timed per batch, so these carry no latencies
+        for record in records:
+            if 'summary' not in record:
+                label = record.get('objectName', '')
+                category = category_index.lookup(label) if label else None
+                self.events.record(self.service, 'classify_bulk', label, category['id'] if category else '',
+                                   record.get('confidence'), 'ok' if record['success'] else 'rejected',
+                                   device=device)
+            yield record
+
+    def warm_instructions(self, extra_labels=KNOWN_CATEGORIES, template=None):
+        """Generate and cache the disposal instruction for every model label (plus extra_labels)."""
+        labels = sorted(set(extra_labels) | set(registry.get(self.model).names.values()))
+        self.instructions.warm_up(labels, template or self.template)
+        return labels
+
+    def ready(self):
+        return registry.ready()
@@ -0,0 +1,249 @@
+import argparse
+import atexit
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import weakref
+
+from .metrics import metrics
+
+# SQLite file every classification is appended to; off unless set (e.g. ~/.sortyx/events.db)
+EVENTS_PATH = os.path.expanduser(os.environ.get('SORTYX_EVENT_STORE', ''))
+# Events are written in one transaction per batch, at least every flush interval
+EVENT_BATCH = int(os.environ.get('SORTYX_EVENT_BATCH', 256))
+EVENT_FLUSH_S = float(os.environ.get('SORTYX_EVENT_FLUSH_S', 1.0))
+# Pending events kept while the disk is slow; the oldest are dropped beyond this
+EVENT_MAX_PENDING = int(os.environ.get('SORTYX_EVENT_MAX_PENDING', 10000))
+# Name of this bin/camera in the events it records and the uploads it sends
+DEVICE_ID = os.environ.get('SORTYX_DEVICE_ID') or socket.gethostname()
+DEVICE_HEADER = 'X-Sortyx-Device'
+
+# Per-stage latency columns; other stage names are not stored
+STAGES = ('total', 'cache_lookup', 'decode', 'inference', 'llm', 'parse',
+          'capture', 'preprocess', 'postprocess', 'encode', 'request')
+COLUMNS = ('ts', 'device', 'service', 'endpoint', 'label', 'category', 'confidence', 'outcome') + tuple(
+    f'{name}_ms' for name in STAGES)
+
+SCHEMA = f'''
+CREATE TABLE IF NOT EXISTS events (
+    ts REAL NOT NULL, device TEXT, service TEXT, endpoint TEXT, label TEXT, category TEXT,
+    confidence REAL, outcome TEXT, {', '.join(f'{name}_ms REAL' for name in STAGES)}
+);
+CREATE INDEX IF NOT EXISTS events_ts ON events (ts);
+CREATE INDEX IF NOT EXISTS events_device_ts ON events (device, ts);
+'''
+
+EVENTS = metrics.counter('sortyx_events_total', 'Classification events by what happened to them (written, dropped)',
+                         ['status'])
+
+
+def _connect(path):
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    connection = sqlite3.connect(path, timeout=10)
+    # WAL lets the endpoint read while a writer (or another worker process) appends
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute('PRAGMA synchronous=NORMAL')
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def percentile_offsets(count, pcts):
+    """Nearest-rank row offsets of each percentile in a sorted column of count values."""
+    return {pct: min(count - 1, max(0, -(-pct * count // 100) - 1)) for pct in pcts}
+
+
+class EventLog:
+    """Aggregate queries over an event log file; they run inside SQLite over the ts index
+    and return only the aggregates."""
+
+    def __init__(self, path=EVENTS_PATH):
+        self.path = path
+
+    def _query(self, sql, params):
+        connection = sqlite3.connect(f'file:{self.path}?mode=ro', uri=True, timeout=10)
+        try:
+            return connection.execute(sql, params).fetchall()
+        finally:
+            connection.close()
+
+    @staticmethod
+    def _where(since, until, device):
+        clauses, params = ['ts >= ?'], [since]
+        if until is not None:
+            clauses.append('ts < ?')
+            params.append(until)
+        if device:
+            clauses.append('device = ?')
+            params.append(device)
+        return ' AND '.join(clauses), params
+
+    def hourly_counts(self, since, until=None, device=None):
+        """[{'hour', 'category', 'count'}] per hour (epoch seconds at the start of the hour) and category."""
+        where, params = self._where(since, until, device)
+        rows = self._query(f'SELECT CAST(ts / 3600 AS INTEGER) * 3600 AS hour, category, COUNT(*) FROM events '
+                           f'WHERE {where} GROUP BY hour, category ORDER BY hour, category', params)
+        return [{'hour': hour, 'category': category, 'count': count} for hour, category, count in rows]
+
+    def latency_percentiles(self, since, until=None, device=None, stages=('total', 'decode', 'inference', 'llm'),
+                            pcts=(50, 95, 99)):
+        """{stage: {'count', 'p50', ...}} in ms, nearest-rank like model.batching.percentile."""
+        where, params = self._where(since, until, device)
+        report = {}
+        for name in stages:
+            if name not in STAGES:
+                raise ValueError(f'Unknown stage {name!r}')
+            column = f'{name}_ms'
+            condition = f'{where} AND {column} IS NOT NULL'
+            count = self._query(f'SELECT COUNT(*) FROM events WHERE {condition}', params)[0][0]
+            if not count:
+                continue
+            entry = {'count': count}
+            for pct, offset in percentile_offsets(count, pcts).items():
+                value = self._query(f'SELECT {column} FROM events WHERE {condition} ORDER BY {column} '
+                                    f'LIMIT 1 OFFSET ?', params + [offset])[0][0]
+                entry[f'p{pct}'] = round(value, 3)
+            report[name] = entry
+        return report
+
+    def summary(self, hours=24, device=None, now=None):
+        """What GET /stats/events returns: hourly category counts and stage latency percentiles."""
+        since = (now or time.time()) - hours * 3600
+        if not os.path.exists(self.path):
+            return {'since': since, 'device': device, 'hourly': [], 'latency_ms': {}}
+        return {'since': since, 'device': device, 'hourly': self.hourly_counts(since, device=device),
+                'latency_ms': self.latency_percentiles(since, device=device)}
+
+
+class EventStore(EventLog):
+    """Append-only SQLite log of classifications, written in batches off the request path.
+
+    record() only appends to a buffer; a writer thread inserts the buffer in one transaction
+    when it reaches batch_size events or every flush_interval seconds, so queries see events
+    at most that late.
+    """
+
+    def __init__(self, path=EVENTS_PATH, batch_size=EVENT_BATCH, flush_interval=EVENT_FLUSH_S,
+                 max_pending=EVENT_MAX_PENDING):
+        super().__init__(path)
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.written = 0
+        self.dropped = 0
+        self._closed = False
+        self._start()
+        ref = weakref.ref(self)
+        atexit.register(lambda: ref() is not None and ref().close())
+        # Fresh locks and threads in forked workers (see model/serving.py)
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=lambda: ref() is not None and ref()._start())
+
+    def _start(self):
+        self._pending = []
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name='event-writer', daemon=True)
+        self._thread.start()
+
+    def record(self, service, endpoint, label='', category='', confidence=None, outcome='ok', stages=None,
+               device=None, ts=None):
+        row = (ts or time.time(), device or DEVICE_ID, service, endpoint, label or '', category or '',
+               confidence, outcome) + tuple((stages or {}).get(name) for name in STAGES)
+        with self._cond:
+            self._pending.append(row)
+            if len(self._pending) > self.max_pending:
+                del self._pending[0]
+                self.dropped += 1
+                EVENTS.inc(status='dropped')
+            if len(self._pending) >= self.batch_size:
+                self._cond.notify()
+
+    def _take(self):
+        with self._cond:
+            if not self._closed and len(self._pending) < self.batch_size:
+                self._cond.wait(self.flush_interval)
+            rows, self._pending = self._pending, []
+            return rows
+
+    def _run(self):
+        connection = _connect(self.path)
+        try:
+            while True:
+                rows = self._take()
+                if rows:
+                    self._write(connection, rows)
+                if self._closed:
+                    with self._cond:
+                        if not self._pending:
+                            return
+        finally:
+            connection.close()
+
+    def _write(self, connection, rows):
+        placeholders = ', '.join('?' * len(COLUMNS))
+        try:
+            with connection:
+                connection.executemany(f'INSERT INTO events ({", ".join(COLUMNS)}) VALUES ({placeholders})', rows)
+        except sqlite3.Error as e:
+            print(f'Event log: dropping {len(rows)} events: {e}')
+            self.dropped += len(rows)
+            EVENTS.inc(len(rows), status='dropped')
+            return
+        self.written += len(rows)
+        EVENTS.inc(len(rows), status='written')
+
+    def close(self):
+        """Write what is still buffered and stop the writer."""
+        if self._closed:
+            return
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join(timeout=10)
+
+    def stats(self):
+        with self._cond:
+            pending = len(self._pending)
+        return {'path': self.path, 'written': self.written, 'pending': pending, 'dropped': self.dropped}
+
+
+class NullEventStore:
+    """Stands in for EventStore when SORTYX_EVENT_STORE is empty."""
+
+    path = None
+
+    def record(self, *args, **kwargs):
+        pass
+
+    def close(self):
+        pass
+
+    def summary(self, hours=24, device=None, now=None):
+        return {'since': None, 'device': device, 'hourly': [], 'latency_ms': {}}
+
+    def stats(self):
+        return {'path': None, 'written': 0, 'pending': 0, 'dropped': 0}
+
+
+def open_store(path=EVENTS_PATH):
+    return EventStore(path) if path else NullEventStore()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Per-hour category counts and stage latency percentiles '
+                                                 'from a classification event log.')
+    parser.add_argument('--store', default=EVENTS_PATH or None, required=not EVENTS_PATH,
+                        help='event log file (default SORTYX_EVENT_STORE)')
+    parser.add_argument('--hours', type=float, default=24)
+    parser.add_argument('--device', help='only this device')
+    args = parser.parse_args()
+    if not args.store or not os.path.exists(args.store):
+        parser.error(f'No event log at {args.store!r}')
+    print(json.dumps(EventLog(args.store).summary(args.hours, args.device), indent=2))
+
+
+if __name__ == '__main__':
+    main()
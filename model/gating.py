@@ -0,0 +1,103 @@
+import os
+import threading
+
+import numpy as np
+
+try:
+    import cv2
+except ImportError:  # fall back to NumPy subsampling when OpenCV is not installed
+    cv2 = None
+
+# Mean absolute grey-level difference (0-255) that counts as a new scene
+DIFF_THRESHOLD = float(os.environ.get('SORTYX_GATE_DIFF', 8.0))
+# Differing bits out of 64 in the difference hash that count as a new scene
+HASH_THRESHOLD = int(os.environ.get('SORTYX_GATE_HASH', 6))
+
+
+def _small_grey(frame, size):
+    frame = np.asarray(frame)
+    if frame.ndim == 3:
+        frame = frame.mean(axis=2) if cv2 is None else cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    if cv2 is not None:
+        return cv2.resize(frame, size, interpolation=cv2.INTER_AREA).astype(np.float32)
+    h, w = frame.shape[:2]
+    rows = np.linspace(0, h - 1, size[1]).astype(int)
+    cols = np.linspace(0, w - 1, size[0]).astype(int)
+    return frame[np.ix_(rows, cols)].astype(np.float32)
+
+
+def dhash(frame):
+    """64-bit difference hash: compares horizontally adjacent pixels of a 9x8 thumbnail."""
+    small = _small_grey(frame, (9, 8))
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int(np.packbits(bits).view('>u8')[0])
+
+
+class ChangeGate:
+    """Runs inference only when the scene changed since the last inferred frame.
+
+    method is 'diff' (frame differencing), 'hash' (perceptual hash) or 'both' (either one
+    firing counts as a change). max_skip forces a fresh inference after that many reused results.
+    Meant for continuous capture; a sensor-triggered pipeline takes one frame per new item, so
+    there is nothing for it to skip.
+    """
+
+    def __init__(self, method='diff', diff_threshold=DIFF_THRESHOLD, hash_threshold=HASH_THRESHOLD,
+                 size=(64, 48), max_skip=None):
+        if method not in ('diff', 'hash', 'both'):
+            raise ValueError(f"Unknown gate method '{method}'")
+        self.method = method
+        self.diff_threshold = diff_threshold
+        self.hash_threshold = hash_threshold
+        self.size = size
+        self.max_skip = max_skip
+        self._reference = None
+        self._reference_hash = None
+        self._last_result = None
+        self._since_inference = 0
+        self._lock = threading.Lock()
+        self.inferred = 0
+        self.skipped = 0
+
+    def changed(self, frame):
+        if self._reference is None:
+            return True
+        if self.max_skip is not None and self._since_inference >= self.max_skip:
+            return True
+        if self.method in ('diff', 'both'):
+            if np.abs(_small_grey(frame, self.size) - self._reference).mean() > self.diff_threshold:
+                return True
+        if self.method in ('hash', 'both'):
+            if bin(dhash(frame) ^ self._reference_hash).count('1') > self.hash_threshold:
+                return True
+        return False
+
+    def classify(self, frame, infer_fn):
+        """Return infer_fn(frame), or the previous result when the scene has not changed."""
+        with self._lock:
+            if not self.changed(frame):
+                self.skipped += 1
+                self._since_inference += 1
+                return self._last_result
+        result = infer_fn(frame)
+        with self._lock:
+            self._reference = _small_grey(frame, self.size)
+            self._reference_hash = dhash(frame)
+            self._last_result = result
+            self._since_inference = 0
+            self.inferred += 1
+        return result
+
+    def reset(self):
+        """Infer the next frame whatever it looks like, e.g. when a new item has arrived."""
+        with self._lock:
+            self._reference = None
+            self._reference_hash = None
+
+    def stats(self):
+        total = self.inferred + self.skipped
+        return {
+            'inferred': self.inferred,
+            'skipped': self.skipped,
+            'skip_ratio': self.skipped / total if total else 0.0,
+        }
@@ -0,0 +1,136 @@
+import io
+import os
+
+from PIL import Image
+
+from .metrics import metrics
+
+# Largest upload accepted, in bytes (the Node server's JSON limit is 10 MB of base64)
+MAX_UPLOAD_BYTES = int(os.environ.get('SORTYX_MAX_UPLOAD_BYTES', 10 * 1024 * 1024))
+# Largest image accepted, in pixels; checked from the header before anything is decoded
+MAX_PIXELS = int(os.environ.get('SORTYX_MAX_PIXELS', 40_000_000))
+MIN_SIDE = int(os.environ.get('SORTYX_MIN_IMAGE_SIDE', 32))
+CHUNK_SIZE = 64 * 1024
+MULTIPART_OVERHEAD = 64 * 1024
+
+# Leading bytes of the formats PIL is allowed to open here
+SIGNATURES = {
+    b'\xff\xd8\xff': 'JPEG',
+    b'\x89PNG\r\n\x1a\n': 'PNG',
+    b'RIFF': 'WEBP',
+    b'BM': 'BMP',
+}
+RAW_CONTENT_TYPES = ('image/jpeg', 'image/png', 'image/webp', 'image/bmp', 'application/octet-stream')
+
+REJECTED = metrics.counter('sortyx_uploads_rejected_total', 'Uploads rejected before inference, by reason',
+                           ['reason'])
+
+
+class ClassifyError(ValueError):
+    """Request that cannot be classified; adapters answer with .status and the message."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def reject(reason, message, status=400):
+    REJECTED.inc(reason=reason)
+    return ClassifyError(message, status)
+
+
+def is_raw_image(content_type):
+    """Whether a request body is the image itself rather than a multipart form."""
+    return (content_type or '').split(';')[0].strip().lower() in RAW_CONTENT_TYPES
+
+
+def check_content_length(content_length, max_bytes=MAX_UPLOAD_BYTES, multipart=False):
+    """Reject from the Content-Length header alone, before any of the body is read."""
+    if multipart:
+        # Boundaries and part headers; the file itself is checked again while it is read
+        max_bytes += MULTIPART_OVERHEAD
+    if content_length is not None and content_length > max_bytes:
+        raise reject('too_large', f'Upload too large: {content_length} > {max_bytes} bytes', 413)
+
+
+def read_body(stream, content_length=None, max_bytes=MAX_UPLOAD_BYTES):
+    """Read a body from a file-like object, stopping as soon as it passes max_bytes."""
+    check_content_length(content_length, max_bytes)
+    buffer = io.BytesIO()
+    while True:
+        chunk = stream.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        buffer.write(chunk)
+        if buffer.tell() > max_bytes:
+            raise reject('too_large', f'Upload too large: more than {max_bytes} bytes', 413)
+    return buffer.getvalue()
+
+
+async def read_body_chunks(chunks, content_length=None, max_bytes=MAX_UPLOAD_BYTES):
+    """read_body for an async iterator of byte chunks (an ASGI request body)."""
+    check_content_length(content_length, max_bytes)
+    buffer = io.BytesIO()
+    async for chunk in chunks:
+        buffer.write(chunk)
+        if buffer.tell() > max_bytes:
+            raise reject('too_large', f'Upload too large: more than {max_bytes} bytes', 413)
+    return buffer.getvalue()
+
+
+def read_stream(stream, content_length=None, max_bytes=MAX_UPLOAD_BYTES):
+    """One uploaded image from a file-like object, with the size and format checks."""
+    return check_bytes(read_body(stream, content_length, max_bytes))
+
+
+async def read_chunks(chunks, content_length=None, max_bytes=MAX_UPLOAD_BYTES):
+    """read_stream for an async iterator of byte chunks (an ASGI request body)."""
+    return check_bytes(await read_body_chunks(chunks, content_length, max_bytes))
+
+
+def read_upload(request, field='image'):
+    """Upload bytes from a Flask request: the multipart file field, or the whole body when it
+    is the image itself (Content-Type image/* or application/octet-stream). None if absent.
+
+    Oversized requests are turned away on Content-Length before the form is parsed.
+    """
+    if is_raw_image(request.content_type):
+        return read_stream(request.stream, request.content_length)
+    check_content_length(request.content_length, multipart=True)
+    upload = request.files.get(field)
+    return read_stream(upload.stream) if upload is not None else None
+
+
+def check_bytes(data):
+    """Reject empty uploads and anything that does not start like a supported image."""
+    if not data:
+        raise reject('empty', 'Empty upload')
+    if not any(data.startswith(signature) for signature in SIGNATURES):
+        raise reject('format', 'Unsupported image format; send JPEG, PNG, WebP or BMP', 415)
+    if data.startswith(b'RIFF') and data[8:12] != b'WEBP':
+        raise reject('format', 'Unsupported image format; send JPEG, PNG, WebP or BMP', 415)
+    return data
+
+
+def decode_image(data, size, max_pixels=MAX_PIXELS):
+    """Upload bytes -> RGB image whose longer side is at most size.
+
+    The header is checked against the pixel limits before decoding. JPEGs are decoded by
+    draft() straight to RGB at the largest 1/2, 1/4 or 1/8 reduction that still covers
+    size, so a 12 MP phone photo never exists in memory at full resolution. Uploads already
+    resized to size or less are only converted to RGB.
+    """
+    check_bytes(data)
+    try:
+        image = Image.open(io.BytesIO(data))
+        width, height = image.size
+        if width * height > max_pixels:
+            raise reject('too_many_pixels', f'Image too large: {width}x{height} is more than {max_pixels} pixels', 413)
+        if min(width, height) < MIN_SIDE:
+            raise reject('too_small', f'Image too small: {width}x{height}, need at least {MIN_SIDE} pixels a side')
+        if image.format == 'JPEG':
+            image.draft('RGB', (size, size))
+        image.thumbnail((size, size))
+        return image if image.mode == 'RGB' else image.convert('RGB')
+    except (OSError, SyntaxError, Image.DecompressionBombError) as e:
+        raise reject('invalid', f'Invalid image: {e}')
@@ -0,0 +1,296 @@
+import argparse
+import atexit
+import json
+import os
+import re
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from .llm import llm
+
+# Prompt used by the classify servers; {label} is the YOLO class name
+PROMPT_TEMPLATE = "Give a waste disposal instruction and category for '{label}'. Also say confidence level (0-100%)"
+LLM_MODEL = os.environ.get('SORTYX_LLM_MODEL', 'llama3.2:latest')
+# One prompt for every object in a photo, answered in the format webapp/server/index.js parses
+COMPONENTS_TEMPLATE = (
+    "These objects were detected in one photo of waste: {labels}.\n"
+    "Classify each object into exactly one of these categories: Recyclable Waste, Hazardous Waste, "
+    "Solid Waste, Organic Waste. Medical and sharp objects are always Hazardous Waste.\n"
+    "Give a short disposal instruction for each object.\n\n"
+    "Format the response exactly as:\n"
+    "Components: [the objects, in the same order, separated by semicolons]\n"
+    "Categories: [category for each object, in the same order, separated by semicolons]\n"
+    "Reasons: [disposal instruction for each object, in the same order, separated by semicolons]"
+)
+CACHE_PATH = os.environ.get('SORTYX_INSTRUCTION_CACHE')  # unset keeps the cache in memory only
+CACHE_TTL = float(os.environ.get('SORTYX_INSTRUCTION_TTL', 7 * 24 * 3600))
+# Seconds new entries wait to be written to the cache file, so a burst of them costs one write
+CACHE_SAVE_DELAY = float(os.environ.get('SORTYX_INSTRUCTION_SAVE_S', 5))
+
+
+def _field(text, name):
+    match = re.search(rf'^\W*{name}\W*:(.*)$', text, re.IGNORECASE | re.MULTILINE)
+    return [part.strip() for part in match.group(1).split(';')] if match else []
+
+
+def parse_components(text, labels):
+    """{label: {'category', 'reason'}} from a COMPONENTS_TEMPLATE answer; unanswered labels are left out.
+
+    Components are matched to labels by name, falling back to their position in the list.
+    """
+    names, categories, reasons = (_field(text, name) for name in ('Components', 'Categories', 'Reasons'))
+    positions = {name.lower(): i for i, name in enumerate(names)}
+    parsed = {}
+    for index, label in enumerate(labels):
+        i = positions.get(label.lower(), index)
+        if i < len(categories) and categories[i]:
+            parsed[label] = {'category': categories[i], 'reason': reasons[i] if i < len(reasons) else ''}
+    return parsed
+
+
+class InstructionCache:
+    """LRU/TTL cache of LLM disposal instructions keyed by (label, prompt template, model).
+
+    Misses go through the process-wide LLM pool (model.llm) unless other functions are given;
+    its LLMUnavailable errors reach the caller and nothing is cached for them.
+    """
+
+    def __init__(self, generate_fn=llm.generate, model_name=LLM_MODEL, max_entries=256,
+                 ttl=CACHE_TTL, path=CACHE_PATH, stream_fn=llm.stream, save_delay=CACHE_SAVE_DELAY):
+        self.generate_fn = generate_fn
+        self.stream_fn = stream_fn
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self.save_delay = save_delay
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._after_fork()
+        self.hits = 0
+        self.misses = 0
+        if path:
+            self._load()
+            ref = weakref.ref(self)
+            atexit.register(lambda: ref() is not None and ref().flush())
+            # Fresh locks and save timer in forked workers (see model/serving.py)
+            if hasattr(os, 'register_at_fork'):
+                os.register_at_fork(after_in_child=lambda: ref() is not None and ref()._after_fork())
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._save_timer = None
+        self._dirty = False
+
+    def _key(self, label, template):
+        return (label.strip().lower(), template, self.model_name)
+
+    def _expired(self, created):
+        return self.ttl is not None and time.time() - created > self.ttl
+
+    def _claim(self, key):
+        # Returns (cached content, in-flight future, whether this caller owns the LLM call)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and not self._expired(entry[1]):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0], None, False
+            self.misses += 1
+            # Concurrent misses for the same key wait on the first caller's LLM call
+            future = self._inflight.get(key)
+            if future is not None:
+                return None, future, False
+            future = Future()
+            self._inflight[key] = future
+            return None, future, True
+
+    def _release(self, key, future, content=None, error=None):
+        with self._lock:
+            del self._inflight[key]
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(content)
+
+    def get(self, label, template=PROMPT_TEMPLATE):
+        key = self._key(label, template)
+        content, future, owner = self._claim(key)
+        if content is not None:
+            return content
+        if not owner:
+            return future.result()
+
+        try:
+            content = self.generate_fn(template.format(label=label), self.model_name)
+        except Exception as e:
+            self._release(key, future, error=e)
+            raise
+        self.put(label, content, template)
+        self._release(key, future, content)
+        return content
+
+    def get_many(self, labels, template=COMPONENTS_TEMPLATE):
+        """{label: {'category', 'reason'}} for every label; all uncached labels share one LLM call.
+
+        Each answer is cached per label, so the next photo only asks about objects not seen before.
+        """
+        results, owned, waiting = {}, {}, {}
+        for label in dict.fromkeys(labels):
+            key = self._key(label, template)
+            content, future, owner = self._claim(key)
+            if content is not None:
+                results[label] = content
+            elif owner:
+                owned[label] = (key, future)
+            else:
+                waiting[label] = future
+
+        if owned:
+            try:
+                prompt = template.format(labels='; '.join(owned))
+                parsed = parse_components(self.generate_fn(prompt, self.model_name), list(owned))
+            except Exception as e:
+                for key, future in owned.values():
+                    self._release(key, future, error=e)
+                raise
+            for label, (key, future) in owned.items():
+                content = parsed.get(label)
+                # Labels the LLM skipped are not cached, so the next photo asks again
+                if content is not None:
+                    self.put(label, content, template)
+                else:
+                    content = {'category': 'unknown', 'reason': ''}
+                self._release(key, future, content)
+                results[label] = content
+        for label, future in waiting.items():
+            results[label] = future.result()
+        return results
+
+    def stream(self, label, template=PROMPT_TEMPLATE):
+        """Yield the instruction in chunks as the LLM produces them; cached labels come back whole."""
+        key = self._key(label, template)
+        content, future, owner = self._claim(key)
+        if content is not None:
+            yield content
+            return
+        if not owner:
+            yield future.result()
+            return
+
+        parts = []
+        try:
+            for chunk in self.stream_fn(template.format(label=label), self.model_name):
+                parts.append(chunk)
+                yield chunk
+        except BaseException as e:
+            # Includes GeneratorExit when the client disconnects mid-stream
+            self._release(key, future, error=e if isinstance(e, Exception) else RuntimeError('Stream aborted'))
+            raise
+        content = ''.join(parts)
+        self.put(label, content, template)
+        self._release(key, future, content)
+
+    def put(self, label, content, template=PROMPT_TEMPLATE, created=None):
+        key = self._key(label, template)
+        with self._lock:
+            self._entries[key] = (content, created if created is not None else time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            if self.path:
+                self._dirty = True
+                if self._save_timer is None:
+                    self._save_timer = threading.Timer(self.save_delay, self.flush)
+                    self._save_timer.daemon = True
+                    self._save_timer.start()
+
+    def warm_up(self, labels, template=PROMPT_TEMPLATE, batch_size=16):
+        """Fill the cache for every label, skipping the ones already cached.
+
+        Templates with {labels} are asked batch_size labels at a time.
+        """
+        if '{labels}' in template:
+            labels = list(labels)
+            for i in range(0, len(labels), batch_size):
+                self.get_many(labels[i:i + batch_size], template)
+        else:
+            for label in labels:
+                self.get(label, template)
+        self.flush()
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses,
+                    'inflight': len(self._inflight)}
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                records = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable instruction cache {self.path}: {e}")
+            return
+        for record in records:
+            if not self._expired(record['created']):
+                key = (record['label'], record['template'], record['model'])
+                self._entries[key] = (record['content'], record['created'])
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def flush(self):
+        """Write the cache file now if entries changed since the last write. The file is
+        written from a snapshot, so lookups only wait for the copy, not for the disk."""
+        if not self.path:
+            return
+        with self._save_lock:
+            with self._lock:
+                self._save_timer = None
+                if not self._dirty:
+                    return
+                self._dirty = False
+                records = [{'label': k[0], 'template': k[1], 'model': k[2], 'content': v[0], 'created': v[1]}
+                           for k, v in self._entries.items()]
+            # Write to a temp file first so a crash never leaves a half-written cache
+            # (per process, so forked server workers never write the same temp file)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            try:
+                with open(tmp_path, 'w') as f:
+                    json.dump(records, f)
+                os.replace(tmp_path, self.path)
+            except OSError as e:
+                print(f"Could not write instruction cache {self.path}: {e}")
+                with self._lock:
+                    self._dirty = True
+
+def main():
+    parser = argparse.ArgumentParser(description='Pre-generate disposal instructions for every label.')
+    parser.add_argument('--store', default=CACHE_PATH or 'instruction_cache.json', help='cache file to fill')
+    parser.add_argument('--weights', help='YOLO weights whose class names are warmed up')
+    parser.add_argument('--labels', nargs='*', default=[], help='extra labels to warm up')
+    parser.add_argument('--llm', default=LLM_MODEL, help='Ollama model name')
+    parser.add_argument('--template', default=PROMPT_TEMPLATE, help='prompt template with {label}')
+    parser.add_argument('--components', action='store_true',
+                        help='warm the batched per-component answers (COMPONENTS_TEMPLATE) instead')
+    args = parser.parse_args()
+    if args.components:
+        args.template = COMPONENTS_TEMPLATE
+
+    labels = list(args.labels)
+    if args.weights:
+        from ultralytics import YOLO
+        labels += list(YOLO(args.weights).names.values())
+    cache = InstructionCache(model_name=args.llm, path=args.store, ttl=None, max_entries=max(256, len(labels)))
+    start = time.perf_counter()
+    cache.warm_up(labels, args.template)
+    print(f"Warmed {len(labels)} labels into {args.store} in {time.perf_counter() - start:.1f}s {cache.stats()}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+import json
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from .instructions import PROMPT_TEMPLATE
+
+JOB_WORKERS = int(os.environ.get('SORTYX_INSTRUCTION_WORKERS', 4))
+
+
+class InstructionJob:
+    """Disposal instruction being generated in the background for one classify request."""
+
+    def __init__(self, label):
+        self.id = uuid.uuid4().hex
+        self.label = label
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self._cond = threading.Condition()
+
+    def append(self, chunk):
+        with self._cond:
+            self.chunks.append(chunk)
+            self._cond.notify_all()
+
+    def finish(self, error=None):
+        with self._cond:
+            self.done = True
+            self.error = error
+            self._cond.notify_all()
+
+    def wait(self, timeout=None):
+        with self._cond:
+            self._cond.wait_for(lambda: self.done, timeout)
+        return self.done
+
+    def to_dict(self):
+        with self._cond:
+            return {
+                'jobId': self.id,
+                'label': self.label,
+                'status': 'error' if self.error else ('done' if self.done else 'pending'),
+                'instruction': ''.join(self.chunks),
+                'error': str(self.error) if self.error else None,
+            }
+
+    def follow(self, timeout=None):
+        """Yield chunks as they arrive until the job finishes."""
+        sent = 0
+        while True:
+            with self._cond:
+                if not self._cond.wait_for(lambda: self.done or len(self.chunks) > sent, timeout):
+                    raise TimeoutError('Instruction generation timed out')
+                new = self.chunks[sent:]
+                done = self.done
+            sent += len(new)
+            yield from new
+            if done:
+                if self.error:
+                    raise self.error
+                return
+
+
+class InstructionJobs:
+    """Runs instruction generation off the request thread so the label can be returned first."""
+
+    def __init__(self, cache, workers=JOB_WORKERS, max_jobs=1000):
+        self.cache = cache
+        self.max_jobs = max_jobs
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='instruction')
+
+    def submit(self, label, template=PROMPT_TEMPLATE):
+        job = InstructionJob(label)
+        with self._lock:
+            self._jobs[job.id] = job
+            while len(self._jobs) > self.max_jobs:
+                self._jobs.popitem(last=False)
+        self._executor.submit(self._run, job, template)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _run(self, job, template):
+        try:
+            for chunk in self.cache.stream(job.label, template):
+                job.append(chunk)
+        except Exception as e:
+            job.finish(e)
+        else:
+            job.finish()
+
+
+def sse_events(chunks):
+    """Format instruction chunks as Server-Sent Events, ending with a 'done' or 'error' event."""
+    try:
+        for chunk in chunks:
+            yield f"data: {json.dumps({'chunk': chunk})}\n\n"
+    except Exception as e:
+        yield f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n"
+        return
+    yield "event: done\ndata: {}\n\n"
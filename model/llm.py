@@ -0,0 +1,205 @@
+import hashlib
+import os
+import re
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from .metrics import metrics
+
+# 'ollama' (default) or 'stub', a deterministic in-process backend for tests and benchmarks
+BACKEND = os.environ.get('SORTYX_LLM_BACKEND', 'ollama')
+# Generations running at once per process; Ollama serialises them anyway, so extra ones only wait there
+LLM_WORKERS = int(os.environ.get('SORTYX_LLM_WORKERS', 2))
+# Callers allowed to wait for a free worker before new ones are turned away (degraded answers)
+LLM_MAX_QUEUE = int(os.environ.get('SORTYX_LLM_MAX_QUEUE', 8))
+# Seconds a caller waits for a worker plus the generation itself
+LLM_TIMEOUT = float(os.environ.get('SORTYX_LLM_TIMEOUT', 30))
+STUB_LATENCY = float(os.environ.get('SORTYX_LLM_STUB_LATENCY_MS', 0)) / 1000
+
+LLM_REQUESTS = metrics.counter('sortyx_llm_requests_total', 'LLM calls by outcome (ok, timeout, saturated, error)',
+                               ['outcome'])
+
+
+class LLMUnavailable(RuntimeError):
+    """The LLM did not answer in time or is saturated; callers answer without an explanation."""
+
+
+class LLMSaturated(LLMUnavailable):
+    pass
+
+
+class LLMTimeout(LLMUnavailable):
+    pass
+
+
+_client = None
+
+
+def _ollama():
+    # One HTTP client per process (it reads OLLAMA_HOST); its timeout backs up the pool's deadline
+    global _client
+    if _client is None:
+        import ollama
+        _client = ollama.Client(timeout=LLM_TIMEOUT)
+    return _client
+
+
+def ollama_generate(prompt, model_name):
+    response = _ollama().chat(model=model_name, messages=[{'role': 'user', 'content': prompt}])
+    return response['message']['content']
+
+
+def ollama_stream(prompt, model_name):
+    for part in _ollama().chat(model=model_name, messages=[{'role': 'user', 'content': prompt}], stream=True):
+        yield part['message']['content']
+
+
+# Deterministic stand-in: the same prompt always gets the same answer, in the formats the servers parse
+
+STUB_CATEGORIES = ['Recyclable', 'Organic', 'Hazardous', 'General waste']
+STUB_COMPONENT_CATEGORIES = ['Recyclable Waste', 'Hazardous Waste', 'Solid Waste', 'Organic Waste']
+
+
+def _digest(text):
+    return int(hashlib.sha256(text.encode()).hexdigest(), 16)
+
+
+def stub_components_answer(labels):
+    """Answer to the batched per-component prompt; each label's category depends only on the label."""
+    categories = [STUB_COMPONENT_CATEGORIES[_digest(label) % len(STUB_COMPONENT_CATEGORIES)] for label in labels]
+    return (f"Components: {'; '.join(labels)}\n"
+            f"Categories: {'; '.join(categories)}\n"
+            f"Reasons: {'; '.join(f'Put the {label} with {c.lower()}' for label, c in zip(labels, categories))}")
+
+
+def stub_answer(prompt):
+    """Same prompt, same answer: the category and confidence come from a hash of the prompt."""
+    batched = re.search(r'detected in one photo of waste: (.*)\.\n', prompt)
+    if batched:
+        return stub_components_answer([label.strip() for label in batched.group(1).split(';')])
+    match = re.search(r"'([^']+)'", prompt)
+    label = match.group(1) if match else 'item'
+    digest = _digest(prompt)
+    category = STUB_CATEGORIES[digest % len(STUB_CATEGORIES)]
+    confidence = 60 + digest % 40
+    return (f"Dispose of the {label} as {category}. Rinse it if needed and keep it separate from other waste. "
+            f"Category: {category}. Confidence level: {confidence}%")
+
+
+def stub_generate(prompt, model_name):
+    time.sleep(STUB_LATENCY)
+    return stub_answer(prompt)
+
+
+def stub_stream(prompt, model_name):
+    answer = stub_generate(prompt, model_name)
+    size = max(1, len(answer) // 8 + 1)
+    for i in range(0, len(answer), size):
+        yield answer[i:i + size]
+
+
+BACKENDS = {'ollama': (ollama_generate, ollama_stream), 'stub': (stub_generate, stub_stream)}
+
+
+class LLMPool:
+    """Bounded access to the LLM shared by everything in a process.
+
+    At most `workers` generations run at once and at most `max_queue` callers wait for one;
+    anyone beyond that gets LLMSaturated right away. Every call has a deadline covering the
+    wait and the generation, after which it gets LLMTimeout. Both are LLMUnavailable, which
+    the classify responses turn into a category without an explanation.
+    """
+
+    def __init__(self, backend=BACKEND, workers=LLM_WORKERS, max_queue=LLM_MAX_QUEUE, timeout=LLM_TIMEOUT):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown LLM backend '{backend}'")
+        self.backend = backend
+        self.generate_fn, self.stream_fn = BACKENDS[backend]
+        self.workers = max(1, workers)
+        self.max_queue = max(0, max_queue)
+        self.timeout = timeout
+        self._after_fork()
+        # Fresh locks and threads in forked workers (see model/serving.py)
+        if hasattr(os, 'register_at_fork'):
+            ref = weakref.ref(self)
+            os.register_at_fork(after_in_child=lambda: ref() is not None and ref()._after_fork())
+
+    def _after_fork(self):
+        self.running = 0
+        self.waiting = 0
+        self._cond = threading.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='llm')
+
+    def _acquire(self, deadline):
+        with self._cond:
+            if self.running >= self.workers and self.waiting >= self.max_queue:
+                LLM_REQUESTS.inc(outcome='saturated')
+                raise LLMSaturated(f'LLM saturated: {self.running} running, {self.waiting} waiting')
+            self.waiting += 1
+            try:
+                if not self._cond.wait_for(lambda: self.running < self.workers, deadline - time.monotonic()):
+                    LLM_REQUESTS.inc(outcome='timeout')
+                    raise LLMTimeout(f'No LLM worker free within {self.timeout:.0f}s')
+            finally:
+                self.waiting -= 1
+            self.running += 1
+
+    def _release(self):
+        with self._cond:
+            self.running -= 1
+            self._cond.notify()
+
+    def _run(self, prompt, model_name):
+        try:
+            return self.generate_fn(prompt, model_name)
+        finally:
+            self._release()
+
+    def generate(self, prompt, model_name, timeout=None):
+        deadline = time.monotonic() + (timeout or self.timeout)
+        self._acquire(deadline)
+        # A generation still running at the deadline is left to finish on its worker and keeps
+        # its slot until then, so a stalled LLM saturates the pool instead of piling up more work
+        future = self._executor.submit(self._run, prompt, model_name)
+        try:
+            content = future.result(timeout=max(0.0, deadline - time.monotonic()))
+        except TimeoutError:
+            LLM_REQUESTS.inc(outcome='timeout')
+            raise LLMTimeout(f'LLM did not answer within {self.timeout:.0f}s') from None
+        except Exception:
+            LLM_REQUESTS.inc(outcome='error')
+            raise
+        LLM_REQUESTS.inc(outcome='ok')
+        return content
+
+    def stream(self, prompt, model_name, timeout=None):
+        """Yield chunks on the caller's thread; the deadline is checked between chunks."""
+        deadline = time.monotonic() + (timeout or self.timeout)
+        self._acquire(deadline)
+        try:
+            for chunk in self.stream_fn(prompt, model_name):
+                yield chunk
+                if time.monotonic() > deadline:
+                    LLM_REQUESTS.inc(outcome='timeout')
+                    raise LLMTimeout(f'LLM did not finish within {self.timeout:.0f}s')
+        except LLMTimeout:
+            raise
+        except Exception:
+            LLM_REQUESTS.inc(outcome='error')
+            raise
+        else:
+            LLM_REQUESTS.inc(outcome='ok')
+        finally:
+            self._release()
+
+    def stats(self):
+        with self._cond:
+            return {'backend': self.backend, 'workers': self.workers, 'running': self.running,
+                    'waiting': self.waiting, 'max_queue': self.max_queue, 'timeout_s': self.timeout}
+
+
+llm = LLMPool()
+metrics.gauge('sortyx_llm_queue_depth', 'Callers waiting for an LLM worker', lambda: llm.stats()['waiting'])
+metrics.gauge('sortyx_llm_running', 'LLM generations running', lambda: llm.stats()['running'])
@@ -0,0 +1,244 @@
+import bisect
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Content type of the Prometheus text exposition format served on /metrics
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+# Seconds; covers everything from a resize to a slow LLM answer
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Set to 1 to also open an OpenTelemetry span per stage (pip install opentelemetry-sdk and configure an exporter)
+TRACING = os.environ.get('SORTYX_TRACING', '0') == '1'
+# Port for the standalone /metrics server used by the edge loops; 0 disables it
+METRICS_PORT = int(os.environ.get('SORTYX_METRICS_PORT', 0))
+
+_tracer = None
+if TRACING:
+    try:
+        from opentelemetry import trace
+        _tracer = trace.get_tracer('sortyx')
+    except ImportError:
+        print('SORTYX_TRACING=1 but opentelemetry is not installed, tracing disabled')
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Counter:
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}')
+        return lines
+
+
+class Gauge:
+    """Value read from a callback at scrape time, e.g. a queue depth."""
+
+    def __init__(self, name, help, fn):
+        self.name = name
+        self.help = help
+        self.fn = fn
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} gauge']
+        try:
+            lines.append(f'{self.name} {_format_value(self.fn())}')
+        except Exception:
+            pass  # a broken callback must not break the whole scrape
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # Per-bucket counts plus the +Inf bucket, then the running sum
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for key, (counts, total) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float('inf'),), counts):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, key, [("le", le)])} {cumulative}')
+                labels = _format_labels(self.labelnames, key)
+                lines.append(f'{self.name}_sum{labels} {repr(total)}')
+                lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _add(self, metric):
+        with self._lock:
+            # Re-registering by name returns the existing metric, so modules can share one
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, help, labelnames=()):
+        return self._add(Counter(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(name, help, labelnames, buckets))
+
+    def gauge(self, name, help, fn):
+        with self._lock:
+            # A gauge's callback is replaced, it points at the newest object
+            self._metrics[name] = Gauge(name, help, fn)
+            return self._metrics[name]
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+metrics = MetricsRegistry()
+
+STAGE_SECONDS = metrics.histogram('sortyx_stage_seconds', 'Time spent in each classify stage',
+                                  ['service', 'stage'])
+REQUESTS = metrics.counter('sortyx_requests_total', 'Classify requests by endpoint, label and outcome',
+                           ['service', 'endpoint', 'label', 'outcome'])
+
+
+@contextmanager
+def span(name, **attributes):
+    """OpenTelemetry span when SORTYX_TRACING=1, otherwise nothing."""
+    if _tracer is None:
+        yield None
+        return
+    with _tracer.start_as_current_span(name, attributes=attributes) as current:
+        yield current
+
+
+# Per-request {stage: ms} of the current context, set by collect_stages()
+_collected = contextvars.ContextVar('sortyx_stages', default=None)
+
+
+@contextmanager
+def collect_stages():
+    """Gather the stages timed in this context into a {stage: ms} dict, e.g. for the event log."""
+    stages = {}
+    token = _collected.set(stages)
+    try:
+        yield stages
+    finally:
+        _collected.reset(token)
+
+
+@contextmanager
+def stage(service, name):
+    """Time one stage of a request into sortyx_stage_seconds (and a span when tracing)."""
+    with span(f'{service}.{name}'):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            record_stage(service, name, time.perf_counter() - start)
+
+
+def record_stage(service, name, seconds):
+    STAGE_SECONDS.observe(seconds, service=service, stage=name)
+    stages = _collected.get()
+    if stages is not None:
+        stages[name] = stages.get(name, 0.0) + seconds * 1000
+
+
+def outcome_for_status(status):
+    if status < 400:
+        return 'ok'
+    if status in (429, 503):
+        return 'overloaded'
+    return 'rejected' if status < 500 else 'error'
+
+
+def count_request(service, endpoint, label='', outcome='ok'):
+    REQUESTS.inc(service=service, endpoint=endpoint, label=label or '', outcome=outcome)
+
+
+def render():
+    return metrics.render()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_metrics(port=METRICS_PORT, host='0.0.0.0'):
+    """Serve /metrics from a daemon thread, for processes without their own web server."""
+    if not port:
+        return None
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+    print(f"Metrics on http://{host}:{port}/metrics")
+    return server
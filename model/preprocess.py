@@ -0,0 +1,202 @@
+import argparse
+import glob
+import math
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from .batching import MAX_BATCH_SIZE, percentile
+
+# Square input of the detector; uploads are decoded with their longer side at most this
+INPUT_SIZE = 640
+# Grey used by ultralytics to pad letterboxed images
+PAD_VALUE = 114
+LETTERBOX = 'letterbox'
+CROP = 'crop'
+
+
+def _array(image):
+    """(H x W x 3 uint8 array, whether it is BGR). Arrays are OpenCV frames, anything else a PIL image."""
+    if isinstance(image, np.ndarray):
+        return image, True
+    return np.asarray(image.convert('RGB') if image.mode != 'RGB' else image), False
+
+
+def fit(frame, size):
+    """Scale a frame so its longer side is size, keeping the aspect ratio (a client-side pre-resize)."""
+    h, w = frame.shape[:2]
+    r = size / max(h, w)
+    if r >= 1:
+        return frame
+    return cv2.resize(frame, (round(w * r), round(h * r)), interpolation=cv2.INTER_AREA)
+
+
+class Preprocessor:
+    """Images or camera frames -> the exact input tensor of a YOLO model, one resize per image.
+
+    mode='letterbox' (detectors) scales each image to fit imgsz and pads it with grey, as
+    ultralytics' LetterBox does; a batch is padded only to the stride multiple that fits its
+    largest image. mode='crop' (classifiers) takes the centre square and scales it to imgsz,
+    which is what ultralytics' resize-then-centre-crop produces, in a single resample.
+
+    The float32 batch tensor is written into a buffer allocated once and reused by every
+    call; predict() holds a lock until the model is done with it.
+    """
+
+    def __init__(self, imgsz=INPUT_SIZE, mode=LETTERBOX, max_batch=MAX_BATCH_SIZE, stride=32):
+        if mode not in (LETTERBOX, CROP):
+            raise ValueError(f"Unknown preprocessing mode '{mode}'")
+        self.imgsz = imgsz
+        self.mode = mode
+        self.stride = stride
+        self._buffer = np.empty(max(1, max_batch) * 3 * imgsz * imgsz, dtype=np.float32)
+        self._lock = threading.Lock()
+
+    def _tensor(self, n, h, w):
+        # A contiguous (n, 3, h, w) view of the buffer's start; grows once for oversized batches
+        size = n * 3 * h * w
+        if size > self._buffer.size:
+            self._buffer = np.empty(size, dtype=np.float32)
+        return self._buffer[:size].reshape(n, 3, h, w)
+
+    def _letterbox_shapes(self, arrays):
+        shapes = []
+        for array, _ in arrays:
+            h, w = array.shape[:2]
+            r = min(self.imgsz / h, self.imgsz / w)
+            shapes.append((r, round(h * r), round(w * r)))
+        # Padded to the stride like ultralytics' auto mode, and never beyond imgsz
+        height = min(self.imgsz, math.ceil(max(s[1] for s in shapes) / self.stride) * self.stride)
+        width = min(self.imgsz, math.ceil(max(s[2] for s in shapes) / self.stride) * self.stride)
+        return shapes, height, width
+
+    def __call__(self, images):
+        """(N x 3 x H x W float32 RGB tensor in [0, 1], per-image geometry for restore())."""
+        arrays = [_array(image) for image in images]
+        if self.mode == CROP:
+            tensor = self._tensor(len(arrays), self.imgsz, self.imgsz)
+            geometry = []
+            for i, (array, bgr) in enumerate(arrays):
+                h, w = array.shape[:2]
+                side = min(h, w)
+                top, left = (h - side) // 2, (w - side) // 2
+                # Cropping is a view; the resize is the only pass over the pixels before the copy below
+                crop = cv2.resize(array[top:top + side, left:left + side], (self.imgsz, self.imgsz),
+                                  interpolation=cv2.INTER_LINEAR)
+                np.multiply(crop[:, :, ::-1] if bgr else crop, 1 / 255, out=tensor[i].transpose(1, 2, 0))
+                geometry.append((self.imgsz / side, -left, -top, h, w))
+            return tensor, geometry
+
+        shapes, height, width = self._letterbox_shapes(arrays)
+        tensor = self._tensor(len(arrays), height, width)
+        pad = PAD_VALUE / 255
+        geometry = []
+        for i, ((array, bgr), (r, nh, nw)) in enumerate(zip(arrays, shapes)):
+            h, w = array.shape[:2]
+            if (nh, nw) != (h, w):
+                array = cv2.resize(array, (nw, nh), interpolation=cv2.INTER_LINEAR)
+            dh, dw = (height - nh) / 2, (width - nw) / 2
+            top, left = round(dh - 0.1), round(dw - 0.1)
+            # Only the borders are filled; the image is written once, scaled to [0, 1] and
+            # flipped to RGB by the same operation
+            out = tensor[i]
+            out[:, :top] = pad
+            out[:, top + nh:] = pad
+            out[:, top:top + nh, :left] = pad
+            out[:, top:top + nh, left + nw:] = pad
+            np.multiply(array[:, :, ::-1] if bgr else array, 1 / 255,
+                        out=out[:, top:top + nh, left:left + nw].transpose(1, 2, 0))
+            geometry.append((r, left, top, h, w))
+        return tensor, geometry
+
+    def predict(self, model, images, **kwargs):
+        """Run a YOLO model on images through this preprocessing; results refer to the original images.
+
+        result.speed['preprocess'] includes the time spent here, per image like ultralytics reports it.
+        """
+        import torch
+        with self._lock:
+            start = time.perf_counter()
+            tensor, geometry = self(images)
+            elapsed = (time.perf_counter() - start) * 1000 / max(1, len(images))
+            results = model(torch.from_numpy(tensor), verbose=False, **kwargs)
+        for result, image, shape in zip(results, images, geometry):
+            restore(result, image, shape)
+            if result.speed.get('preprocess') is not None:
+                result.speed['preprocess'] += elapsed
+        return results
+
+
+def restore(result, image, geometry):
+    """Map a result computed on the preprocessed tensor back onto the original image."""
+    r, left, top, h, w = geometry
+    array, bgr = _array(image)
+    result.orig_shape = (h, w)
+    result.orig_img = array if bgr else array[:, :, ::-1]
+    if result.boxes is not None and len(result.boxes):
+        data = result.boxes.data.clone()
+        data[:, [0, 2]] -= left
+        data[:, [1, 3]] -= top
+        data[:, :4] /= r
+        result.update(boxes=data)
+
+
+def ultralytics_preprocess(images, imgsz=640, stride=32):
+    """What the predictor does with NumPy input: LetterBox per image, stack, flip, scale."""
+    import torch
+    from ultralytics.data.augment import LetterBox
+    arrays = [_array(image)[0] for image in images]
+    same_shapes = len({a.shape for a in arrays}) == 1
+    letterbox = LetterBox((imgsz, imgsz), auto=same_shapes, stride=stride)
+    batch = np.stack([letterbox(image=a) for a in arrays])
+    batch = np.ascontiguousarray(batch[..., ::-1].transpose((0, 3, 1, 2)))
+    return torch.from_numpy(batch).float() / 255
+
+
+def _time(fn, images, runs):
+    fn(images)
+    wall, cpu = [], []
+    for _ in range(runs):
+        start, start_cpu = time.perf_counter(), time.process_time()
+        fn(images)
+        wall.append((time.perf_counter() - start) * 1000 / len(images))
+        cpu.append((time.process_time() - start_cpu) * 1000 / len(images))
+    return {'wall_ms_per_image': percentile(wall, 50), 'cpu_ms_per_image': percentile(cpu, 50)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Per-image CPU time of the old resize paths against Preprocessor.')
+    parser.add_argument('--images', default='app/test', help='directory of sample images')
+    parser.add_argument('--imgsz', type=int, default=640)
+    parser.add_argument('--batch', type=int, default=8)
+    parser.add_argument('--runs', type=int, default=20)
+    args = parser.parse_args()
+
+    paths = sorted(p for p in glob.glob(os.path.join(args.images, '*')) if p.lower().endswith(('.jpg', '.jpeg', '.png')))
+    if not paths:
+        parser.error(f'No images in {args.images}')
+    frames = [cv2.imread(p) for p in paths]
+    frames = [frames[i % len(frames)] for i in range(args.batch)]
+    preprocessor = Preprocessor(args.imgsz, max_batch=args.batch)
+    candidates = {
+        # app/server before: PIL stretch to a square, then ultralytics letterboxes again
+        'stretch+letterbox': lambda batch: ultralytics_preprocess(
+            [cv2.resize(f, (args.imgsz, args.imgsz)) for f in batch], args.imgsz),
+        # camera_capture before: resize to 640x480, then ultralytics letterboxes
+        'resize+letterbox': lambda batch: ultralytics_preprocess([cv2.resize(f, (640, 480)) for f in batch], args.imgsz),
+        'ultralytics': lambda batch: ultralytics_preprocess(batch, args.imgsz),
+        'preprocess': lambda batch: preprocessor(batch),
+    }
+    report = {name: _time(fn, frames, args.runs) for name, fn in candidates.items()}
+    base = report['stretch+letterbox']['cpu_ms_per_image']
+    print(f"{'path':<20}{'wall ms':>10}{'cpu ms':>10}{'saved':>10}")
+    for name, entry in report.items():
+        print(f"{name:<20}{entry['wall_ms_per_image']:>10.2f}{entry['cpu_ms_per_image']:>10.2f}"
+              f"{base - entry['cpu_ms_per_image']:>+10.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+import hmac
+import os
+import threading
+import time
+
+from .detector import load_model
+
+# Load models on a background thread at startup instead of blocking import
+BACKGROUND_LOAD = os.environ.get('SORTYX_BACKGROUND_LOAD', '1') == '1'
+# Model swaps over HTTP must send it in the X-Admin-Token header; unset turns swaps off
+ADMIN_TOKEN = os.environ.get('SORTYX_ADMIN_TOKEN')
+# Swaps may only load weights from files in this directory (loading a .pt file unpickles it)
+WEIGHTS_DIR = os.environ.get('SORTYX_WEIGHTS_DIR', './model')
+
+LOADING = 'loading'
+READY = 'ready'
+FAILED = 'failed'
+NOT_LOADED = 'not_loaded'
+
+
+def admin_allowed(token):
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(token or '', ADMIN_TOKEN)
+
+
+def resolve_weights(name, directory=WEIGHTS_DIR):
+    """Path of a weights file named relative to the weights directory. Raises ValueError
+    for anything outside it (absolute paths, '..', symlinks out) or not a file."""
+    root = os.path.realpath(directory)
+    path = os.path.realpath(os.path.join(root, name))
+    if os.path.isabs(name) or os.path.commonpath([root, path]) != root:
+        raise ValueError(f'Weights must be a file in {directory}')
+    if not os.path.isfile(path):
+        raise ValueError(f'No weights file {name} in {directory}')
+    return path
+
+
+def warm_up(model, imgsz):
+    """Run one inference on a blank image so the first real request does not pay for it."""
+    import numpy as np
+    model(np.zeros((imgsz, imgsz, 3), dtype=np.uint8), imgsz=imgsz, verbose=False)
+
+
+class ModelHandle:
+    def __init__(self, name, path, loader, imgsz, warmup):
+        self.name = name
+        self.path = path
+        self.loader = loader
+        self.imgsz = imgsz
+        self.warmup = warmup
+        self.model = None
+        self.state = NOT_LOADED
+        self.error = None
+        self.version = 0
+        self.load_ms = None
+        self.swapping_to = None
+        self.ready_event = threading.Event()
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'path': self.path,
+            'state': self.state,
+            'version': self.version,
+            'load_ms': self.load_ms,
+            'swapping_to': self.swapping_to,
+            'error': self.error,
+        }
+
+
+class ModelRegistry:
+    """Named models loaded lazily or in the background, warmed up before they report ready,
+    and swappable to new weights without interrupting requests already running on the old ones."""
+
+    def __init__(self, loader=load_model):
+        self.loader = loader
+        self._handles = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, path, background=BACKGROUND_LOAD, imgsz=640, loader=None, warmup=warm_up):
+        handle = ModelHandle(name, path, loader or self.loader, imgsz, warmup)
+        with self._lock:
+            self._handles[name] = handle
+        if background:
+            self._start_load(handle)
+        return handle
+
+    def _load(self, handle, path):
+        start = time.perf_counter()
+        model = handle.loader(path, handle.imgsz)
+        if handle.warmup:
+            handle.warmup(model, handle.imgsz)
+        return model, (time.perf_counter() - start) * 1000
+
+    def _start_load(self, handle):
+        with self._lock:
+            if handle.state != NOT_LOADED:
+                return
+            handle.state = LOADING
+        threading.Thread(target=self._load_initial, args=(handle,), name=f'load-{handle.name}', daemon=True).start()
+
+    def _load_initial(self, handle):
+        try:
+            model, load_ms = self._load(handle, handle.path)
+        except Exception as e:
+            handle.state, handle.error = FAILED, str(e)
+            print(f"Failed to load model '{handle.name}' from {handle.path}: {e}")
+        else:
+            with self._lock:
+                handle.model, handle.load_ms, handle.state, handle.version = model, load_ms, READY, 1
+            print(f"Model '{handle.name}' ready from {handle.path} in {load_ms:.0f}ms")
+        handle.ready_event.set()
+
+    def get(self, name, timeout=None):
+        """Return the current model, loading it on first use if it was registered lazily."""
+        handle = self._handles[name]
+        if handle.state == READY:
+            return handle.model
+        if handle.state == NOT_LOADED:
+            self._start_load(handle)
+        if not handle.ready_event.wait(timeout):
+            raise TimeoutError(f"Model '{name}' is still loading")
+        if handle.state != READY:
+            raise RuntimeError(f"Model '{name}' failed to load: {handle.error}")
+        return handle.model
+
+    def swap(self, name, path, wait=False):
+        """Load and warm up new weights next to the current ones, then switch atomically.
+
+        Callers that already hold the old model keep using it until they finish.
+        """
+        handle = self._handles[name]
+        with self._lock:
+            if handle.swapping_to:
+                raise RuntimeError(f"Model '{name}' is already swapping to {handle.swapping_to}")
+            handle.swapping_to = path
+
+        def run():
+            try:
+                model, load_ms = self._load(handle, path)
+            except Exception as e:
+                with self._lock:
+                    handle.swapping_to = None
+                    handle.error = f"Swap to {path} failed: {e}"
+                print(handle.error)
+                return
+            with self._lock:
+                handle.model, handle.path, handle.load_ms = model, path, load_ms
+                handle.version += 1
+                handle.state, handle.error, handle.swapping_to = READY, None, None
+            handle.ready_event.set()
+            print(f"Model '{name}' swapped to {path} (version {handle.version})")
+
+        thread = threading.Thread(target=run, name=f'swap-{name}', daemon=True)
+        thread.start()
+        if wait:
+            thread.join()
+        return handle
+
+    def wait_ready(self, timeout=None):
+        """Load every registered model (lazy ones too) and block until all are ready."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for name in list(self._handles):
+            self.get(name, None if deadline is None else max(0.0, deadline - time.monotonic()))
+
+    def ready(self):
+        with self._lock:
+            return bool(self._handles) and all(h.state == READY for h in self._handles.values())
+
+    def status(self):
+        with self._lock:
+            return {name: handle.to_dict() for name, handle in self._handles.items()}
+
+
+# One registry per process, shared by everything that imports it
+registry = ModelRegistry()
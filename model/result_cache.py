@@ -0,0 +1,130 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+RESULT_CACHE_URL = os.environ.get('SORTYX_RESULT_CACHE_URL')  # e.g. redis://localhost:6379/0, unset = in-process
+RESULT_CACHE_TTL = float(os.environ.get('SORTYX_RESULT_CACHE_TTL', 3600))
+RESULT_CACHE_MAX_BYTES = int(os.environ.get('SORTYX_RESULT_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+RESULT_CACHE_PHASH = os.environ.get('SORTYX_RESULT_CACHE_PHASH', '0') == '1'
+
+
+class LocalStore:
+    """In-process stand-in for the shared store: LRU bounded by total size, with per-entry TTL."""
+
+    def __init__(self, max_bytes=RESULT_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires is not None and time.time() > expires:
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, time.time() + ttl if ttl else None)
+            self.size += len(value)
+            while self.size > self.max_bytes and self._entries:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key):
+        value, _ = self._entries.pop(key)
+        self.size -= len(value)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class RedisStore:
+    """Shared store so every worker and server sees the same cached results."""
+
+    def __init__(self, url, prefix='sortyx:result:'):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        return value.decode() if value is not None else None
+
+    def set(self, key, value, ttl=None):
+        self.client.set(self.prefix + key, value, ex=int(ttl) if ttl else None)
+
+
+def make_store(url=RESULT_CACHE_URL):
+    if url and url.startswith('redis://'):
+        return RedisStore(url)
+    return LocalStore()
+
+
+class ResultCache:
+    """Classify responses keyed by the SHA-256 of the uploaded bytes, and optionally by a
+    perceptual hash of the decoded image so re-encoded copies of the same photo also hit."""
+
+    def __init__(self, store=None, ttl=RESULT_CACHE_TTL, use_phash=RESULT_CACHE_PHASH, namespace=''):
+        self.store = store if store is not None else make_store()
+        self.ttl = ttl
+        self.use_phash = use_phash
+        # Servers returning different response shapes must not share entries in a shared store
+        self.namespace = namespace
+        self.hits = 0
+        self.phash_hits = 0
+        self.misses = 0
+
+    def _bytes_key(self, data, variant=''):
+        return f"{self.namespace}{variant}sha256:{hashlib.sha256(data).hexdigest()}"
+
+    def _phash_key(self, image, variant=''):
+        from .gating import dhash
+        import numpy as np
+        return f"{self.namespace}{variant}dhash:{dhash(np.asarray(image.convert('L'))):016x}"
+
+    def get(self, data, variant=''):
+        """Cached response for these exact upload bytes, or None."""
+        value = self.store.get(self._bytes_key(data, variant))
+        if value is None:
+            return None
+        self.hits += 1
+        return json.loads(value)
+
+    def get_similar(self, image, variant=''):
+        """Cached response for a perceptually identical image; call after get() missed."""
+        value = self.store.get(self._phash_key(image, variant)) if self.use_phash else None
+        if value is None:
+            self.misses += 1
+            return None
+        self.phash_hits += 1
+        return json.loads(value)
+
+    def set(self, data, response, image=None, variant=''):
+        value = json.dumps(response)
+        self.store.set(self._bytes_key(data, variant), value, self.ttl)
+        if self.use_phash and image is not None:
+            self.store.set(self._phash_key(image, variant), value, self.ttl)
+
+    def stats(self):
+        lookups = self.hits + self.phash_hits + self.misses
+        stats = {
+            'backend': type(self.store).__name__,
+            'hits': self.hits,
+            'phash_hits': self.phash_hits,
+            'misses': self.misses,
+            'hit_ratio': (self.hits + self.phash_hits) / lookups if lookups else 0.0,
+        }
+        if isinstance(self.store, LocalStore):
+            stats.update(entries=len(self.store), bytes=self.store.size)
+        return stats
@@ -0,0 +1,152 @@
+from flask import Request, Response, jsonify, render_template, request, stream_with_context
+
+from .bulk import BULK_MAX_BYTES, BulkRequestError, ndjson_lines, read_bulk_upload
+from .engine import ClassifyError, components_response, explained_components_response, split_response
+from .events import DEVICE_HEADER
+from .ingest import MAX_UPLOAD_BYTES, MULTIPART_OVERHEAD, read_upload
+from .jobs import sse_events
+from .metrics import CONTENT_TYPE, render
+from .registry import admin_allowed, registry, resolve_weights
+
+
+class UploadRequest(Request):
+    """Request whose body werkzeug stops reading past the route's upload limit, chunked
+    bodies without a Content-Length included, before a multipart form is buffered."""
+
+    # Endpoints that take more than one image's worth of body
+    body_limits = {'classify_bulk_images': BULK_MAX_BYTES}
+    # Non-file form fields kept in memory
+    max_form_memory_size = MULTIPART_OVERHEAD
+
+    @property
+    def max_content_length(self):
+        return self.body_limits.get(self.endpoint, MAX_UPLOAD_BYTES) + MULTIPART_OVERHEAD
+
+
+def register_routes(app, engine):
+    """Routes every Flask server has: the index page, health, model swaps, metrics and stats.
+    Also caps request bodies (see UploadRequest)."""
+    app.request_class = UploadRequest
+
+    @app.errorhandler(413)
+    def too_large(e):
+        return jsonify({'error': 'Upload too large'}), 413
+
+    @app.route('/')
+    def home():
+        return render_template('index.html')
+
+    @app.route('/health/live')
+    def health_live():
+        return jsonify({'status': 'ok'})
+
+    @app.route('/health/ready')
+    def health_ready():
+        ready = registry.ready()
+        return jsonify({'ready': ready, 'models': registry.status()}), 200 if ready else 503
+
+    @app.route('/admin/models/<name>', methods=['POST'])
+    def swap_model(name):
+        # Body: {"path": "new_weights.pt"}, a file in SORTYX_WEIGHTS_DIR; the old weights keep
+        # serving until the new ones are warm
+        if not admin_allowed(request.headers.get('X-Admin-Token')):
+            return jsonify({'error': 'Forbidden'}), 403
+        path = (request.get_json(silent=True) or {}).get('path')
+        if not path or not isinstance(path, str):
+            return jsonify({'error': 'Missing "path"'}), 400
+        try:
+            handle = registry.swap(name, resolve_weights(path))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        except KeyError:
+            return jsonify({'error': f'Unknown model {name}'}), 404
+        except RuntimeError as e:
+            return jsonify({'error': str(e)}), 409
+        return jsonify(handle.to_dict()), 202
+
+    @app.route('/metrics')
+    def prometheus_metrics():
+        return Response(render(), content_type=CONTENT_TYPE)
+
+    @app.route('/stats/batching')
+    def batching_stats():
+        return jsonify(engine.scheduler.stats())
+
+    @app.route('/stats/llm')
+    def llm_stats():
+        return jsonify(engine.llm.stats())
+
+    @app.route('/stats/events')
+    def event_stats():
+        # ?hours=24&device=bin-3: per-hour category counts and stage latency percentiles from the event log
+        return jsonify(engine.events.summary(request.args.get('hours', 24, type=float), request.args.get('device')))
+
+    @app.route('/stats/instructions')
+    def instruction_stats():
+        return jsonify(engine.instructions.stats())
+
+    @app.route('/stats/results')
+    def result_cache_stats():
+        return jsonify(engine.result_cache.stats())
+
+
+def register_component_routes(app, engine):
+    """The components API of the app and webapp servers: /classify, /classify/bulk and the
+    instruction jobs that split mode hands out."""
+
+    @app.route('/instruction/<job_id>')
+    def instruction_status(job_id):
+        job = engine.jobs.get(job_id)
+        if job is None:
+            return jsonify({'error': 'Unknown instruction job'}), 404
+        # Optional long-poll: ?wait=5 blocks up to 5 seconds for the instruction to finish
+        wait = request.args.get('wait', type=float)
+        if wait:
+            job.wait(min(wait, 30))
+        return jsonify(job.to_dict())
+
+    @app.route('/instruction/<job_id>/stream')
+    def instruction_stream(job_id):
+        job = engine.jobs.get(job_id)
+        if job is None:
+            return jsonify({'error': 'Unknown instruction job'}), 404
+        return Response(stream_with_context(sse_events(job.follow(timeout=60))),
+                        mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
+    @app.route('/classify/bulk', methods=['POST'])
+    def classify_bulk_images():
+        # Many images per request: multipart "images" files (zip archives allowed), a zip body or NDJSON of base64
+        try:
+            files, body = read_bulk_upload(request)
+            records = engine.classify_bulk(files, request.content_type, body, request.headers.get(DEVICE_HEADER))
+        except (BulkRequestError, ClassifyError) as e:
+            return jsonify({'error': str(e)}), e.status
+        return Response(stream_with_context(ndjson_lines(records)), mimetype='application/x-ndjson')
+
+    @app.route('/classify', methods=['POST'])
+    def classify_image():
+        # A multipart "image" file, or the image itself as the body; size limits apply while reading
+        try:
+            data = read_upload(request, 'image')
+        except ClassifyError as e:
+            return jsonify({'error': str(e)}), e.status
+        if data is None:
+            return jsonify({'error': 'No image uploaded'}), 400
+
+        # Every detected object is a component with its box and category from the category index;
+        # ?explain=1 adds the LLM's disposal reason for each one.
+        # Split mode answers with the detection right away; the instruction follows by job id or SSE
+        split = request.args.get('mode') == 'split'
+        explain = request.args.get('explain') in ('1', 'true')
+        if split:
+            postprocess, variant = split_response, 'split:'
+        elif explain:
+            postprocess, variant = explained_components_response, 'explain:'
+        else:
+            postprocess, variant = components_response, ''
+        try:
+            response = engine.classify(data, postprocess, store=not split, variant=variant,
+                                       device=request.headers.get(DEVICE_HEADER))
+        except ClassifyError as e:
+            return jsonify({'error': str(e)}), e.status
+        return jsonify(response)
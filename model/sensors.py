@@ -0,0 +1,274 @@
+import argparse
+import glob
+import json
+import os
+import random
+import threading
+import time
+
+from .metrics import metrics
+
+# 'simulated', 'gpio', or the path of a replay file (JSON lines, see ReplaySource)
+SENSOR_SOURCE = os.environ.get('SORTYX_SENSOR_SOURCE', 'simulated')
+# An item has arrived once the proximity reading stays below this (cm) for the debounce time...
+ARRIVAL_CM = float(os.environ.get('SORTYX_ARRIVAL_CM', 20))
+# ...and has left once it stays above this; the gap keeps a reading near the edge from flapping
+DEPARTURE_CM = float(os.environ.get('SORTYX_DEPARTURE_CM', 30))
+DEBOUNCE_MS = float(os.environ.get('SORTYX_SENSOR_DEBOUNCE_MS', 100))
+# Seconds between reads; with an interrupt-capable source the idle interval applies until an edge wakes the loop
+POLL_INTERVAL = float(os.environ.get('SORTYX_SENSOR_POLL_MS', 25)) / 1000
+IDLE_INTERVAL = float(os.environ.get('SORTYX_SENSOR_IDLE_MS', 1000)) / 1000
+# HC-SR04 trigger and echo pins (BCM numbering) for the gpio source
+PROXIMITY_PINS = tuple(int(p) for p in os.environ.get('SORTYX_PROXIMITY_PINS', '23,24').split(','))
+
+SENSOR_EVENTS = metrics.counter('sortyx_sensor_events_total',
+                                'Proximity events: arrival, departure, and bounce (too short to count)', ['event'])
+
+ARRIVAL = 'arrival'
+DEPARTURE = 'departure'
+
+
+class SimulatedSource:
+    """Seeded stand-in for the bin's sensors: an empty chute with noise, and an item arriving
+    every few seconds, including single-read glitches the debounce has to reject."""
+
+    def __init__(self, seed=0, empty_cm=80.0, item_cm=10.0, arrival_every_s=4.0, dwell_s=1.5, glitch_rate=0.01):
+        self.random = random.Random(seed)
+        self.empty_cm = empty_cm
+        self.item_cm = item_cm
+        self.arrival_every_s = arrival_every_s
+        self.dwell_s = dwell_s
+        self.glitch_rate = glitch_rate
+        self.start = time.monotonic()
+
+    def read(self):
+        elapsed = time.monotonic() - self.start
+        present = elapsed % self.arrival_every_s > self.arrival_every_s - self.dwell_s
+        proximity = (self.item_cm if present else self.empty_cm) + self.random.gauss(0, 1.5)
+        if self.random.random() < self.glitch_rate:
+            proximity = self.item_cm if not present else self.empty_cm
+        return {'proximity': round(proximity, 1),
+                'temperature': round(24 + 2 * ((elapsed / 600) % 1) + self.random.gauss(0, 0.1), 1),
+                'humidity': round(50 + self.random.gauss(0, 0.5), 1)}
+
+
+class ReplaySource:
+    """Plays back recorded readings in real time (or speed times faster).
+
+    One JSON object per line: {"t": seconds since the start, "proximity": cm, ...}; lines
+    starting with # are comments. read() returns the last line whose t has passed.
+    """
+
+    def __init__(self, path, speed=1.0, loop=True):
+        self.records = []
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith('#'):
+                    self.records.append(json.loads(line))
+        if not self.records:
+            raise ValueError(f'{path}: no sensor readings')
+        self.records.sort(key=lambda r: r['t'])
+        self.duration = self.records[-1]['t']
+        self.speed = speed
+        self.loop = loop
+        self.index = 0
+        self.start = time.monotonic()
+        self.finished = False
+
+    def read(self):
+        elapsed = (time.monotonic() - self.start) * self.speed
+        if self.loop and self.duration > 0 and elapsed > self.duration:
+            # Restart from the top without a jump back in time for whoever is reading
+            self.start += self.duration / self.speed
+            elapsed -= self.duration
+            self.index = 0
+        while self.index + 1 < len(self.records) and self.records[self.index + 1]['t'] <= elapsed:
+            self.index += 1
+        self.finished = not self.loop and elapsed > self.duration
+        return {k: v for k, v in self.records[self.index].items() if k != 't'}
+
+
+class GPIOSource:
+    """HC-SR04 ultrasonic distance sensor through gpiozero, plus a DS18B20 1-wire thermometer
+    when one is attached (pip install gpiozero; enable 1-wire in raspi-config).
+
+    gpiozero times the echo on its own thread and calls back when an object crosses the
+    arrival distance, so the monitor can sleep between edges instead of polling fast.
+    """
+
+    def __init__(self, trigger_pin=PROXIMITY_PINS[0], echo_pin=PROXIMITY_PINS[1], arrival_cm=ARRIVAL_CM):
+        from gpiozero import DistanceSensor
+        self.sensor = DistanceSensor(echo=echo_pin, trigger=trigger_pin, max_distance=2,
+                                     threshold_distance=arrival_cm / 100)
+        thermometers = glob.glob('/sys/bus/w1/devices/28-*/w1_slave')
+        self.thermometer = thermometers[0] if thermometers else None
+
+    def attach(self, wake):
+        # Edge interrupts: wake the monitor as soon as something enters or leaves range
+        self.sensor.when_in_range = wake
+        self.sensor.when_out_of_range = wake
+        return True
+
+    def _temperature(self):
+        with open(self.thermometer) as f:
+            lines = f.read().splitlines()
+        if len(lines) < 2 or not lines[0].endswith('YES'):
+            return None
+        return round(int(lines[1].rsplit('t=', 1)[1]) / 1000, 1)
+
+    def read(self):
+        values = {'proximity': round(self.sensor.distance * 100, 1)}
+        if self.thermometer:
+            values['temperature'] = self._temperature()
+        return values
+
+    def close(self):
+        self.sensor.close()
+
+
+def open_source(spec=SENSOR_SOURCE):
+    if spec == 'simulated':
+        return SimulatedSource()
+    if spec == 'gpio':
+        return GPIOSource()
+    return ReplaySource(spec)
+
+
+class SensorMonitor:
+    """Reads a sensor source on a background thread and reports item arrivals.
+
+    An arrival is the proximity reading staying below arrival_cm for debounce_ms; the item
+    must then stay above departure_cm for debounce_ms before the next arrival can fire, so
+    each item triggers exactly one capture. on_event(event, values) is called from the
+    monitor thread for 'arrival' and 'departure'; on_reading(values) at most every
+    report_interval seconds, for displays. Qt apps should pass signals' emit.
+
+    Sources with attach() deliver edge interrupts: the monitor reads every idle_interval
+    while the chute is quiet and every poll_interval only around an edge.
+    """
+
+    def __init__(self, source, on_event, on_reading=None, arrival_cm=ARRIVAL_CM, departure_cm=DEPARTURE_CM,
+                 debounce_ms=DEBOUNCE_MS, poll_interval=POLL_INTERVAL, idle_interval=IDLE_INTERVAL,
+                 report_interval=0.5):
+        self.source = source
+        self.on_event = on_event
+        self.on_reading = on_reading
+        self.arrival_cm = arrival_cm
+        self.departure_cm = max(departure_cm, arrival_cm)
+        self.debounce = debounce_ms / 1000
+        self.poll_interval = poll_interval
+        self.idle_interval = idle_interval
+        self.report_interval = report_interval
+        self.present = False
+        self.values = {}
+        self.arrivals = 0
+        self.bounces = 0
+        self.errors = 0
+        self._changing_since = None
+        self._last_report = 0.0
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._interrupts = False
+        self._thread = threading.Thread(target=self._run, name='sensors', daemon=True)
+
+    def start(self):
+        attach = getattr(self.source, 'attach', None)
+        self._interrupts = bool(attach and attach(self._wake.set))
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        self._thread.join(timeout=2)
+        close = getattr(self.source, 'close', None)
+        if close:
+            close()
+
+    def update(self, values, now):
+        """Feed one reading; returns 'arrival', 'departure' or None. Used by the thread and by replays."""
+        self.values = values
+        proximity = values.get('proximity')
+        if proximity is None:
+            return None
+        crossing = proximity > self.departure_cm if self.present else proximity < self.arrival_cm
+        if not crossing:
+            if self._changing_since is not None:
+                # Went back before the debounce time: a glitch or a hand passing by
+                self.bounces += 1
+                SENSOR_EVENTS.inc(event='bounce')
+            self._changing_since = None
+            return None
+        if self._changing_since is None:
+            self._changing_since = now
+        if now - self._changing_since < self.debounce:
+            return None
+        self._changing_since = None
+        self.present = not self.present
+        event = ARRIVAL if self.present else DEPARTURE
+        if self.present:
+            self.arrivals += 1
+        SENSOR_EVENTS.inc(event=event)
+        return event
+
+    def _interval(self):
+        if self._interrupts and self._changing_since is None:
+            return self.idle_interval
+        return self.poll_interval
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                values = self.source.read()
+            except Exception as e:
+                self.errors += 1
+                print(f"Sensor read failed: {e}")
+                self._stop.wait(self.idle_interval)
+                continue
+            now = time.monotonic()
+            event = self.update(values, now)
+            if event:
+                self.on_event(event, values)
+            if self.on_reading and now - self._last_report >= self.report_interval:
+                self._last_report = now
+                self.on_reading(values)
+            if self._wake.wait(self._interval()):
+                self._wake.clear()
+
+    def stats(self):
+        return {'arrivals': self.arrivals, 'bounces': self.bounces, 'errors': self.errors,
+                'present': self.present, 'interrupts': self._interrupts, 'values': self.values}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Print arrival events from a sensor source, or record a replay file.')
+    parser.add_argument('--source', default=SENSOR_SOURCE, help="'simulated', 'gpio' or a replay file")
+    parser.add_argument('--seconds', type=float, default=20)
+    parser.add_argument('--record', help='also write every reading to this replay file')
+    args = parser.parse_args()
+
+    start = time.monotonic()
+    record = open(args.record, 'w', encoding='utf-8') if args.record else None
+
+    def on_reading(values):
+        if record:
+            record.write(json.dumps({'t': round(time.monotonic() - start, 3), **values}) + '\n')
+
+    def on_event(event, values):
+        print(f"{time.monotonic() - start:8.2f}s {event:<10} {values}")
+
+    monitor = SensorMonitor(open_source(args.source), on_event, on_reading,
+                            report_interval=0 if record else 0.5).start()
+    try:
+        time.sleep(args.seconds)
+    except KeyboardInterrupt:
+        pass
+    monitor.stop()
+    if record:
+        record.close()
+    print(monitor.stats())
+
+
+if __name__ == '__main__':
+    main()
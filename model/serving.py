@@ -0,0 +1,110 @@
+import argparse
+import gc
+import importlib.util
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# name: (file, WSGI/ASGI variable, gunicorn worker class, default bind)
+APPS = {
+    'server': ('app/server/app.py', 'app', 'gthread', '0.0.0.0:5000'),
+    'webapp': ('webapp/server/app.py', 'app', 'gthread', '0.0.0.0:5001'),
+    'app': ('app.py', 'app', 'gthread', '0.0.0.0:5001'),
+    'api': ('api/yolov8n_api.py', 'app', 'uvicorn.workers.UvicornWorker', '0.0.0.0:8000'),
+}
+# Inference threads per worker; with the default worker count, workers x threads = cores
+WORKER_THREADS = int(os.environ.get('SORTYX_WORKER_THREADS', 2))
+WORKERS = int(os.environ.get('SORTYX_WORKERS', 0))  # 0 = cores // SORTYX_WORKER_THREADS
+# Request threads per gthread worker; they queue on the worker's batch scheduler
+HTTP_THREADS = int(os.environ.get('SORTYX_HTTP_THREADS', 8))
+READY_TIMEOUT = float(os.environ.get('SORTYX_READY_TIMEOUT', 300))
+
+THREAD_ENV = ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'NUMEXPR_NUM_THREADS')
+
+
+def default_workers(threads=WORKER_THREADS):
+    return max(1, (os.cpu_count() or 1) // max(1, threads))
+
+
+def limit_threads(threads):
+    """Cap the intra-op threads of the numeric libraries in this process."""
+    for name in THREAD_ENV:
+        os.environ[name] = str(threads)
+    # Libraries already imported have read the environment; tell them directly
+    if 'torch' in sys.modules:
+        sys.modules['torch'].set_num_threads(threads)
+    if 'cv2' in sys.modules:
+        sys.modules['cv2'].setNumThreads(threads)
+
+
+def load_app(name):
+    """Import an entry point by file under a unique module name (several of them are called app.py)."""
+    path, attribute = APPS[name][:2]
+    spec = importlib.util.spec_from_file_location(f'sortyx_{name}_app', os.path.join(ROOT, path))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return getattr(module, attribute)
+
+
+# Workers fork from the preloaded master and inherit everything built at import: the batch
+# schedulers, the LLM pool, the event store. Their threads do not come along (only the forking
+# thread exists in a child), and a lock held by another thread at fork time stays held forever.
+# So each of those objects registers an os.register_at_fork hook that gives the child fresh
+# locks, queues and threads.
+def preload(timeout=READY_TIMEOUT):
+    """Load and warm every registered model, then freeze the heap before workers fork."""
+    from .registry import registry
+    registry.wait_ready(timeout)
+    # Objects that survive to here are never collected; keeping the GC off them stops it from
+    # writing to their pages in every worker, which would undo the copy-on-write sharing
+    gc.collect()
+    gc.freeze()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve a classify app with preloaded, forked gunicorn workers.')
+    parser.add_argument('app', choices=sorted(APPS))
+    parser.add_argument('--bind', help='address:port (default depends on the app)')
+    parser.add_argument('--workers', type=int, default=WORKERS, help='0 = cores // --threads')
+    parser.add_argument('--threads', type=int, default=WORKER_THREADS, help='inference threads per worker')
+    parser.add_argument('--http-threads', type=int, default=HTTP_THREADS, help='request threads per Flask worker')
+    parser.add_argument('--timeout', type=int, default=120, help='seconds before a silent worker is restarted')
+    args = parser.parse_args()
+
+    from gunicorn.app.base import BaseApplication
+
+    # Torch stays single-threaded in the master: an OpenMP pool created before fork is not
+    # usable in the children. Workers raise it to --threads after forking.
+    limit_threads(1)
+    worker_threads = max(1, args.threads)
+    _, _, worker_class, default_bind = APPS[args.app]
+    options = {
+        'bind': args.bind or default_bind,
+        'workers': args.workers or default_workers(worker_threads),
+        'worker_class': worker_class,
+        'threads': args.http_threads,
+        'timeout': args.timeout,
+        'preload_app': True,
+        'when_ready': lambda server: server.log.info(
+            f'{args.app}: {server.cfg.workers} workers x {worker_threads} inference threads'),
+        'post_fork': lambda server, worker: limit_threads(worker_threads),
+    }
+
+    class Application(BaseApplication):
+        def load_config(self):
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            # Runs once in the master because of preload_app
+            app = load_app(args.app)
+            preload()
+            return app
+
+    Application().run()
+
+
+if __name__ == '__main__':
+    main()
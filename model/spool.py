@@ -0,0 +1,147 @@
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+SPOOL_DIR = os.environ.get('SORTYX_SPOOL_DIR', os.path.expanduser('~/.sortyx/spool'))
+SPOOL_MAX_BYTES = int(os.environ.get('SORTYX_SPOOL_MAX_BYTES', 200 * 1024 * 1024))
+SPOOL_MAX_FILES = int(os.environ.get('SORTYX_SPOOL_MAX_FILES', 5000))
+
+
+class Spool:
+    """Bounded on-disk queue of captures waiting for the network.
+
+    Each entry is an image file plus a JSON sidecar with its metadata. When the spool is
+    full the oldest captures are dropped, so a long outage cannot fill the SD card.
+    The directory is listed once, when the spool is opened; after that the entries and
+    their sizes are tracked in memory, so put() and stats() never touch the directory.
+    """
+
+    def __init__(self, directory=SPOOL_DIR, max_bytes=SPOOL_MAX_BYTES, max_files=SPOOL_MAX_FILES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self.dropped = 0
+        self.flushed = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        # Oldest first; names start with a zero-padded timestamp
+        names = sorted(name[:-5] for name in os.listdir(directory) if name.endswith('.json'))
+        self._sizes = OrderedDict((entry, self._size(entry)) for entry in names)
+        self._bytes = sum(self._sizes.values())
+
+    def put(self, data, meta=None):
+        entry = f"{time.time_ns():020d}-{uuid.uuid4().hex[:8]}"
+        with self._lock:
+            with open(os.path.join(self.directory, entry + '.jpg'), 'wb') as f:
+                f.write(data)
+            # The sidecar is written last, so an entry only counts once its image is complete
+            with open(os.path.join(self.directory, entry + '.json'), 'w') as f:
+                json.dump(meta or {}, f)
+            self._sizes[entry] = len(data)
+            self._bytes += len(data)
+            self._enforce_limits()
+        return entry
+
+    def _enforce_limits(self):
+        while self._sizes and (len(self._sizes) > self.max_files or self._bytes > self.max_bytes):
+            self._remove(next(iter(self._sizes)))
+            self.dropped += 1
+
+    def _size(self, entry):
+        try:
+            return os.path.getsize(os.path.join(self.directory, entry + '.jpg'))
+        except OSError:
+            return 0
+
+    def _remove(self, entry):
+        self._bytes -= self._sizes.pop(entry, 0)
+        for extension in ('.json', '.jpg'):
+            try:
+                os.remove(os.path.join(self.directory, entry + extension))
+            except FileNotFoundError:
+                pass
+
+    def __len__(self):
+        return len(self._sizes)
+
+    def flush(self, send_batch, batch_size=16):
+        """Send spooled captures oldest first. send_batch([(data, meta), ...]) returns one
+        truthy value per item for those delivered; flushing stops at the first batch with a failure.
+        Entries that can no longer be read (missing or corrupt files) are dropped."""
+        sent = 0
+        while True:
+            with self._lock:
+                batch = list(self._sizes)[:batch_size]
+            if not batch:
+                return sent
+            entries, items, unreadable = [], [], []
+            for entry in batch:
+                try:
+                    with open(os.path.join(self.directory, entry + '.jpg'), 'rb') as f:
+                        data = f.read()
+                    with open(os.path.join(self.directory, entry + '.json')) as f:
+                        meta = json.load(f)
+                except (OSError, ValueError) as e:
+                    unreadable.append((entry, e))
+                    continue
+                entries.append(entry)
+                items.append((data, meta))
+            with self._lock:
+                for entry, e in unreadable:
+                    # Already gone if put() dropped it since the batch was taken
+                    if entry in self._sizes:
+                        print(f"Dropping unreadable spooled capture {entry}: {e}")
+                        self._remove(entry)
+                        self.dropped += 1
+            if not items:
+                continue
+            delivered = send_batch(items)
+            with self._lock:
+                for entry, ok in zip(entries, delivered):
+                    # Entries dropped by put() while the batch was being sent are already gone
+                    if ok and entry in self._sizes:
+                        self._remove(entry)
+                        sent += 1
+                        self.flushed += 1
+            if not delivered or not all(delivered):
+                return sent
+
+    def stats(self):
+        with self._lock:
+            return {'pending': len(self._sizes), 'bytes': self._bytes, 'flushed': self.flushed,
+                    'dropped': self.dropped}
+
+
+class SpoolFlusher:
+    """Background thread that retries the spool every interval seconds while it has entries."""
+
+    def __init__(self, spool, send_batch, interval=15.0, batch_size=16):
+        self.spool = spool
+        self.send_batch = send_batch
+        self.interval = interval
+        self.batch_size = batch_size
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='spool-flusher', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join(timeout=2)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            if not len(self.spool):
+                continue
+            try:
+                sent = self.spool.flush(self.send_batch, self.batch_size)
+            except Exception as e:
+                print(f"Spool flush failed: {e}")
+                continue
+            if sent:
+                print(f"Flushed {sent} spooled captures, {len(self.spool)} left")
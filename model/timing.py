@@ -0,0 +1,52 @@
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+from .metrics import record_stage
+
+
+class StageTimer:
+    """Rolling per-stage latency and frame rate for capture/inference loops.
+
+    With a service name every stage is also recorded in the sortyx_stage_seconds histogram.
+    """
+
+    def __init__(self, window=100, service=None):
+        self.window = window
+        self.service = service
+        self._stages = defaultdict(lambda: deque(maxlen=window))
+        self._frames = deque(maxlen=window)
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, (time.perf_counter() - start) * 1000)
+
+    def record(self, name, ms):
+        self._stages[name].append(ms)
+        if self.service:
+            record_stage(self.service, name, ms / 1000)
+
+    def tick(self):
+        """Mark the end of one frame."""
+        self._frames.append(time.perf_counter())
+
+    def fps(self):
+        if len(self._frames) < 2:
+            return 0.0
+        elapsed = self._frames[-1] - self._frames[0]
+        return (len(self._frames) - 1) / elapsed if elapsed > 0 else 0.0
+
+    def summary(self):
+        return {
+            'fps': self.fps(),
+            'stages_ms': {name: sum(values) / len(values) for name, values in self._stages.items() if values},
+        }
+
+    def report(self):
+        summary = self.summary()
+        stages = ', '.join(f"{name} {ms:.1f}ms" for name, ms in summary['stages_ms'].items())
+        return f"{summary['fps']:.1f} fps | {stages}"
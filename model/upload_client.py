@@ -0,0 +1,171 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .events import DEVICE_HEADER, DEVICE_ID
+
+CONNECT_TIMEOUT = float(os.environ.get('SORTYX_CONNECT_TIMEOUT', 3))
+READ_TIMEOUT = float(os.environ.get('SORTYX_READ_TIMEOUT', 10))
+UPLOAD_RETRIES = int(os.environ.get('SORTYX_UPLOAD_RETRIES', 2))
+UPLOAD_INFLIGHT = int(os.environ.get('SORTYX_UPLOAD_INFLIGHT', 2))
+# Server responses worth retrying; anything else is returned or raised straight away
+RETRY_STATUSES = (429, 502, 503, 504)
+
+
+class UploadError(RuntimeError):
+    pass
+
+
+class CircuitOpenError(UploadError):
+    pass
+
+
+class CircuitBreaker:
+    """Stops calling a failing server for reset_timeout seconds after failure_threshold
+    consecutive failures, then lets one trial request through (half-open)."""
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        return 'half_open' if time.monotonic() - self.opened_at >= self.reset_timeout else 'open'
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half_open' and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self.failures >= self.failure_threshold or self.opened_at is not None:
+                self.opened_at = time.monotonic()
+
+
+class UploadClient:
+    """Keep-alive client for posting frames to a classify endpoint.
+
+    Connections are pooled and reused, every request has connect/read timeouts, transient
+    failures are retried with exponential backoff, and a circuit breaker fails fast while the
+    server is down. submit() keeps up to max_inflight uploads running concurrently.
+    http2=True uses httpx (pip install httpx[http2]) to multiplex uploads on one connection.
+    """
+
+    def __init__(self, url, connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT, retries=UPLOAD_RETRIES,
+                 backoff=0.3, max_inflight=UPLOAD_INFLIGHT, breaker=None, http2=False, device=DEVICE_ID):
+        self.url = url
+        self.retries = retries
+        self.backoff = backoff
+        self.max_inflight = max_inflight
+        self.breaker = breaker or CircuitBreaker()
+        self.http2 = http2
+        if http2:
+            import httpx
+            self.session = httpx.Client(http2=True, timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+                                        limits=httpx.Limits(max_connections=max_inflight))
+            self._timeout = None
+            self._transient = (httpx.TransportError,)
+        else:
+            import requests
+            from requests.adapters import HTTPAdapter
+            self.session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_inflight)
+            self.session.mount('http://', adapter)
+            self.session.mount('https://', adapter)
+            self._timeout = (connect_timeout, read_timeout)
+            self._transient = (requests.ConnectionError, requests.Timeout)
+        # Names this bin in the server's event log
+        self.session.headers[DEVICE_HEADER] = device
+        self._executor = ThreadPoolExecutor(max_workers=max_inflight, thread_name_prefix='upload')
+        self._lock = threading.Lock()
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.rejected = 0
+
+    def _post(self, files):
+        kwargs = {'files': files}
+        if self._timeout is not None:
+            kwargs['timeout'] = self._timeout
+        return self.session.post(self.url, **kwargs)
+
+    def post_image(self, data, filename='image.jpg', content_type='image/jpeg'):
+        """Upload one image and return the server's JSON response."""
+        if not self.breaker.allow():
+            with self._lock:
+                self.rejected += 1
+            raise CircuitOpenError(f"{self.url} is unavailable, not sending for now")
+
+        files = {'image': (filename, data, content_type)}
+        last_error = None
+        # Every way out of the attempts records a result, so a half-open trial never stays taken
+        try:
+            for attempt in range(self.retries + 1):
+                if attempt:
+                    with self._lock:
+                        self.retried += 1
+                try:
+                    response = self._post(files)
+                except self._transient as e:
+                    last_error = UploadError(f"Upload failed: {e}")
+                    delay = self.backoff * 2 ** attempt
+                else:
+                    if response.status_code not in RETRY_STATUSES:
+                        break
+                    last_error = UploadError(f"Server returned {response.status_code}")
+                    retry_after = response.headers.get('Retry-After', '')
+                    delay = float(retry_after) if retry_after.isdigit() else self.backoff * 2 ** attempt
+                if attempt < self.retries:
+                    time.sleep(delay)
+            else:
+                raise last_error
+        except BaseException:
+            self.breaker.record_failure()
+            with self._lock:
+                self.failed += 1
+            raise
+
+        self.breaker.record_success()
+        with self._lock:
+            self.sent += 1
+        try:
+            body = response.json()
+        except ValueError:
+            body = {'error': response.text}
+        if response.status_code != 200:
+            raise UploadError(body.get('error', f"Server returned {response.status_code}"))
+        return body
+
+    def submit(self, data, filename='image.jpg', content_type='image/jpeg'):
+        """post_image() on the client's own pool; returns a Future."""
+        return self._executor.submit(self.post_image, data, filename, content_type)
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        self.session.close()
+
+    def stats(self):
+        with self._lock:
+            return {'sent': self.sent, 'failed': self.failed, 'retried': self.retried,
+                    'rejected_by_breaker': self.rejected, 'breaker': self.breaker.state}
@@ -0,0 +1,424 @@
+"""Load test for the classify servers.
+
+Starts each server on a free port with a deterministic Ollama stub (test/ollama_stub.py),
+sends the sample images in app/test/ to /classify at each concurrency level and writes a
+JSON report with throughput, latency percentiles, server memory and per-stage timings.
+Run from the repository root:
+
+    python test/bench_classify.py --targets flask-server fastapi --concurrency 1 4 16 --requests 200
+    python test/bench_classify.py --targets gunicorn-server --serving 1x4 2x2 4x1
+    python test/compare_bench.py test/results/base.json test/results/new.json
+"""
+import argparse
+import glob
+import http.client
+import json
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+from model.batching import percentile
+from ollama_stub import start_stub
+
+FLASK = [sys.executable, '-m', 'flask', '--app', '{app}', 'run', '--no-reload', '--no-debugger', '--port', '{port}']
+# How to start each server and where it takes uploads
+TARGETS = {
+    'flask-server': {'cmd': FLASK, 'app': 'app/server/app.py', 'path': '/classify', 'field': 'image'},
+    'flask-webapp': {'cmd': FLASK, 'app': 'webapp/server/app.py', 'path': '/classify', 'field': 'image'},
+    'flask-root': {'cmd': FLASK, 'app': 'app.py', 'path': '/classify', 'field': 'image'},
+    'fastapi': {'cmd': [sys.executable, '-m', 'uvicorn', 'yolov8n_api:app', '--app-dir', 'api',
+                        '--port', '{port}', '--log-level', 'warning'],
+                'path': '/classify/', 'field': 'file'},
+    # Preloaded multi-worker serving (model/serving.py), run once per --serving workers x threads
+    'gunicorn-server': {'cmd': [sys.executable, '-m', 'model.serving', 'server', '--bind', '127.0.0.1:{port}',
+                                '--workers', '{workers}', '--threads', '{threads}'],
+                        'path': '/classify', 'field': 'image'},
+    'gunicorn-api': {'cmd': [sys.executable, '-m', 'model.serving', 'api', '--bind', '127.0.0.1:{port}',
+                             '--workers', '{workers}', '--threads', '{threads}'],
+                     'path': '/classify/', 'field': 'file'},
+}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def process_tree(pid):
+    """pid and all its descendants (the workers of a forking server)."""
+    children = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                parent = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(parent, []).append(int(entry))
+    tree, pending = [], [pid]
+    while pending:
+        current = pending.pop()
+        tree.append(current)
+        pending.extend(children.get(current, []))
+    return tree
+
+
+def _proc_kb(path, key):
+    with open(path) as f:
+        for line in f:
+            if line.startswith(key):
+                return int(line.split()[1])
+    return 0
+
+
+def memory_mb(pid):
+    """(RSS, PSS) in MB summed over a process and its children.
+
+    RSS counts pages shared by forked workers once per worker; PSS splits them between the
+    processes sharing them, so it shows what the workers really cost together.
+    """
+    if not os.path.isdir('/proc'):
+        try:
+            import psutil
+            return psutil.Process(pid).memory_info().rss / (1024 * 1024), None
+        except Exception:
+            return None, None
+    rss = pss = 0
+    for member in process_tree(pid):
+        try:
+            rss += _proc_kb(f'/proc/{member}/status', 'VmRSS:')
+            pss += _proc_kb(f'/proc/{member}/smaps_rollup', 'Pss:')
+        except OSError:
+            continue
+    return rss / 1024, (pss / 1024 if pss else None)
+
+
+class MemorySampler:
+    """Polls a server's memory on a background thread and keeps the peak RSS and PSS."""
+
+    def __init__(self, pid, interval=0.05):
+        self.pid = pid
+        self.interval = interval
+        self.peak = None
+        self.peak_pss = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            rss, pss = memory_mb(self.pid)
+            if rss is not None and (self.peak is None or rss > self.peak):
+                self.peak = rss
+            if pss is not None and (self.peak_pss is None or pss > self.peak_pss):
+                self.peak_pss = pss
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def http_get(url, timeout=5):
+    """(status, body) of a GET, or (None, b'') when the server does not answer."""
+    parts = urlsplit(url)
+    connection = http.client.HTTPConnection(parts.hostname, parts.port, timeout=timeout)
+    try:
+        connection.request('GET', parts.path)
+        response = connection.getresponse()
+        return response.status, response.read()
+    except OSError:
+        return None, b''
+    finally:
+        connection.close()
+
+
+def multipart(field, name, data, boundary='sortyx-bench-boundary'):
+    # Encoded once per image up front, so the client spends no time on it during the run
+    head = (f'--{boundary}\r\nContent-Disposition: form-data; name="{field}"; filename="{name}"\r\n'
+            f'Content-Type: image/jpeg\r\n\r\n').encode()
+    return head + data + f'\r\n--{boundary}--\r\n'.encode(), f'multipart/form-data; boundary={boundary}'
+
+
+def load_images(directory):
+    paths = sorted(p for p in glob.glob(os.path.join(directory, '*'))
+                   if p.lower().endswith(('.jpg', '.jpeg', '.png')))
+    images = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            images.append((os.path.basename(path), f.read()))
+    return images
+
+
+def stage_totals(base_url):
+    """(sum seconds, count) per service/stage from the server's /metrics, or {} without it."""
+    status, body = http_get(base_url + '/metrics')
+    if status != 200:
+        return {}
+    totals = {}
+    for line in body.decode().splitlines():
+        for suffix, index in (('_sum{', 0), ('_count{', 1)):
+            prefix = 'sortyx_stage_seconds' + suffix
+            if line.startswith(prefix):
+                labels, value = line[len(prefix):].rsplit('} ', 1)
+                fields = dict(part.split('=', 1) for part in labels.split(','))
+                key = f"{fields['service'].strip(chr(34))}/{fields['stage'].strip(chr(34))}"
+                totals.setdefault(key, [0.0, 0])[index] = float(value)
+    return totals
+
+
+def stage_means(before, after):
+    # Mean ms per stage over one level, from the difference of two /metrics scrapes
+    means = {}
+    for key, (total, count) in after.items():
+        base_total, base_count = before.get(key, (0.0, 0))
+        if count > base_count:
+            means[key] = round((total - base_total) / (count - base_count) * 1000, 3)
+    return means
+
+
+def raw_body(name, data):
+    return data, 'image/png' if name.lower().endswith('.png') else 'image/jpeg'
+
+
+def stage_share(before, after, part='decode', whole='total'):
+    """Per service, the fraction of classify time spent in one stage over a level."""
+    shares = {}
+    for key, (total, _) in after.items():
+        service, stage = key.split('/', 1)
+        if stage != whole or f'{service}/{part}' not in after:
+            continue
+        whole_time = total - before.get(key, (0.0, 0))[0]
+        part_time = after[f'{service}/{part}'][0] - before.get(f'{service}/{part}', (0.0, 0))[0]
+        if whole_time > 0:
+            shares[service] = round(part_time / whole_time, 3)
+    return shares
+
+
+def run_level(url, field, images, concurrency, total, timeout, raw=False):
+    """Send total requests with concurrency workers; returns latencies (ms), statuses and wall time."""
+    parts = urlsplit(url)
+    bodies = [raw_body(name, data) if raw else multipart(field, name, data) for name, data in images]
+    local = threading.local()
+    latencies, statuses = [], {}
+    degraded = [0]
+    lock = threading.Lock()
+
+    def send(i):
+        # One keep-alive connection per worker thread
+        connection = getattr(local, 'connection', None)
+        if connection is None:
+            connection = local.connection = http.client.HTTPConnection(parts.hostname, parts.port, timeout=timeout)
+        body, content_type = bodies[i % len(bodies)]
+        start = time.perf_counter()
+        try:
+            connection.request('POST', parts.path, body, {'Content-Type': content_type})
+            response = connection.getresponse()
+            # Answered without the LLM because its pool was saturated or past the deadline
+            is_degraded = b'"degraded"' in response.read()
+            status = response.status
+        except (OSError, http.client.HTTPException) as e:
+            status, is_degraded = type(e).__name__, False
+            connection.close()
+            local.connection = None
+        elapsed = (time.perf_counter() - start) * 1000
+        with lock:
+            latencies.append(elapsed)
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+            degraded[0] += is_degraded
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(send, range(total)))
+    return latencies, statuses, time.perf_counter() - start, degraded[0]
+
+
+def summarize(latencies, statuses, wall, degraded=0):
+    ok = statuses.get('200', 0)
+    return {
+        'requests': len(latencies),
+        'ok': ok,
+        'degraded': degraded,
+        'statuses': dict(sorted(statuses.items())),
+        'duration_s': round(wall, 3),
+        'throughput_rps': round(len(latencies) / wall, 2) if wall > 0 else 0.0,
+        'latency_ms': {
+            'mean': round(sum(latencies) / len(latencies), 2) if latencies else 0.0,
+            'p50': round(percentile(latencies, 50), 2),
+            'p95': round(percentile(latencies, 95), 2),
+            'p99': round(percentile(latencies, 99), 2),
+            'max': round(max(latencies, default=0.0), 2),
+        },
+    }
+
+
+def wait_ready(base_url, process, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f'server exited with code {process.returncode}')
+        if http_get(base_url + '/health/ready', timeout=2)[0] == 200:
+            return
+        time.sleep(0.5)
+    raise RuntimeError(f'{base_url} not ready after {timeout}s')
+
+
+def bench_target(name, spec, args, images, env, log_dir, workers=1, threads=1):
+    port = free_port()
+    base_url = f'http://127.0.0.1:{port}'
+    cmd = [part.format(port=port, app=spec.get('app', ''), workers=workers, threads=threads) for part in spec['cmd']]
+    log_path = os.path.join(log_dir, f'{name}.log')
+    print(f'[{name}] starting: {" ".join(cmd)} (log: {log_path})')
+    with open(log_path, 'w') as log:
+        process = subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+    try:
+        started = time.perf_counter()
+        wait_ready(base_url, process, args.startup_timeout)
+        idle_rss, idle_pss = memory_mb(process.pid)
+        result = {'startup_s': round(time.perf_counter() - started, 2),
+                  'idle_rss_mb': round(idle_rss, 1) if idle_rss is not None else None,
+                  'idle_pss_mb': round(idle_pss, 1) if idle_pss is not None else None, 'levels': {}}
+        url = base_url + spec['path']
+        # One pass over the images first: loads lazily built state and fills the instruction cache
+        run_level(url, spec['field'], images, 1, args.warmup if args.warmup is not None else len(images),
+                  args.timeout, args.raw)
+        for concurrency in args.concurrency:
+            before = stage_totals(base_url)
+            with MemorySampler(process.pid) as memory:
+                latencies, statuses, wall, degraded = run_level(url, spec['field'], images, concurrency, args.requests,
+                                                                args.timeout, args.raw)
+            level = summarize(latencies, statuses, wall, degraded)
+            level['peak_rss_mb'] = round(memory.peak, 1) if memory.peak is not None else None
+            level['peak_pss_mb'] = round(memory.peak_pss, 1) if memory.peak_pss is not None else None
+            after = stage_totals(base_url)
+            level['stages_ms'] = stage_means(before, after)
+            level['decode_share'] = stage_share(before, after)
+            result['levels'][f'c{concurrency}'] = level
+            print(f"[{name}] c={concurrency:<3} {level['throughput_rps']:>8.1f} req/s  "
+                  f"p50 {level['latency_ms']['p50']:>8.1f}  p95 {level['latency_ms']['p95']:>8.1f}  "
+                  f"p99 {level['latency_ms']['p99']:>8.1f} ms  peak rss {level['peak_rss_mb']} MB  "
+                  f"decode share {level['decode_share']}  statuses {level['statuses']}")
+        return result
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def git_revision():
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=ROOT, text=True).strip()
+        dirty = bool(subprocess.check_output(['git', 'status', '--porcelain', '--untracked-files=no'],
+                                             cwd=ROOT, text=True).strip())
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark /classify on the Flask and FastAPI servers.')
+    parser.add_argument('--targets', nargs='+', default=['flask-server', 'fastapi'], choices=sorted(TARGETS))
+    parser.add_argument('--images', default=os.path.join(ROOT, 'app', 'test'))
+    parser.add_argument('--concurrency', nargs='+', type=int, default=[1, 4, 16])
+    parser.add_argument('--requests', type=int, default=200, help='requests per concurrency level')
+    parser.add_argument('--warmup', type=int, help='warm-up requests per server (default: one per image)')
+    parser.add_argument('--timeout', type=float, default=60.0, help='per-request timeout in seconds')
+    parser.add_argument('--startup-timeout', type=float, default=180.0)
+    parser.add_argument('--llm-latency-ms', type=float, default=0.0, help='delay the Ollama stub adds to every answer')
+    parser.add_argument('--llm-backend', choices=['http', 'stub'], default='http',
+                        help='http: the Ollama stub server through the real client; stub: the in-process stub backend')
+    parser.add_argument('--ollama-host', help='use this Ollama instead of the local stub (results are not repeatable)')
+    parser.add_argument('--result-cache', action='store_true',
+                        help='keep the servers\' result cache on (off by default so every request runs YOLO)')
+    parser.add_argument('--event-store', action='store_true',
+                        help='log every classification to a temporary event store (off by default, as on the servers)')
+    parser.add_argument('--raw', action='store_true', help='send each image as the request body instead of multipart')
+    parser.add_argument('--serving', nargs='+', default=['2x2'],
+                        help='workers x inference threads to run the gunicorn-* targets with, e.g. 1x4 2x2 4x1')
+    parser.add_argument('-o', '--output', help='report path (default test/results/bench-<commit>.json)')
+    args = parser.parse_args()
+
+    images = load_images(args.images)
+    if not images:
+        parser.error(f'No images in {args.images}')
+    commit, dirty = git_revision()
+    output = args.output or os.path.join(ROOT, 'test', 'results', f"bench-{(commit or 'unknown')[:10]}.json")
+    log_dir = os.path.dirname(os.path.abspath(output))
+    os.makedirs(log_dir, exist_ok=True)
+
+    stub = None
+    env = dict(os.environ)
+    env.pop('SORTYX_LLM_BACKEND', None)
+    if args.ollama_host:
+        env['OLLAMA_HOST'] = args.ollama_host
+    elif args.llm_backend == 'stub':
+        env['SORTYX_LLM_BACKEND'] = 'stub'
+        env['SORTYX_LLM_STUB_LATENCY_MS'] = str(args.llm_latency_ms)
+    else:
+        stub = start_stub(latency_ms=args.llm_latency_ms)
+        env['OLLAMA_HOST'] = f'http://127.0.0.1:{stub.server_address[1]}'
+    if not args.result_cache:
+        env['SORTYX_RESULT_CACHE_MAX_BYTES'] = '0'
+        env.pop('SORTYX_RESULT_CACHE_URL', None)
+    env.pop('SORTYX_INSTRUCTION_CACHE', None)
+    # Never append benchmark traffic to the operator's event log
+    event_dir = tempfile.mkdtemp(prefix='sortyx-bench-') if args.event_store else None
+    env['SORTYX_EVENT_STORE'] = os.path.join(event_dir, 'events.db') if event_dir else ''
+
+    report = {
+        'meta': {
+            'commit': commit, 'dirty': dirty,
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count(),
+            'images': [name for name, _ in images], 'requests_per_level': args.requests,
+            'concurrency': args.concurrency, 'llm': args.ollama_host or f'stub ({args.llm_latency_ms:.0f}ms)',
+            'result_cache': args.result_cache, 'event_store': args.event_store,
+            'env': {k: v for k, v in sorted(env.items()) if k.startswith('SORTYX_')},
+        },
+        'results': {},
+    }
+    try:
+        for target in args.targets:
+            configs = args.serving if target.startswith('gunicorn-') else [None]
+            for config in configs:
+                name, workers, threads = target, 1, 1
+                if config:
+                    workers, threads = (int(part) for part in config.lower().split('x'))
+                    name = f'{target}[{workers}x{threads}]'
+                try:
+                    report['results'][name] = bench_target(name, TARGETS[target], args, images, env, log_dir,
+                                                           workers, threads)
+                except Exception as e:
+                    print(f'[{name}] failed: {e}')
+                    report['results'][name] = {'error': str(e)}
+    finally:
+        if stub is not None:
+            stub.shutdown()
+        if event_dir:
+            shutil.rmtree(event_dir, ignore_errors=True)
+
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    print(f'Report written to {output}')
+    return 1 if any('error' in result for result in report['results'].values()) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,78 @@
+"""Compare two bench_classify.py reports and flag performance regressions.
+
+    python test/compare_bench.py test/results/base.json test/results/new.json --threshold 10
+
+Exits with 1 when throughput drops or p95/p99 latency or peak memory grows by more than
+the threshold (percent) for any server and concurrency level present in both reports.
+"""
+import argparse
+import json
+import sys
+
+# (name, path into a level, whether higher is better)
+METRICS = [
+    ('throughput_rps', ('throughput_rps',), True),
+    ('p50_ms', ('latency_ms', 'p50'), False),
+    ('p95_ms', ('latency_ms', 'p95'), False),
+    ('p99_ms', ('latency_ms', 'p99'), False),
+    ('peak_rss_mb', ('peak_rss_mb',), False),
+    ('peak_pss_mb', ('peak_pss_mb',), False),
+]
+# Checked against the threshold; p50 is shown for context only
+GATED = {'throughput_rps', 'p95_ms', 'p99_ms', 'peak_rss_mb', 'peak_pss_mb'}
+
+
+def lookup(level, path):
+    for key in path:
+        if not isinstance(level, dict) or level.get(key) is None:
+            return None
+        level = level[key]
+    return level
+
+
+def compare(base, new, threshold):
+    """Rows of (target, level, metric, base, new, change %, regressed)."""
+    rows = []
+    for target, new_result in sorted(new['results'].items()):
+        base_result = base['results'].get(target, {})
+        for level_name, new_level in sorted(new_result.get('levels', {}).items(), key=lambda kv: int(kv[0][1:])):
+            base_level = base_result.get('levels', {}).get(level_name)
+            if base_level is None:
+                continue
+            for name, path, higher_is_better in METRICS:
+                old, value = lookup(base_level, path), lookup(new_level, path)
+                if old is None or value is None or old == 0:
+                    continue
+                change = (value - old) / old * 100
+                worse = -change if higher_is_better else change
+                rows.append((target, level_name, name, old, value, change, name in GATED and worse > threshold))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Diff two benchmark reports.')
+    parser.add_argument('base')
+    parser.add_argument('new')
+    parser.add_argument('--threshold', type=float, default=10.0, help='allowed regression in percent')
+    args = parser.parse_args()
+
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+    print(f"base {base['meta'].get('commit')} vs new {new['meta'].get('commit')}")
+    if base['meta'].get('cpus') != new['meta'].get('cpus') or base['meta'].get('llm') != new['meta'].get('llm'):
+        print('warning: reports come from different machines or LLM settings')
+
+    rows = compare(base, new, args.threshold)
+    print(f"{'target':<24}{'level':<7}{'metric':<16}{'base':>10}{'new':>10}{'change':>9}")
+    for target, level, name, old, value, change, regressed in rows:
+        print(f"{target:<24}{level:<7}{name:<16}{old:>10.1f}{value:>10.1f}{change:>+8.1f}%"
+              + ('  REGRESSION' if regressed else ''))
+    regressions = sum(row[-1] for row in rows)
+    print(f'{regressions} regression(s) above {args.threshold:.0f}%')
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
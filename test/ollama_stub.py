@@ -0,0 +1,118 @@
+"""Deterministic stand-in for the Ollama HTTP API, so benchmarks run offline and repeatably.
+
+Answers POST /api/chat (streaming and not) and POST /api/generate with text derived only
+from the prompt, after a fixed delay, so the real Ollama client and the LLM pool are
+exercised end to end. Point the servers at it with OLLAMA_HOST:
+
+    python test/ollama_stub.py --port 11435 --latency-ms 200
+    OLLAMA_HOST=http://127.0.0.1:11435 python app/server/app.py
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+# The same answers as the in-process stub backend (SORTYX_LLM_BACKEND=stub)
+from model.llm import stub_answer
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    latency = 0.0
+    chunks = 8
+    calls = 0
+    _lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length', 0))
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def _send_json(self, body, status=200):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        # The client checks these on some versions; an empty model list is enough
+        if self.path.startswith('/api/tags'):
+            self._send_json({'models': []})
+        elif self.path.startswith('/api/version'):
+            self._send_json({'version': '0.0.0-stub'})
+        else:
+            self._send_json({'error': 'not found'}, 404)
+
+    def do_POST(self):
+        if self.path not in ('/api/chat', '/api/generate'):
+            self._send_json({'error': 'not found'}, 404)
+            return
+        request = self._read_json()
+        chat = self.path == '/api/chat'
+        prompt = request['messages'][-1]['content'] if chat else request.get('prompt', '')
+        answer = stub_answer(prompt)
+        with StubHandler._lock:
+            StubHandler.calls += 1
+        time.sleep(self.latency)
+
+        def message(text, done):
+            body = {'model': request.get('model', 'stub'),
+                    'created_at': datetime.now(timezone.utc).isoformat(), 'done': done}
+            if chat:
+                body['message'] = {'role': 'assistant', 'content': text}
+            else:
+                body['response'] = text
+            if done:
+                body['done_reason'] = 'stop'
+            return body
+
+        if not request.get('stream', True):
+            self._send_json(message(answer, True))
+            return
+
+        # Streamed as NDJSON in a fixed number of pieces, like tokens arriving from the model
+        size = max(1, len(answer) // self.chunks + 1)
+        pieces = [answer[i:i + size] for i in range(0, len(answer), size)]
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        for piece in pieces + ['']:
+            line = (json.dumps(message(piece, piece == '')) + '\n').encode()
+            self.wfile.write(f'{len(line):x}\r\n'.encode() + line + b'\r\n')
+        self.wfile.write(b'0\r\n\r\n')
+
+
+def start_stub(port=0, latency_ms=0.0, host='127.0.0.1'):
+    """Run the stub on a daemon thread; returns the server (server.server_address has the port)."""
+    handler = type('Handler', (StubHandler,), {'latency': latency_ms / 1000})
+    server = ThreadingHTTPServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, name='ollama-stub', daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Deterministic local Ollama stub.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=11435)
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='delay before every answer')
+    args = parser.parse_args()
+    server = start_stub(args.port, args.latency_ms, args.host)
+    print(f"Ollama stub on http://{args.host}:{server.server_address[1]} (latency {args.latency_ms:.0f}ms)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""Smoke test of the FastAPI /classify/bulk route, without model weights.
+
+    python -m pytest test/test_api_bulk.py
+"""
+import io
+import json
+import os
+import sys
+import zipfile
+from concurrent.futures import Future
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip('fastapi')
+pytest.importorskip('httpx')  # TestClient
+Image = pytest.importorskip('PIL.Image')
+
+# No weights are loaded and nothing goes to the operator's event log
+os.environ['SORTYX_BACKGROUND_LOAD'] = '0'
+os.environ['SORTYX_EVENT_STORE'] = ''
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+
+def png(color):
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 48), color).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def client(monkeypatch):
+    from fastapi.testclient import TestClient
+    from api import yolov8n_api as api
+
+    def submit(image):
+        # A detector result with nothing found, as summarize_detections reads it
+        future = Future()
+        future.set_result(SimpleNamespace(names={}, boxes=None))
+        return future
+
+    monkeypatch.setattr(api.engine.scheduler, 'submit', submit)
+    return TestClient(api.app)
+
+
+def test_bulk_streams_one_line_per_image(client):
+    files = [('images', ('a.png', png('red'), 'image/png')), ('images', ('b.png', png('blue'), 'image/png'))]
+    response = client.post('/classify/bulk', files=files)
+    assert response.status_code == 200
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line['id'] for line in lines[:2]] == ['a.png', 'b.png']
+    assert all(line['success'] for line in lines[:2])
+    assert lines[2]['summary']['succeeded'] == 2
+    from api import yolov8n_api as api
+    assert api.admission.stats()['inflight'] == 0
+
+
+def test_bulk_zip_member_over_the_upload_limit_fails_alone(client, monkeypatch):
+    from model import bulk
+    small = png('red')
+    monkeypatch.setattr(bulk, 'MAX_UPLOAD_BYTES', len(small))
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, 'w', zipfile.ZIP_DEFLATED) as z:
+        z.writestr('a.png', small)
+        z.writestr('big.png', small + b'\0' * 4096)
+    response = client.post('/classify/bulk', content=archive.getvalue(), headers={'Content-Type': 'application/zip'})
+    assert response.status_code == 200
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [(line['id'], line['success']) for line in lines[:2]] == [('a.png', True), ('big.png', False)]
+    assert 'too large' in lines[1]['error']
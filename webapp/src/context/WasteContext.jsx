@@ -3,6 +3,8 @@ import { usePoints } from './PointsContext'
 
 const WasteContext = createContext()
 
+const LOCAL_BACKEND_URL = 'http://localhost:5001'
+
 export const useWaste = () => useContext(WasteContext)
 
 export const WasteProvider = ({ children }) => {
@@ -79,6 +81,19 @@ export const WasteProvider = ({ children }) => {
   ]
   
   // Remove the uploadToCloudinary function entirely
+
+  const streamInstruction = (streamUrl) => {
+    const source = new EventSource(`${LOCAL_BACKEND_URL}${streamUrl}`);
+    const appendReason = (chunk) => {
+      setDetectedObject(prev => prev && { ...prev, reason: (prev.reason || '') + chunk });
+      setComponents(prev => prev.map((comp, index) =>
+        index === 0 ? { ...comp, reason: (comp.reason || '') + chunk } : comp
+      ));
+    };
+    source.onmessage = (event) => appendReason(JSON.parse(event.data).chunk);
+    source.addEventListener('done', () => source.close());
+    source.addEventListener('error', () => source.close());
+  };
   
   const classifyObject = async (imageData) => {
     try {
@@ -118,8 +133,8 @@ export const WasteProvider = ({ children }) => {
         // Append the image to FormData
         formData.append('image', blob, 'image.jpg');
         
-        // Send to Python backend
-        response = await fetch('http://localhost:5001/classify', {
+        // Send to Python backend in split mode so the label comes back before the LLM text
+        response = await fetch(`${LOCAL_BACKEND_URL}/classify?mode=split`, {
           method: 'POST',
           body: formData,
         });
@@ -156,6 +171,11 @@ export const WasteProvider = ({ children }) => {
       } else {
         setComponents([]);
       }
+
+      // Stream the disposal instruction in as the local LLM generates it
+      if (data.instructionStreamUrl) {
+        streamInstruction(data.instructionStreamUrl);
+      }
       
       return data.classification;
     } catch (error) {